@@ -1,28 +1,44 @@
 # -*- coding: utf-8 -*-
 
-import gamera.core as gc
-gc.init_gamera()
-from gamera.plugins.image_utilities import union_images
+# gamera is only used (see preprocCache) when pages are preprocessed with it or OCRed with
+# ocropus-rpred, so that pages can otherwise be processed without it
 import matplotlib.pyplot as plt
-import textAlignPreprocessing as preproc
 import pickle
 import os
 import shutil
 import numpy as np
 import textSeqCompare as tsc
+import alignmentCache as acache
+import lineRecognizer as lrec
+import ocrCache as ocache
+import preprocCache as pcache
+import pageStore as pstore
 import latinSyllabification as latsyl
 import subprocess
 import json
-import re
 import io
 import tempfile
 
-reload(preproc)
+# the tests also import this module under python 3, where these are not builtins
+try:
+    reload
+except NameError:
+    from importlib import reload
+    unicode = str
+
 reload(tsc)
+reload(acache)
+reload(lrec)
+reload(ocache)
+reload(pcache)
+reload(pstore)
 reload(latsyl)
 
 parallel = 2
-median_line_mult = 2
+
+# options ocropus-rpred is run with; with line_pad in lineRecognizer, they also tell cached lines
+# recognized by one engine from those recognized by the other (see ocr_engine)
+ocropus_options = '--nocheck --llocs'
 
 # there are some hacks to make this work on windows (locally, not as a rodan job!).
 # no guarantees, and OCRopus will throw out a lot of warning messages, but it works for local dev.
@@ -88,7 +104,8 @@ def read_file(fname):
 
 
 def rotate_bbox(cbox, angle, orig_dim, target_dim, radians=False):
-    pivot = gc.Point(orig_dim.ncols / 2, orig_dim.nrows / 2)
+    pivot_x = orig_dim.ncols / 2
+    pivot_y = orig_dim.nrows / 2
 
     # amount to translate to compensate for padding added by gamera's rotation in preprocessing.
     # i am pretty sure this is the most "correct" amount. my math might be off.
@@ -102,10 +119,10 @@ def rotate_bbox(cbox, angle, orig_dim, target_dim, radians=False):
     c = np.cos(angle)
 
     # move to origin
-    old_ulx = cbox.ulx - pivot.x
-    old_uly = cbox.uly - pivot.y
-    old_lrx = cbox.lrx - pivot.x
-    old_lry = cbox.lry - pivot.y
+    old_ulx = cbox.ulx - pivot_x
+    old_uly = cbox.uly - pivot_y
+    old_lrx = cbox.lrx - pivot_x
+    old_lry = cbox.lry - pivot_y
 
     # rotate using a 2d rotation matrix
     new_ulx = (old_ulx * c) - (old_uly * s)
@@ -114,10 +131,10 @@ def rotate_bbox(cbox, angle, orig_dim, target_dim, radians=False):
     new_lry = (old_lrx * s) + (old_lry * c)
 
     # move back to original position adjusted for padding
-    new_ulx += (pivot.x - dx)
-    new_uly += (pivot.y - dy)
-    new_lrx += (pivot.x - dx)
-    new_lry += (pivot.y - dy)
+    new_ulx += (pivot_x - dx)
+    new_uly += (pivot_y - dy)
+    new_lrx += (pivot_x - dx)
+    new_lry += (pivot_y - dy)
 
     new_ul = np.round([new_ulx, new_uly]).astype('int16')
     new_lr = np.round([new_lrx, new_lry]).astype('int16')
@@ -126,6 +143,10 @@ def rotate_bbox(cbox, angle, orig_dim, target_dim, radians=False):
 
 
 def perform_ocr_with_ocropus(cc_strips, ocropus_model, wkdir_name, parallel=parallel):
+    '''
+    saves each of the line strips @cc_strips to @wkdir_name and runs ocropus-rpred on them. returns
+    the list of (char, x_position) pairs read from the .llocs file of each strip.
+    '''
 
     # save strips to directory
     for i, strip in enumerate(cc_strips):
@@ -135,12 +156,12 @@ def perform_ocr_with_ocropus(cc_strips, ocropus_model, wkdir_name, parallel=para
     if on_windows:
         cwd = os.getcwd()
         ocropus_command = 'python ./ocropy-master/ocropus-rpred ' \
-            '--nocheck --llocs -m {} {}/{}/*'.format(ocropus_model, cwd, wkdir_name)
+            '{} -m {} {}/{}/*'.format(ocropus_options, ocropus_model, cwd, wkdir_name)
     else:
         # the presence of extra quotes \' around the path to be globbed makes a difference.
         # sometimes. it's unclear.
         ocropus_command = 'ocropus-rpred -Q {} ' \
-            '--nocheck --llocs -m {} \'{}/*.png\''.format(parallel, ocropus_model, wkdir_name)
+            '{} -m {} \'{}/*.png\''.format(parallel, ocropus_options, ocropus_model, wkdir_name)
 
     print('running ocropus with: {}'.format(ocropus_command))
     # try:
@@ -150,53 +171,87 @@ def perform_ocr_with_ocropus(cc_strips, ocropus_model, wkdir_name, parallel=para
     #     return None
 
     # read character position results from llocs file
-    all_chars = []
-    other_chars = []
+    lines_locs = []
     for i in range(len(cc_strips)):
         locs_file = './{}/_{}.llocs'.format(wkdir_name, i)
         with io.open(locs_file, encoding='utf-8') as f:
-            locs = [line.rstrip('\n') for line in f]
+            locs = [line.rstrip('\n').split('\t') for line in f]
+        lines_locs.append([(char, float(xpos)) for char, xpos in locs])
 
-        x_min = cc_strips[i].offset_x
-        y_min = cc_strips[i].offset_y
-        y_max = cc_strips[i].offset_y + cc_strips[i].height
+    return lines_locs
 
-        # note: ocropus seems to associate every character with its RIGHTMOST edge. we want the
-        # left-most edge, so we associate each character with the previous char's right edge
-        text_line = []
-        prev_xpos = x_min
-        for l in locs:
-            lsp = l.split('\t')
-            cur_xpos = int(np.round(float(lsp[1]) + x_min))
 
-            ul = (prev_xpos, y_min)
-            lr = (cur_xpos, y_max)
+def ocr_engine(in_process_ocr=True):
+    '''
+    returns a string naming the recognizer ocr_page uses (the in-process lineRecognizer if
+    @in_process_ocr is set, else ocropus-rpred) and the options it is run with, so that lines
+    cached by one are not taken for lines recognized by the other (see ocrCache.line_key).
+    '''
+    if in_process_ocr:
+        return 'lineRecognizer pad={}'.format(lrec.line_pad)
+    return 'ocropus-rpred {}'.format(ocropus_options)
 
-            if lsp[0] == '~' or lsp[0] == '':
-                new_box = CharBox(unicode(lsp[0]), ul, lr)
-                other_chars.append(new_box)
-            else:
-                new_box = CharBox(clean_special_chars(lsp[0]), ul, lr)
-                all_chars.append(new_box)
 
-            prev_xpos = cur_xpos
+def perform_ocr_in_process(lines, ocropus_model):
+    '''
+    same as perform_ocr_with_ocropus, but recognizes the boolean ink arrays @lines (see
+    lineRecognizer.ink_mask) with an ocrolib model held in this process instead of saving them for
+    ocropus-rpred, so that the model is loaded once rather than once per page. @lines may be any
+    iterable, and each line is only made greyscale when it is recognized, so the page is never
+    copied as a whole.
+    '''
+    recognizer = lrec.get_recognizer(ocropus_model)
+    return [recognizer.recognize(1.0 - line) for line in lines]
 
-    return all_chars
 
+def line_char_boxes(locs, rect):
+    '''
+    turns the (char, x_position) pairs @locs recognized on the line at @rect (see
+    lineRecognizer.strip_rect), as read from an .llocs file, into CharBoxes on the page.
+    characters ocropus could not recognize are dropped.
+    '''
+    x_min, y_min, _, height = rect
+    y_max = y_min + height
 
-def process(raw_image,
-    transcript,
+    # note: ocropus seems to associate every character with its RIGHTMOST edge. we want the
+    # left-most edge, so we associate each character with the previous char's right edge
+    line_chars = []
+    prev_xpos = x_min
+    for char, xpos in locs:
+        cur_xpos = int(np.round(xpos + x_min))
+
+        ul = (prev_xpos, y_min)
+        lr = (cur_xpos, y_max)
+
+        if not (char == '~' or char == ''):
+            line_chars.append(CharBox(clean_special_chars(char), ul, lr))
+
+        prev_xpos = cur_xpos
+
+    return line_chars
+
+
+def ocr_page(raw_image,
     ocropus_model,
-    seq_align_params=None,
     wkdir_name='wkdir_ocropy',
     parallel=parallel,
-    median_line_mult=median_line_mult,
-    existing_ocr_pickle=None,
-    existing_preproc_images=None,
-    verbose=True):
+    in_process_ocr=True,
+    ocr_cache=ocache.default_cache_path,
+    preproc_cache=pcache.default_cache_dir,
+    preproc_backend=pcache.default_backend):
     '''
-    given a text layer image @raw_image and a string transcript @transcript, performs preprocessing
-    and OCR on the text layer and then aligns the results to the transcript text.
+    performs preprocessing and OCR on the text layer image @raw_image and expands abbreviations in
+    the OCR output. returns (all_chars, ink, lines_peak_locs, angle), where @ink is the
+    preprocessed (rotated) text layer as preprocCache.preprocess_page returns it and @angle the
+    rotation applied to it, or None if OCR fails.
+
+    if @in_process_ocr is set, the OCR model is loaded into this process (once, and kept for later
+    pages) instead of running ocropus-rpred on the page; @wkdir_name and @parallel are then unused.
+
+    recognized lines are looked up in and saved to the cache at @ocr_cache (see ocrCache), unless
+    it is None, so that only lines whose pixels have changed since the last run are OCRed again.
+    likewise, preprocessing results are cached in @preproc_cache (see preprocCache), and
+    @preproc_backend chooses whether preprocessing is done with gamera or numpy.
     '''
 
     #######################
@@ -204,130 +259,331 @@ def process(raw_image,
     #######################
 
     # get raw image of text layer and preform preprocessing to find text lines
-    # image = None
-    # if existing_preproc_images:
-    #     try:
-    #         with open(existing_ocr_pickle) as f:
-    #             image, eroded, angle = pickle.load(f)
-    #         print('using pickled preproc results in {}...'.format(existing_ocr_pickle))
-    #     except IOError:
-    #         print('Pickle file {} not found - performing ocr instead'.format(existing_ocr_pickle))
-    # if not image:
-    image, eroded, angle = preproc.preprocess_images(raw_image)
-
-    cc_strips, lines_peak_locs, _ = preproc.identify_text_lines(image, eroded)
+    ink, angle, lines_peak_locs, rects = pcache.preprocess_page(raw_image, preproc_cache,
+        backend=preproc_backend)
 
     #################################
     # -- PERFORM OCR WITH OCROPUS --
     #################################
 
-    all_chars = []
-    if existing_ocr_pickle:
-        try:
-            with open(existing_ocr_pickle) as f:
-                all_chars = pickle.load(f)
-            print('using pickled ocr results in {}...'.format(existing_ocr_pickle))
-        except IOError:
-            print('Pickle file {} not found - performing ocr instead'.format(existing_ocr_pickle))
-        except AttributeError:
-            print('Pickle error: re-performing ocr')
-
-    if not all_chars:
+    # each strip is only taken from the page (see lineRecognizer.LineViews) when it is used
+    ink_lines = lrec.line_views(ink, rects)
+
+    lines_locs = [None] * len(rects)
+    if ocr_cache:
+        model_digest = ocache.model_hash(ocropus_model)
+        engine = ocr_engine(in_process_ocr)
+        keys = [ocache.line_key(x, model_digest, engine) for x in ink_lines]
+        with ocache.OCRCache(ocr_cache) as cache:
+            lines_locs = [cache.get(key) for key in keys]
+    missing = [i for i, x in enumerate(lines_locs) if x is None]
+    if len(missing) < len(rects):
+        print('using cached ocr results for {} of {} lines...'.format(
+            len(rects) - len(missing), len(rects)))
+
+    new_locs = []
+    if missing and in_process_ocr:
+        new_locs = perform_ocr_in_process((ink_lines[i] for i in missing), ocropus_model)
+    elif missing:
         # make directory to do stuff in d
         if not os.path.exists(wkdir_name):
             subprocess.check_call("mkdir " + wkdir_name, shell=True)
         try:
-            all_chars = perform_ocr_with_ocropus(cc_strips, ocropus_model, wkdir_name=wkdir_name, parallel=parallel, )
+            cc_strips = pcache.rect_strips(ink, [rects[i] for i in missing])
+            new_locs = perform_ocr_with_ocropus(cc_strips, ocropus_model, wkdir_name=wkdir_name,
+                parallel=parallel)
         except subprocess.CalledProcessError:
             print('OCRopus failed! Skipping current file.')
             return None
         finally:
             subprocess.check_call('rm -r ' + wkdir_name, shell=True)
 
+    for i, locs in zip(missing, new_locs):
+        lines_locs[i] = locs
+    if ocr_cache and missing:
+        with ocache.OCRCache(ocr_cache) as cache:
+            for i in missing:
+                cache.put(keys[i], lines_locs[i])
+
+    all_chars = []
+    for locs, rect in zip(lines_locs, rects):
+        all_chars += line_char_boxes(locs, rect)
+
     #############################
     # -- HANDLE ABBREVIATIONS --
     #############################
 
-    abbreviations = latsyl.abbreviations
-    for abb in abbreviations.keys():
-        while True:
-            ocr_str = ''.join(unicode(x.char) for x in all_chars)
-            idx = ocr_str.find(abb)
+    all_chars = expand_abbreviations(all_chars)
+
+    return all_chars, ink, lines_peak_locs, angle
+
+
+def expand_abbreviations(all_chars):
+    '''
+    replaces every abbreviation (see latinSyllabification.abbreviations) in the OCR characters
+    @all_chars with its expansion, giving each expanded character the box of the character it
+    came from. abbreviations are found in one pass (see latinSyllabification.find_abbreviations),
+    taking the longest where several start at the same character.
+    '''
+    expanded, _ = expand_abbreviations_before(all_chars, len(all_chars))
+    return expanded
+
 
-            if idx == -1:
+def expand_abbreviations_before(all_chars, end):
+    '''
+    same as expand_abbreviations, but only expands the characters of @all_chars up to @end, for
+    pages whose OCR is still being read. abbreviations that start before @end are expanded whole,
+    so returns (expanded, stop), where @stop (at least @end) is the index of the first character of
+    @all_chars that has not been expanded. expanding the rest from there gives the same characters
+    as expanding all of @all_chars at once.
+    '''
+    found = [(idx, abb) for idx, abb in latsyl.find_abbreviations(
+        [unicode(x.char) for x in all_chars]) if idx < end]
+    stop = max([end] + [idx + len(abb) for idx, abb in found])
+
+    expanded = []
+    prev_end = 0
+    for idx, abb in found:
+        expanded += all_chars[prev_end:idx]
+        for i, segment in enumerate(latsyl.abbreviations[abb]):
+            split_box = all_chars[i + idx]
+            expanded += [CharBox(x, split_box.ul, split_box.lr) for x in segment]
+        prev_end = idx + len(abb)
+    expanded += all_chars[prev_end:stop]
+
+    return expanded, stop
+
+
+class LineAligner(object):
+    '''
+    aligns the OCR of a page to @transcript a line at a time, as the lines are recognized in order
+    (see textSeqCompare.IncrementalAligner), so that aligning the lines already read overlaps with
+    the OCR of the lines that follow. @scoring_system and @semiglobal are as in
+    textSeqCompare.alignment_moves. abbreviations are expanded as ocr_page expands them; the last
+    characters read are held back until the next line arrives, since an abbreviation starting
+    among them may go on into it.
+    '''
+
+    def __init__(self, transcript, scoring_system=None, semiglobal=False):
+        self.transcript = transcript
+        self.aligner = tsc.IncrementalAligner(list(transcript), scoring_system, semiglobal)
+        self.held_chars = []
+        self.all_chars = []
+        self.num_lines = 0
+
+    def add_line(self, locs, rect):
+        '''
+        aligns the characters of the next line of the page, recognized as @locs at @rect (see
+        line_char_boxes).
+        '''
+        self.num_lines += 1
+        self.held_chars += line_char_boxes(locs, rect)
+        longest = max(len(x) for x in latsyl.abbreviations)
+        self.expand(max(len(self.held_chars) - longest + 1, 0))
+
+    def add_lines(self, lines_locs, rects):
+        '''
+        aligns the lines of the page in @lines_locs (recognized at @rects) that follow the ones
+        already added, up to the first that has not been recognized yet (None) or failed (an
+        exception).
+        '''
+        while self.num_lines < len(lines_locs):
+            locs = lines_locs[self.num_lines]
+            if locs is None or isinstance(locs, Exception):
                 break
-            ins = []
+            self.add_line(locs, rects[self.num_lines])
 
-            for i, segment in enumerate(abbreviations[abb]):
-                split_box = all_chars[i + idx]
-                ins += [CharBox(x, split_box.ul, split_box.lr) for x in segment]
-            all_chars = all_chars[:idx] + ins + all_chars[idx + len(abb):]
+    def finish(self):
+        '''
+        aligns the characters held back once the last line of the page has been added, and returns
+        (all_chars, moves): the expanded OCR characters of the page, as ocr_page gives them, and
+        the moves of their alignment, as textSeqCompare.alignment_moves gives them.
+        '''
+        self.expand(len(self.held_chars))
+        return self.all_chars, self.aligner.moves()
 
-    # get full ocr transcript
-    ocr = ''.join(x.char for x in all_chars)
-    all_chars_copy = list(all_chars)
+    def expand(self, end):
+        expanded, stop = expand_abbreviations_before(self.held_chars, end)
+        self.held_chars = self.held_chars[stop:]
+        self.all_chars += expanded
+        self.aligner.extend([x.char for x in expanded])
 
-    ###################################
-    # -- PERFORM AND PARSE ALIGNMENT --
-    ###################################
-    tra_align, ocr_align = tsc.perform_alignment(list(transcript), list(ocr),
-        scoring_system=seq_align_params, verbose=False)
-    tra_align = ''.join(tra_align)
-    ocr_align = ''.join(ocr_align)
-    syls = latsyl.syllabify_text(transcript)
-
-    align_transcript_boxes = []
-    current_offset = 0
+
+def syllable_spans(transcript, syls):
+    '''
+    finds where each of the syllables @syls (see latinSyllabification.syllabify_text) lies in
+    @transcript, in one pass: syllables follow one another through each word, and words are
+    separated by spaces. returns the non-empty syllables and arrays of the transcript index each
+    of them starts and ends at.
+    '''
+    spans = []
+    pos = 0
+    for syl in syls:
+        while pos < len(transcript) and transcript[pos] == ' ':
+            pos += 1
+        if syl:
+            spans.append((syl, pos, pos + len(syl)))
+        pos += len(syl)
+
+    if not spans:
+        return [], np.zeros(0, dtype='intp'), np.zeros(0, dtype='intp')
+    syls, starts, ends = zip(*spans)
+    return list(syls), np.array(starts, dtype='intp'), np.array(ends, dtype='intp')
+
+
+def place_syllables(transcript, all_chars, tra_inds, ocr_inds, angle, image_dim, raw_image_dim):
+    '''
+    given the OCR characters @all_chars of a page and the index maps (@tra_inds, @ocr_inds) of the
+    alignment of their characters to @transcript (see textSeqCompare.index_maps), finds a bounding
+    box for each syllable of the transcript. boxes are rotated back by @angle from the preprocessed
+    image (of dimensions @image_dim) onto the original text layer (of dimensions @raw_image_dim);
+    dimensions are anything with nrows and ncols, such as pageStore.page_dim gives for an ink mask.
+    '''
+    tra_inds = np.asarray(tra_inds)
+    ocr_inds = np.asarray(ocr_inds)
+    syls, starts, ends = syllable_spans(transcript, latsyl.syllabify_text(transcript))
+
+    # each syllable is aligned to the columns of the alignment from that of its first character up
+    # to that of its last, and so to the OCR characters in those columns. since syllables only move
+    # forward through the alignment, these are consecutive runs of the OCR characters in alignment
+    # order, which are found by binary search.
+    tra_cols = np.flatnonzero(tra_inds >= 0)
+    box_cols = np.flatnonzero(ocr_inds >= 0)
+    if not len(syls) or not len(box_cols):
+        return []
+    first = np.searchsorted(box_cols, tra_cols[starts])
+    last = np.searchsorted(box_cols, tra_cols[ends - 1] + 1)
+
+    # if a syllable got aligned to nothing in the ocr, ignore it.
+    found = last > first
+    syls = [syl for syl, x in zip(syls, found) if x]
+    counts = (last - first)[found]
+    first = first[found]
+    if not syls:
+        return []
+
+    # the boxes of all syllables, one syllable after another, as (ulx, uly, lrx, lry) rows, and
+    # where each syllable's boxes begin
+    bounds = np.cumsum(counts) - counts
+    aligned = np.arange(counts.sum()) + np.repeat(first - bounds, counts)
+    char_boxes = np.array([(x.ulx, x.uly, x.lrx, x.lry) for x in all_chars], dtype='int64')
+    boxes = char_boxes[ocr_inds[box_cols[aligned]]]
+
+    # if a syllable has boxes that lie on multiple text lines then we're trying to align this
+    # single syllable over multiple lines. leave out all boxes above its lowest line.
+    lower_level = np.maximum.reduceat(boxes[:, 1], bounds)
+    on_lower = (boxes[:, 1] == np.repeat(lower_level, counts))[:, None]
+    extreme = np.iinfo('int64').max
+    syl_ul = np.minimum.reduceat(np.where(on_lower, boxes[:, :2], extreme), bounds)
+    syl_lr = np.maximum.reduceat(np.where(on_lower, boxes[:, 2:], -extreme), bounds)
+
+    # finally, rotate syl_boxes back by the angle that the page was rotated by
     syl_boxes = []
+    for syl, ul, lr in zip(syls, syl_ul.tolist(), syl_lr.tolist()):
+        syl_box = CharBox(syl, ul, lr)
+        syl_boxes.append(rotate_bbox(syl_box, -1 * angle, image_dim, raw_image_dim))
+
+    return syl_boxes
+
+
+def process(raw_image,
+    transcript,
+    ocropus_model,
+    seq_align_params=None,
+    wkdir_name='wkdir_ocropy',
+    parallel=parallel,
+    verbose=False,
+    alignment_cache=acache.default_cache_path,
+    in_process_ocr=True,
+    ocr_cache=ocache.default_cache_path,
+    preproc_cache=pcache.default_cache_dir,
+    preproc_backend=pcache.default_backend):
+    '''
+    given a text layer image @raw_image and a string transcript @transcript, performs preprocessing
+    and OCR on the text layer and then aligns the results to the transcript text. alignments are
+    looked up in and saved to the cache at @alignment_cache, unless it is None. if @verbose is set,
+    the alignment is printed. returns (syl_boxes, ink, lines_peak_locs, all_chars), where @ink is
+    the preprocessed page (see ocr_page), or None if OCR fails.
 
-    # insert gaps into ocr output based on alignment string. this causes all_chars to have gaps at the
-    # same points as the ocr_align string does, and is thus the same length as tra_align.
-    for i, char in enumerate(ocr_align):
-        if char == '_':
-            all_chars.insert(i, CharBox('_'))
+    @wkdir_name, @parallel, @in_process_ocr, @ocr_cache, @preproc_cache and @preproc_backend are
+    passed on to ocr_page.
+    '''
+    result = ocr_page(raw_image, ocropus_model, wkdir_name=wkdir_name, parallel=parallel,
+        in_process_ocr=in_process_ocr, ocr_cache=ocr_cache, preproc_cache=preproc_cache,
+        preproc_backend=preproc_backend)
+    if result is None:
+        return None
+    all_chars, ink, lines_peak_locs, angle = result
 
-    # this could very possibly go wrong (special chars, bug in alignment algorithm, etc) so better
-    # make sure that this condition is holding at this point
-    assert len(all_chars) == len(tra_align), 'all_chars not same length as alignment: ' \
-        '{} vs {}'.format(len(all_chars), len(tra_align))
+    syl_boxes = align_page(transcript, all_chars, angle, pstore.page_dim(ink), raw_image.dim,
+        seq_align_params, alignment_cache, verbose)
 
-    # for each syllable in the transcript, find what characters (or gaps) of the ocr that syllable
-    # is aligned to.
+    return syl_boxes, ink, lines_peak_locs, all_chars
 
-    for syl in syls:
 
-        if len(syl) < 1:
-            continue
-        elif len(syl) == 1:
-            syl_regex = syl
-        else:
-            syl_regex = syl[0] + syl[1:-1].replace('', '_*') + syl[-1]
+def align_page(transcript, all_chars, angle, image_dim, raw_image_dim, seq_align_params=None,
+        alignment_cache=acache.default_cache_path, verbose=False, moves=None):
+    '''
+    aligns the OCR characters @all_chars of a page to @transcript and finds the bounding box of each
+    syllable (see place_syllables). @seq_align_params, @alignment_cache and @verbose are as in
+    process, except that @alignment_cache may also be an open alignmentCache.AlignmentCache. if
+    @moves is given, it is the alignment of the page, already found (e.g. by a LineAligner), which
+    is saved to the cache rather than looked up in it.
+    '''
 
-        syl_match = re.search(syl_regex, tra_align[current_offset:])
-        start = syl_match.start() + current_offset
-        end = syl_match.end() + current_offset
-        current_offset = end
-        align_boxes = [x for x in all_chars[start:end] if x.lr is not None]
+    # get full ocr transcript, one element per OCR character so that the index maps of the
+    # alignment index straight into @all_chars
+    ocr = [x.char for x in all_chars]
 
-        # if align_boxes is empty then this syllable got aligned to nothing in the ocr. ignore it.
-        if not align_boxes:
-            continue
+    ###################################
+    # -- PERFORM AND PARSE ALIGNMENT --
+    ###################################
 
-        # if align_boxes has boxes that lie on multiple text lines then we're trying to align this
-        # single syllable over multiple lines. remove all boxes on the upper line.
-        if len(set([x.uly for x in align_boxes])) > 1:
-            lower_level = max(x.uly for x in align_boxes)
-            align_boxes = [b for b in align_boxes if b.uly == lower_level]
+    # @seq_align_params is either a scoring system or a dict of keyword arguments to
+    # perform_alignment (e.g. {'scoring_system': [...], 'banded': True})
+    align_kwargs = alignment_options(seq_align_params)
+    if moves is not None:
+        if isinstance(alignment_cache, acache.AlignmentCache):
+            alignment_cache.put(acache.alignment_key(list(transcript), ocr, **align_kwargs), moves)
+        elif alignment_cache:
+            with acache.AlignmentCache(alignment_cache) as cache:
+                cache.put(acache.alignment_key(list(transcript), ocr, **align_kwargs), moves)
+    elif isinstance(alignment_cache, acache.AlignmentCache):
+        moves = alignment_cache.alignment_moves(list(transcript), ocr, **align_kwargs)
+    elif alignment_cache:
+        with acache.AlignmentCache(alignment_cache) as cache:
+            moves = cache.alignment_moves(list(transcript), ocr, **align_kwargs)
+    else:
+        moves = tsc.alignment_moves(list(transcript), ocr, **align_kwargs)
+    if verbose:
+        tsc.render_alignment(transcript, ocr, moves, verbose=True)
+    tra_inds, ocr_inds = tsc.index_maps(moves)
 
-        new_ul = (min(x.ulx for x in align_boxes), min(x.uly for x in align_boxes))
-        new_lr = (max(x.lrx for x in align_boxes), max(x.lry for x in align_boxes))
-        syl_boxes.append(CharBox(syl, new_ul, new_lr))
+    return place_syllables(transcript, all_chars, tra_inds, ocr_inds, angle, image_dim,
+        raw_image_dim)
+
+
+def alignment_options(seq_align_params):
+    '''
+    returns @seq_align_params (see align_page) as a dict of keyword arguments to
+    textSeqCompare.alignment_moves.
+    '''
+    if isinstance(seq_align_params, dict):
+        return dict(seq_align_params)
+    return {'scoring_system': seq_align_params}
 
-    # finally, rotate syl_boxes back by the angle that the page was rotated by
-    for i in range(len(syl_boxes)):
-        syl_boxes[i] = rotate_bbox(syl_boxes[i], -1 * angle, image.dim, raw_image.dim)
 
-    return syl_boxes, image, lines_peak_locs, all_chars_copy
+def line_aligner(transcript, seq_align_params=None):
+    '''
+    returns a LineAligner for @transcript under @seq_align_params (see align_page), or None if they
+    ask for an alignment (banded, linear-memory or anchored) that cannot be found a line at a time.
+    '''
+    align_kwargs = alignment_options(seq_align_params)
+    scoring_system = align_kwargs.pop('scoring_system', None)
+    semiglobal = align_kwargs.pop('semiglobal', False)
+    if any(align_kwargs.values()):
+        return None
+    return LineAligner(transcript, scoring_system, semiglobal)
 
 
 def to_JSON_dict(syl_boxes, lines_peak_locs):
@@ -414,7 +670,6 @@ if __name__ == '__main__':
             continue
 
         fname = '{}_{}'.format(manuscript, fname)
-        ocr_pickle = None  # './pik/{}_boxes.pickle'.format(fname)
         text_layer_fname = './png/{}_text.png'.format(fname)
 
         if not os.path.isfile(text_layer_fname):
@@ -422,17 +677,15 @@ if __name__ == '__main__':
             continue
 
         print('processing {}...'.format(fname))
-        raw_image = gc.load_image('./png/' + fname + '_text.png')
+        raw_image = pstore.load_page(text_layer_fname)
 
         id = hex(np.random.randint(2**32))
         result = process(raw_image, transcript, ocropus_model,
-            wkdir_name='ocr_{}'.format(id), existing_ocr_pickle=ocr_pickle)
+            wkdir_name='ocr_{}'.format(id))
         if result is None:
             continue
-        syl_boxes, image, lines_peak_locs, all_chars = result
+        syl_boxes, ink, lines_peak_locs, all_chars = result
         with open('./out_json/{}.json'.format(fname), 'w') as outjson:
             json.dump(to_JSON_dict(syl_boxes, lines_peak_locs), outjson)
-        with open('./pik/{}_boxes.pickle'.format(fname), 'wb') as f:
-            pickle.dump(all_chars, f, -1)
 
-        draw_results_on_page(raw_image, syl_boxes, lines_peak_locs)
+        draw_results_on_page(raw_image.to_image(), syl_boxes, lines_peak_locs)
@@ -0,0 +1,255 @@
+import hashlib
+import sqlite3
+import time
+import numpy as np
+import textSeqCompare as tsc
+
+# where alignments are cached by default, and how large the cache may grow before the least
+# recently used alignments are evicted
+default_cache_path = './alignment_cache.sqlite'
+max_cache_bytes = 2 ** 28
+
+# number of writes and reads a cache holds back before committing them to its database
+cache_commit_every = 64
+
+# once a cache grows past its largest size, the least recently used values are evicted until it is
+# down to this fraction of that size, so that eviction does not run again on every write
+evict_to_fraction = 0.9
+
+
+def encode_moves(moves):
+    '''
+    run-length encodes the traceback @moves of an alignment (see tsc.render_alignment) into a
+    compact byte string: the move (0, 1 or 2) of each run as a uint8, followed by the length of
+    each run as a little-endian uint32.
+    '''
+    moves = np.asarray(moves, dtype='uint8')
+    if not len(moves):
+        return b''
+    starts = np.flatnonzero(np.diff(moves)) + 1
+    lengths = np.diff(np.concatenate([[0], starts, [len(moves)]]))
+    ops = moves[np.concatenate([[0], starts])]
+    return ops.tobytes() + lengths.astype('<u4').tobytes()
+
+
+def decode_moves(data):
+    '''
+    inverse of encode_moves.
+    '''
+    num_runs = len(data) // 5
+    ops = np.frombuffer(data[:num_runs], dtype='uint8')
+    lengths = np.frombuffer(data[num_runs:], dtype='<u4')
+    return np.repeat(ops, lengths).tolist()
+
+
+def alignment_key(transcript, ocr, scoring_system=None, linear_memory=False, banded=False,
+        semiglobal=False, anchored=False):
+    '''
+    returns a hash identifying the alignment of @transcript to @ocr under @scoring_system. the
+    scoring system is normalized by compiling it over the symbols of the two sequences, so that
+    different ways of writing the same scores (a callable or a match / mismatch pair, four or six
+    values) share their cached alignments. @linear_memory does not change the result, so it is
+    not part of the key.
+    '''
+    scoring_method, gaps = tsc.parse_scoring_system(scoring_system)
+    _, sub_matrix, _, _ = tsc.compile_scoring_system(transcript, ocr, scoring_method)
+
+    h = hashlib.sha1()
+    for seq in (transcript, ocr):
+        for x in seq:
+            h.update(x if isinstance(x, bytes) else x.encode('utf-8'))
+            h.update(b'\x00')
+        h.update(b'\x01')
+    h.update(sub_matrix.tobytes())
+    h.update(np.array(gaps, dtype='float64').tobytes())
+    h.update('semiglobal={} banded={}'.format(bool(semiglobal),
+        tsc.band_margin if banded else None).encode('utf-8'))
+    if anchored:
+        h.update('anchored={}'.format(tsc.anchor_kmer).encode('utf-8'))
+    return h.hexdigest()
+
+
+class BlobCache(object):
+    '''
+    persistent cache of byte strings in the table @table of an sqlite database at @path, keyed by
+    strings. once the stored values grow past @max_bytes, the least recently used ones are evicted
+    (see evict).
+
+    writes, and the last-used times of values read, are committed together once @commit_every of
+    them are waiting, and when the cache is closed; it can be used as a context manager to close it.
+    '''
+
+    def __init__(self, path, max_bytes, table, commit_every=cache_commit_every):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.table = table
+        self.commit_every = commit_every
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS {} '
+            '(key TEXT PRIMARY KEY, data BLOB, size INTEGER, last_used REAL)'.format(table))
+        self.db.commit()
+
+        # running total of the sizes of the stored values, and the keys read since the last commit
+        # along with when they were read
+        self.total = self.stored_bytes()
+        self.touched = {}
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stored_bytes(self):
+        '''
+        returns the total size of the values stored in the database.
+        '''
+        return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM {}'.format(
+            self.table)).fetchone()[0]
+
+    def get_blob(self, key):
+        '''
+        returns the bytes cached under @key, or None if there are none.
+        '''
+        row = self.db.execute('SELECT data FROM {} WHERE key = ?'.format(self.table),
+            (key,)).fetchone()
+        if row is None:
+            return None
+        self.touched[key] = time.time()
+        self.changed()
+        return bytes(row[0])
+
+    def put_blob(self, key, data):
+        '''
+        stores the bytes @data under @key, evicting the least recently used values if the cache has
+        grown too large.
+        '''
+        old = self.db.execute('SELECT size FROM {} WHERE key = ?'.format(self.table),
+            (key,)).fetchone()
+        self.db.execute('INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?)'.format(self.table),
+            (key, sqlite3.Binary(data), len(data), time.time()))
+        self.touched.pop(key, None)
+        self.total += len(data) - (old[0] if old else 0)
+
+        if self.total > self.max_bytes:
+            self.evict(key)
+        else:
+            self.changed()
+
+    def changed(self):
+        '''
+        counts one more write or read waiting to be committed, committing them all if there are
+        enough.
+        '''
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        '''
+        saves the last-used times of the values read and commits everything waiting.
+        '''
+        if self.touched:
+            self.db.executemany('UPDATE {} SET last_used = ? WHERE key = ?'.format(self.table),
+                [(t, key) for key, t in self.touched.items()])
+            self.touched = {}
+        self.db.commit()
+        self.pending = 0
+
+    def evict(self, keep_key, fraction=evict_to_fraction):
+        '''
+        evicts the least recently used values, other than the one under @keep_key, until the cache
+        is down to @fraction of max_bytes, and commits.
+        '''
+        self.commit()
+
+        # other processes may share the database, so the total is counted again before evicting
+        self.total = self.stored_bytes()
+        if self.total > self.max_bytes:
+            rows = self.db.execute('SELECT key, size FROM {} ORDER BY last_used'.format(
+                self.table)).fetchall()
+            for old_key, size in rows:
+                if self.total <= fraction * self.max_bytes:
+                    break
+                if old_key == keep_key:
+                    continue
+                self.db.execute('DELETE FROM {} WHERE key = ?'.format(self.table), (old_key,))
+                self.total -= size
+        self.db.commit()
+
+    def close(self):
+        '''
+        commits everything waiting and closes the database.
+        '''
+        if self.db is not None:
+            self.commit()
+            self.db.close()
+            self.db = None
+
+
+class AlignmentCache(BlobCache):
+    '''
+    persistent cache of alignments in an sqlite database at @path, keyed by alignment_key. each
+    alignment is stored as its run-length encoded traceback (see encode_moves). once the stored
+    alignments grow past @max_bytes, the least recently used ones are evicted.
+    '''
+
+    def __init__(self, path=default_cache_path, max_bytes=max_cache_bytes):
+        BlobCache.__init__(self, path, max_bytes, 'alignments')
+
+    def get(self, key):
+        '''
+        returns the cached traceback moves for @key, or None if there are none.
+        '''
+        data = self.get_blob(key)
+        return None if data is None else decode_moves(data)
+
+    def put(self, key, moves):
+        '''
+        stores the traceback @moves under @key.
+        '''
+        self.put_blob(key, encode_moves(moves))
+
+    def alignment_moves(self, transcript, ocr, scoring_system=None, **kwargs):
+        '''
+        same as tsc.alignment_moves, but looks the alignment up in the cache first.
+        '''
+        key = alignment_key(transcript, ocr, scoring_system, **kwargs)
+        moves = self.get(key)
+        if moves is None:
+            moves = tsc.alignment_moves(transcript, ocr, scoring_system, **kwargs)
+            self.put(key, moves)
+        return moves
+
+    def batch_alignment_moves(self, transcript, ocr, scoring_systems):
+        '''
+        same as tsc.batch_alignment_moves, but only aligns the scoring systems whose alignments
+        are not already in the cache.
+        '''
+        keys = [alignment_key(transcript, ocr, x) for x in scoring_systems]
+        moves = [self.get(key) for key in keys]
+
+        missing = [n for n, x in enumerate(moves) if x is None]
+        if missing:
+            new_moves = tsc.batch_alignment_moves(transcript, ocr,
+                [scoring_systems[n] for n in missing])
+            for n, x in zip(missing, new_moves):
+                self.put(keys[n], x)
+                moves[n] = x
+        return moves
+
+    def perform_alignment(self, transcript, ocr, scoring_system=None, verbose=False, **kwargs):
+        '''
+        same as tsc.perform_alignment, but looks the alignment up in the cache first.
+        '''
+        moves = self.alignment_moves(transcript, ocr, scoring_system, **kwargs)
+        return tsc.render_alignment(transcript, ocr, moves, verbose)
+
+    def perform_batch_alignment(self, transcript, ocr, scoring_systems):
+        '''
+        same as tsc.perform_batch_alignment, but only aligns the scoring systems whose alignments
+        are not already in the cache.
+        '''
+        return [tsc.render_alignment(transcript, ocr, x)
+            for x in self.batch_alignment_moves(transcript, ocr, scoring_systems)]
@@ -0,0 +1,688 @@
+import numpy as np
+
+# preprocessing and text line finding on numpy arrays. this module does not use gamera, so pages can
+# be preprocessed (see preprocess_images and identify_text_lines) in processes that never call
+# gamera.core.init_gamera; textAlignPreprocessing takes its parameters and the parts of line finding
+# that only need numpy from here. scipy is only imported by the functions that use it.
+
+# the parameters below are the only copies of them, which textAlignPreprocessing reads as attributes
+# of this module. preprocCache passes their current values to the functions that start a pass of
+# preprocessing, and within one they are read when used rather than through default arguments, so
+# that changing one here changes both the results and the key preprocCache keeps pages under.
+
+# on a page that is not rotated the two backends find the same ink, peaks and line strips. they
+# differ on purpose in how they deskew: estimate_skew searches for the angle of sharpest projection
+# in steps that move the edge of the page by a row, where gamera's rotation_angle_projections has
+# its own measure and steps, so the angles they find can differ by a fraction of a degree; both then
+# rotate only pages skewed by at least shear_angle_thresh (see rotation_applied), so a page skewed
+# by about that much may be rotated by one backend and left sheared by the other. pages that are
+# rotated are rotated by scipy with nearest-neighbour sampling rather than by gamera, so their ink,
+# and the strips found on it, can differ by a pixel or two.
+
+# PARAMETERS FOR PREPROCESSING
+saturation_thresh = 0.9
+sat_area_thresh = 150
+despeckle_amt = 100            # an int in [1,100]: ignore ccs with area smaller than this
+noise_area_thresh = 100        # an int in : ignore ccs with area smaller than this
+
+# PARAMETERS FOR DESKEWING
+max_skew_angle = 6              # the rotation angle is searched for within this many degrees
+deskew_coarse_scale = 0.25      # the rotation angle is first estimated on the page scaled by this
+deskew_refine_window = 0.5      # then refined at full size within this many degrees of the estimate
+shear_angle_thresh = 0.25       # pages skewed by less than this many degrees are not rotated
+
+# PARAMETERS FOR TEXT LINE SEGMENTATION
+filter_size = 30                # size of moving-average filter used to smooth projection
+prominence_tolerance = 0.70     # log-projection peaks must be at least this prominent
+collision_strip_scale = 1       # in [0,inf]; amt of each cc to consider when clipping
+remove_capitals_scale = 10000   # removes large ccs. turned off for now
+
+# PARAMETERS FOR BAND-STREAMING (see preprocess_bands)
+band_rows = 512                 # rows of the page cleaned at once, not counting the overlap
+
+
+def coinciding_components(hline_positions, comp_offsets, comp_nrows, collision):
+    '''
+    for each of @hline_positions, returns the indices of the components (given by the arrays
+    @comp_offsets and @comp_nrows) that coincide with the strip @collision rows tall around it
+    (scaled by collision_strip_scale): those not lying entirely above or entirely below it. the
+    components are sorted by their top edge once,
+    so that the only ones checked for each strip are those whose top lies within one component
+    height above the strip, or inside it.
+    '''
+    collision *= collision_strip_scale
+
+    tops = np.asarray(comp_offsets)
+    bottoms = tops + np.asarray(comp_nrows)
+    order = np.argsort(tops, kind='mergesort')
+    sorted_tops = tops[order]
+    max_height = (bottoms - tops).max() if len(tops) else 0
+
+    coinciding = []
+    for hline_position in hline_positions:
+        strip_top = hline_position - int(collision / 2)
+        strip_bottom = hline_position + int(collision / 2)
+
+        # a component coincides unless it lies entirely above or entirely below the strip
+        lo = np.searchsorted(sorted_tops, strip_top - max_height, 'left')
+        hi = np.searchsorted(sorted_tops, strip_bottom, 'right')
+        candidates = order[lo:hi]
+        coinciding.append(np.sort(candidates[bottoms[candidates] >= strip_top]))
+
+    return coinciding
+
+
+def nearest_higher(data):
+    '''
+    for every index i of @data, finds the nearest index to its left holding a strictly higher value
+    (or -1 if there is none) and the lowest value strictly between the two, using a stack of the
+    indices of decreasing values seen so far. returns (inds, mins) as lists; mins[i] is np.inf if
+    the two are adjacent or there is no higher value.
+    '''
+    inds = [-1] * len(data)
+    mins = [np.inf] * len(data)
+
+    # gap_mins[k] is the lowest value strictly between stack[k] and stack[k + 1] (or the current
+    # index, for the top of the stack)
+    stack = []
+    gap_mins = []
+    for i, x in enumerate(data):
+        popped_min = np.inf
+        while stack and data[stack[-1]] <= x:
+            j = stack.pop()
+            popped_min = min(popped_min, data[j], gap_mins.pop())
+        if stack:
+            gap_mins[-1] = min(gap_mins[-1], popped_min)
+            inds[i] = stack[-1]
+            mins[i] = gap_mins[-1]
+        stack.append(i)
+        gap_mins.append(np.inf)
+
+    return inds, mins
+
+
+def calculate_prominences(data):
+    '''
+    returns the log of the prominence of every index of @data: 0 for the ends of @data and points
+    that are not local maxima, and the log of the peak value for the highest peak. prominence
+    gives high values to relatively isolated peaks and low values to peaks that are in the
+    "foothills" of large peaks. the nearest higher peak on either side of every point and the key
+    col between them are found in a single pass each way (see nearest_higher), rather than by
+    scanning the whole of @data for every peak.
+    '''
+    data = list(data)
+    n = len(data)
+    prominences = [0] * n
+    if n < 3:
+        return prominences
+
+    # local maxima, excluding either end of the dataset and flat stretches
+    arr = np.asarray(data)
+    is_peak = np.zeros(n, dtype=bool)
+    is_peak[1:-1] = ((arr[:-2] <= arr[1:-1]) & (arr[2:] <= arr[1:-1]) &
+        ~((arr[:-2] == arr[1:-1]) & (arr[2:] == arr[1:-1])))
+
+    left_inds, left_mins = nearest_higher(data)
+    right_inds, right_mins = nearest_higher(data[::-1])
+    data_max = max(data)
+
+    for index in np.flatnonzero(is_peak):
+        current_peak = data[index]
+
+        # by definition, the prominence of the highest value in a dataset is equal to the value
+        if current_peak == data_max:
+            prominences[index] = np.log(current_peak)
+            continue
+
+        # go towards the nearest higher value, going right if both are equally near. the right
+        # side was found on the reversed data, where this peak is at index r
+        r = n - 1 - index
+        right_ind = n - 1 - right_inds[r] if right_inds[r] >= 0 else np.inf
+        left_ind = left_inds[index] if left_inds[index] >= 0 else -np.inf
+        if (right_ind - index) > (index - left_ind):
+            key_col = min(data[left_ind], left_mins[index])
+        else:
+            key_col = min(current_peak, right_mins[r])
+
+        prominences[index] = np.log(data[index] - key_col + 1)
+
+    return prominences
+
+
+def find_peak_locations(data, tol=prominence_tolerance, ranked=False):
+    '''
+    given a vertical projection in @data, finds prominent peaks and returns their indices
+    '''
+
+    prominences = list(enumerate(calculate_prominences(data)))
+
+    # normalize to interval [0,1]
+    prom_max = max([x[1] for x in prominences])
+    if prom_max == 0 or len(prominences) == 0:
+        # failure to find any peaks; probably monotonically increasing / decreasing
+        return []
+
+    prominences[:] = [(x[0], x[1] / prom_max) for x in prominences]
+
+    # take only the tallest peaks above given tolerance
+    peak_locs = [x for x in prominences if x[1] > tol]
+
+    # if a peak has a flat top, then both 'corners' of that peak will have high prominence; this
+    # is rather unavoidable. just check for adjacent peaks with exactly the same prominence and
+    # remove the lower one
+    to_remove = [peak_locs[i] for i in range(len(peak_locs) - 2)
+                if peak_locs[i][1] == peak_locs[i+1][1]]
+    for r in to_remove:
+        peak_locs.remove(r)
+
+    if ranked:
+        peak_locs.sort(key=lambda x: x[1] * -1)
+    else:
+        peak_locs[:] = [x[0] for x in peak_locs]
+
+    return peak_locs
+
+
+def moving_avg_filter(data, filter_size=filter_size):
+    '''
+    returns a list containing the data in @data filtered through a moving-average filter of size
+    @filter_size to either side; that is, filter_size = 1 gives a size of 3, filter size = 2 gives
+    a size of 5, and so on. values closer than filter_size to either end are set to zero. the means
+    are exact for integer @data only (see moving_avg_filter_rows).
+    '''
+    return moving_avg_filter_rows(np.asarray(data)[None], filter_size)[0]
+
+
+def moving_avg_filter_rows(data, filter_size=filter_size):
+    '''
+    applies moving_avg_filter to every row of the 2d array @data at once. each window sum is the
+    difference of two cumulative sums; integer data is summed exactly in int64, so the result is
+    the same as taking the mean of each window. float data is summed in float64 from the start of
+    the row, so its means agree with those of each window only up to rounding error, which grows
+    with the length of the row.
+    '''
+    data = np.asarray(data)
+    num_cols = data.shape[1]
+    width = 2 * filter_size + 1
+
+    sum_dtype = 'int64' if np.issubdtype(data.dtype, np.integer) else 'float64'
+    sums = np.zeros((data.shape[0], num_cols + 1), dtype=sum_dtype)
+    np.cumsum(data, axis=1, out=sums[:, 1:])
+
+    smoothed = np.zeros(data.shape)
+    if num_cols >= width:
+        smoothed[:, filter_size:num_cols - filter_size] = (sums[:, width:] - sums[:, :-width]) / \
+            float(width)
+    return smoothed
+
+
+def rotation_applied(angle, correct_rotation=True):
+    '''
+    returns whether preprocess_images rotates a page skewed by @angle degrees. pages skewed by less
+    than shear_angle_thresh are left as they are, since rotating them would mean making a whole new
+    (and larger) copy of the page. their line strips are still axis-aligned boxes, so each is taller
+    than its line by the skew across its width: at most tan(shear_angle_thresh) * ncols rows, about
+    13 rows on a page 3000 columns wide, which keeps strips from taking in much of the lines next to
+    them. (at 1.5 degrees it would be nearly 80 rows, twice the height of the letters.)
+    '''
+    return correct_rotation and abs(angle) >= shear_angle_thresh
+
+
+def line_shifts(ncols, skew):
+    '''
+    returns, for each column of a page @ncols wide that is skewed by @skew degrees, the number of
+    rows to add to move a point in that column onto the position it would have on the deskewed
+    page; a horizontal line at y0 on the deskewed page lies along y(x) = y0 - (x - px) tan(skew),
+    px being the middle column, as in alignToOCR.rotate_bbox.
+    '''
+    return np.round((np.arange(ncols) - ncols // 2) * np.tan(np.radians(skew))).astype('int64')
+
+
+def line_separators(smoothed_projection, peak_locations):
+    '''
+    returns the position of the lowest point of @smoothed_projection between each pair of adjacent
+    @peak_locations; white lines are drawn along these to make sure that no connected component
+    touches more than one text line.
+    '''
+    separators = []
+    for i in range(len(peak_locations) - 1):
+        start = peak_locations[i]
+        end = peak_locations[i + 1]
+        separators.append(start + int(np.argmin(smoothed_projection[start:end])))
+    return separators
+
+
+def draw_separators(eroded, separators, ncols, skew=0, row_offset=0):
+    '''
+    draws white lines two pixels thick into the boolean array @eroded at each of @separators (see
+    line_separators), along lines skewed by @skew degrees on a page @ncols wide. @eroded may be a
+    band of rows of the page starting at @row_offset, in which case only the parts of the lines
+    inside the band are drawn.
+    '''
+    cols = np.arange(ncols)
+    shifts = line_shifts(ncols, skew)
+    for idx in separators:
+        for rows in (idx - shifts - row_offset, idx + 1 - shifts - row_offset):
+            inside = (rows >= 0) & (rows < eroded.shape[0])
+            eroded[rows[inside], cols[inside]] = False
+
+
+def line_extents(extents, areas, peak_locations, ncols, skew=0):
+    '''
+    groups connected components into text lines. @extents holds the (ulx, uly, lrx, lry) of each
+    component on a page @ncols wide, and @areas its number of black pixels. components that are
+    too small or too tall (assumed to be noise and ornamental letters) are ignored, and the rest
+    are grouped by which of the @peak_locations they coincide with (see coinciding_components).
+    if the page is skewed by @skew degrees, components are compared to the peaks by their position
+    on the deskewed page (see line_shifts). returns the (ulx, uly, lrx, lry) of each line.
+    '''
+    extents = np.asarray(extents, dtype='int64').reshape(-1, 4)
+    extents = extents[np.asarray(areas) > noise_area_thresh]
+    heights = extents[:, 3] - extents[:, 1] + 1
+
+    med_comp_height = np.median(heights)
+
+    keep = heights < (med_comp_height * remove_capitals_scale)
+    extents = extents[keep]
+    heights = heights[keep]
+
+    # move the components onto the deskewed page, by the shift of their middle column
+    shifts = line_shifts(ncols, skew)
+    tops = extents[:, 1] + shifts[(extents[:, 0] + extents[:, 2]) // 2]
+
+    lines = []
+    cc_median_height = np.median(heights)
+    for rows in coinciding_components(peak_locations, tops, heights, cc_median_height):
+        res = extents[rows]
+        lines.append((res[:, 0].min(), res[:, 1].min(), res[:, 2].max(), res[:, 3].max()))
+    return lines
+
+
+def label_components(ink):
+    '''
+    labels the 8-connected components of the boolean array @ink, as gamera's cc_analysis finds
+    them. returns (labels, slices, areas), where slices[n] and areas[n] are the bounding box (see
+    scipy.ndimage.find_objects) and number of pixels of the component labelled n + 1.
+    '''
+    from scipy import ndimage
+    labels, num_labels = ndimage.label(ink, structure=np.ones((3, 3), dtype=bool))
+    slices = ndimage.find_objects(labels)
+    areas = np.bincount(labels.ravel(), minlength=num_labels + 1)[1:]
+    return labels, slices, areas
+
+
+def grey_levels(pixels):
+    '''
+    returns the greyscale image array @pixels, or the RGB(A) one with its RGB channels combined by
+    luminance as gamera does, as uint8.
+    '''
+    pixels = np.asarray(pixels)
+    if pixels.ndim == 2:
+        return pixels.astype('uint8')
+
+    # summed one channel at a time, to keep no more than one float copy of the image
+    grey = np.zeros(pixels.shape[:2], dtype='float32')
+    for channel, weight in enumerate([0.3, 0.59, 0.11]):
+        grey += pixels[:, :, channel].astype('float32') * weight
+    return np.clip(np.round(grey), 0, 255).astype('uint8')
+
+
+def otsu_threshold(hist):
+    '''
+    returns the otsu threshold of the histogram @hist of the 256 grey levels of a page.
+    '''
+    hist = np.asarray(hist, dtype='float64')
+    weight_below = np.cumsum(hist)
+    weight_above = weight_below[-1] - weight_below
+    sum_below = np.cumsum(hist * np.arange(256))
+    mean_below = sum_below / np.maximum(weight_below, 1)
+    mean_above = (sum_below[-1] - sum_below) / np.maximum(weight_above, 1)
+    between_variance = weight_below * weight_above * (mean_below - mean_above) ** 2
+    return np.argmax(between_variance)
+
+
+def to_onebit(pixels):
+    '''
+    returns the boolean ink mask of the greyscale or RGB(A) image array @pixels, thresholded as
+    gamera's to_onebit does: every pixel no brighter than the otsu threshold of the page is ink.
+    '''
+    grey = grey_levels(pixels)
+    return grey <= otsu_threshold(np.bincount(grey.ravel(), minlength=256))
+
+
+def despeckle(ink, size):
+    '''
+    returns a copy of the boolean array @ink without the connected components of fewer than @size
+    pixels.
+    '''
+    labels, _, areas = label_components(ink)
+    return np.concatenate([[False], areas >= size])[labels]
+
+
+def fill_tall_components(ink, max_height):
+    '''
+    removes the connected components of @ink that are more than @max_height rows tall, in place.
+    '''
+    labels, slices, _ = label_components(ink)
+    heights = np.array([0] + [s[0].stop - s[0].start for s in slices])
+    ink[heights[labels] > max_height] = False
+
+
+def clean_ink(ink, despeckle_amt=despeckle_amt):
+    '''
+    returns the boolean ink mask @ink with its specks and small holes removed, and without the
+    components that are too tall to be text (assumed to be saturated areas of the scan).
+    '''
+    ink = despeckle(ink, despeckle_amt)
+    ink = ~despeckle(~ink, despeckle_amt)
+
+    # keep only colored ccs above a certain size
+    fill_tall_components(ink, sat_area_thresh)
+    return ink
+
+
+def filter_short_runs(ink, length, axis=0):
+    '''
+    removes the runs of ink along @axis of the boolean array @ink that are shorter than @length, in
+    place: vertical runs for axis 0, as gamera's filter_short_runs does, and horizontal runs for
+    axis 1, as its filter_narrow_runs does. each row (or column) is padded with a blank pixel at
+    either end, so that runs never continue from one to the next, and all of the runs of the page
+    are found at once from where the padded array changes.
+    '''
+    lines = ink.T if axis == 0 else ink
+    padded = np.zeros((lines.shape[0], lines.shape[1] + 2), dtype='int8')
+    padded[:, 1:-1] = lines
+    changes = np.flatnonzero(np.diff(padded.ravel()))
+    starts, ends = changes[::2], changes[1::2]
+
+    # mark the start and end of each short run and fill in everything between them
+    short = (ends - starts) < length
+    marks = np.zeros(padded.size + 1, dtype='int8')
+    np.add.at(marks, starts[short] + 1, 1)
+    np.add.at(marks, ends[short] + 1, -1)
+    remove = np.cumsum(marks[:-1]).reshape(padded.shape)[:, 1:-1] > 0
+    lines[remove] = False
+
+
+def erode(ink, filter_runs=1, filter_runs_amt=2):
+    '''
+    returns a copy of @ink with its short and narrow runs filtered out @filter_runs times, to break
+    up letters connected to each other by thin lines of noise.
+    '''
+    eroded = ink.copy()
+    for i in range(filter_runs):
+        filter_short_runs(eroded, filter_runs_amt, axis=0)
+        filter_short_runs(eroded, filter_runs_amt, axis=1)
+    return eroded
+
+
+def sheared_projection(ink, skew):
+    '''
+    returns the y-axis projection of the boolean array @ink along lines skewed by @skew degrees (see
+    line_shifts), counting each pixel at the row it would have on the deskewed page.
+    '''
+    rows, cols = np.nonzero(ink)
+    rows = rows + line_shifts(ink.shape[1], skew)[cols]
+    inside = (rows >= 0) & (rows < ink.shape[0])
+    return np.bincount(rows[inside], minlength=ink.shape[0])
+
+
+def skew_angles(ncols, min_angle, max_angle):
+    '''
+    returns the angles from @min_angle to @max_angle to try when estimating the skew of a page
+    @ncols wide, in steps that move the edge of the page by about one row.
+    '''
+    step = np.degrees(np.arctan(2.0 / max(ncols, 1)))
+    return np.arange(min_angle, max_angle + step, step)
+
+
+def empty_projections(nrows, ncols, angles):
+    '''
+    returns (projections, pad), where @projections holds a zeroed sheared projection of a page
+    @nrows by @ncols for each of @angles, each padded by @pad rows at either end so that every
+    pixel of the page falls inside it at any of the angles.
+    '''
+    pad = int(np.ceil(ncols / 2.0 * np.tan(np.radians(np.abs(angles).max())))) + 1
+    return np.zeros((len(angles), nrows + 2 * pad), dtype='int64'), pad
+
+
+def add_sheared_projections(projections, pad, rows, cols, ncols, angles):
+    '''
+    adds ink at (@rows, @cols) of a page @ncols wide to @projections (see empty_projections), along
+    each of @angles in turn.
+    '''
+    for projection, skew in zip(projections, angles):
+        rows_at_skew = rows + line_shifts(ncols, skew)[cols] + pad
+        projection += np.bincount(rows_at_skew, minlength=len(projection))
+
+
+def sharpest_angle(projections, angles):
+    '''
+    returns which of @angles the text lines look sharpest along: the one whose projection in
+    @projections has the largest sum of squared differences between adjacent rows, which is
+    largest when the lines are followed exactly.
+    '''
+    sharpness = np.sum(np.diff(projections.astype('float64'), axis=1) ** 2, axis=1)
+    return float(angles[np.argmax(sharpness)])
+
+
+def refined_skew_angles(coarse_angle, ncols, max_angle=max_skew_angle):
+    '''
+    returns the angles to try at full size on a page @ncols wide, within deskew_refine_window
+    degrees of @coarse_angle (see skew_angles).
+    '''
+    return skew_angles(ncols, max(-max_angle, coarse_angle - deskew_refine_window),
+        min(max_angle, coarse_angle + deskew_refine_window))
+
+
+def estimate_skew(ink, max_angle=max_skew_angle):
+    '''
+    estimates the rotation angle of the text lines of @ink, in degrees, as the angle of sharpest
+    projection (see sharpest_angle). as in textAlignPreprocessing.estimate_skew, the angle is first
+    found on the page scaled down by deskew_coarse_scale (by taking every few rows and columns),
+    and then refined at full size within deskew_refine_window degrees of that estimate.
+    '''
+    step = int(round(1 / deskew_coarse_scale))
+    small = ink[::step, ::step]
+    angles = skew_angles(small.shape[1], -max_angle, max_angle)
+    projections, pad = empty_projections(small.shape[0], small.shape[1], angles)
+    rows, cols = np.nonzero(small)
+    add_sheared_projections(projections, pad, rows, cols, small.shape[1], angles)
+    coarse_angle = sharpest_angle(projections, angles)
+
+    angles = refined_skew_angles(coarse_angle, ink.shape[1], max_angle)
+    projections, pad = empty_projections(ink.shape[0], ink.shape[1], angles)
+    rows, cols = np.nonzero(ink)
+    add_sheared_projections(projections, pad, rows, cols, ink.shape[1], angles)
+    return sharpest_angle(projections, angles)
+
+
+def preprocess_images(pixels, despeckle_amt=despeckle_amt, filter_runs=1, filter_runs_amt=2,
+        correct_rotation=True):
+    '''
+    same as textAlignPreprocessing.preprocess_images, on the image array @pixels (see to_onebit)
+    instead of a gamera image: returns (ink, eroded, angle), where @ink is the boolean ink mask of
+    the preprocessed page and @eroded the same with its short and narrow runs filtered out.
+    '''
+    ink = clean_ink(to_onebit(pixels), despeckle_amt)
+
+    # find likely rotation angle and correct. small angles are left in the image; text lines are
+    # then found along sheared lines instead (see identify_text_lines)
+    angle = estimate_skew(ink, max_skew_angle)
+    if rotation_applied(angle, correct_rotation):
+        from scipy import ndimage
+        ink = ndimage.rotate(ink, -angle, reshape=True, order=0)
+
+    return ink, erode(ink, filter_runs, filter_runs_amt), angle
+
+
+def identify_text_lines(ink, eroded, skew=0):
+    '''
+    same as textAlignPreprocessing.identify_text_lines, on the arrays returned by preprocess_images.
+    white separators are drawn into @eroded. returns (rects, peak_locations, smoothed_projection),
+    where @rects are the (offset_x, offset_y, ncols, nrows) of each line strip on @ink (see
+    lineRecognizer.strip_rect).
+    '''
+    print('finding projection peaks...')
+    if skew:
+        project = sheared_projection(eroded, skew)
+    else:
+        project = eroded.sum(axis=1)
+    smoothed_projection = moving_avg_filter(project, filter_size)
+
+    # calculate normalized log prominence of all peaks in projection
+    peak_locations = find_peak_locations(smoothed_projection, prominence_tolerance)
+
+    # draw white lines at the local minima of the vertical projection, along the skew of the page
+    ncols = eroded.shape[1]
+    draw_separators(eroded, line_separators(smoothed_projection, peak_locations), ncols, skew)
+
+    print('connected component analysis...')
+    _, slices, areas = label_components(eroded)
+    extents = [(x.start, y.start, x.stop - 1, y.stop - 1) for y, x in slices]
+
+    rects = [(int(ulx), int(uly), int(lrx - ulx + 1), int(lry - uly + 1))
+        for ulx, uly, lrx, lry in line_extents(extents, areas, peak_locations, ncols, skew)]
+    return rects, peak_locations, smoothed_projection
+
+
+def unpack_rows(bits, ncols, start, end):
+    '''
+    returns rows @start to @end of the bit-packed ink mask @bits (see np.packbits) of a page @ncols
+    wide, as a boolean array.
+    '''
+    return np.unpackbits(bits[start:end], axis=1)[:, :ncols].astype(bool)
+
+
+def band_windows(nrows, overlap, band_rows=band_rows):
+    '''
+    splits a page @nrows tall into bands of @band_rows rows. returns (start, end, window_start,
+    window_end) for each band, where the window is the band with up to @overlap rows of the bands
+    around it on either side.
+    '''
+    return [(y0, min(y0 + band_rows, nrows), max(0, y0 - overlap),
+        min(nrows, y0 + band_rows + overlap)) for y0 in range(0, nrows, band_rows)]
+
+
+def preprocess_bands(read_band, nrows, ncols, band_rows=band_rows, despeckle_amt=despeckle_amt,
+        filter_runs=1, filter_runs_amt=2):
+    '''
+    streaming version of preprocess_images followed by identify_text_lines, for scans too large to
+    keep several copies of in memory. @read_band(start, end) returns rows @start to @end of the
+    image array (see to_onebit) of a page @nrows by @ncols; it might slice a memory-mapped array,
+    or read part of a gamera image. the page is read in bands of @band_rows rows, and each band is
+    cleaned together with enough of the rows around it that the result is exactly what cleaning
+    the whole page at once would give. projections and connected components are put together band
+    by band. the page is never rotated: its text lines are found along its skew instead (see
+    identify_text_lines with skew).
+
+    apart from one band at a time, only the cleaned and eroded ink of the page are kept, both
+    bit-packed (see np.packbits), along with one projection per skew angle tried and the bounding
+    boxes of the connected components. returns (bits, angle, peak_locations, rects), where @bits is
+    the bit-packed ink mask of the preprocessed page (see unpack_rows), @angle its skew and the
+    rest as in identify_text_lines.
+    '''
+    # the otsu threshold needs the histogram of the whole page
+    hist = np.zeros(256, dtype='int64')
+    for start, end, _, _ in band_windows(nrows, 0, band_rows):
+        hist += np.bincount(grey_levels(read_band(start, end)).ravel(), minlength=256)
+    thresh = otsu_threshold(hist)
+
+    # whether a pixel survives cleaning depends on the components within despeckle_amt rows of it,
+    # for the ink and then for the holes, and then on those within sat_area_thresh rows of it
+    overlap = 2 * despeckle_amt + sat_area_thresh + 1
+
+    # clean the page, estimating its skew on every few rows and columns of it on the way
+    step = int(round(1 / deskew_coarse_scale))
+    small_nrows = len(range(0, nrows, step))
+    small_ncols = len(range(0, ncols, step))
+    angles = skew_angles(small_ncols, -max_skew_angle, max_skew_angle)
+    projections, pad = empty_projections(small_nrows, small_ncols, angles)
+
+    bits = np.zeros((nrows, (ncols + 7) // 8), dtype='uint8')
+    for start, end, window_start, window_end in band_windows(nrows, overlap, band_rows):
+        ink = grey_levels(read_band(window_start, window_end)) <= thresh
+        ink = clean_ink(ink, despeckle_amt)[start - window_start:end - window_start]
+        bits[start:end] = np.packbits(ink, axis=1)
+
+        first = -start % step
+        rows, cols = np.nonzero(ink[first::step, ::step])
+        add_sheared_projections(projections, pad, rows + (start + first) // step, cols,
+            small_ncols, angles)
+        del ink
+    coarse_angle = sharpest_angle(projections, angles)
+
+    angles = refined_skew_angles(coarse_angle, ncols, max_skew_angle)
+    projections, pad = empty_projections(nrows, ncols, angles)
+    for start, end, _, _ in band_windows(nrows, 0, band_rows):
+        rows, cols = np.nonzero(unpack_rows(bits, ncols, start, end))
+        add_sheared_projections(projections, pad, rows + start, cols, ncols, angles)
+    angle = sharpest_angle(projections, angles)
+    del projections
+
+    # erode the page and take its projection along the skew
+    print('finding projection peaks...')
+    shifts = line_shifts(ncols, angle)
+    eroded_bits = np.zeros_like(bits)
+    project = np.zeros(nrows, dtype='int64')
+    for start, end, window_start, window_end in band_windows(nrows, filter_runs * filter_runs_amt,
+            band_rows):
+        eroded = erode(unpack_rows(bits, ncols, window_start, window_end), filter_runs,
+            filter_runs_amt)[start - window_start:end - window_start]
+        eroded_bits[start:end] = np.packbits(eroded, axis=1)
+
+        rows, cols = np.nonzero(eroded)
+        rows = rows + start + shifts[cols]
+        project += np.bincount(rows[(rows >= 0) & (rows < nrows)], minlength=nrows)
+    smoothed_projection = moving_avg_filter(project, filter_size)
+
+    # calculate normalized log prominence of all peaks in projection
+    peak_locations = find_peak_locations(smoothed_projection, prominence_tolerance)
+    separators = line_separators(smoothed_projection, peak_locations)
+
+    # label the components of each band, and join those that touch across the edges of bands
+    print('connected component analysis...')
+    extents = []
+    areas = []
+    touching = []
+    num_labels = 0
+    last_row = None
+    for start, end, _, _ in band_windows(nrows, 0, band_rows):
+        eroded = unpack_rows(eroded_bits, ncols, start, end)
+        draw_separators(eroded, separators, ncols, angle, start)
+        labels, slices, band_areas = label_components(eroded)
+        labels[labels > 0] += num_labels
+        num_labels += len(slices)
+        extents += [(x.start, y.start + start, x.stop - 1, y.stop - 1 + start) for y, x in slices]
+        areas.append(band_areas)
+
+        # components are 8-connected, so a pixel touches the three below it in the next band
+        if last_row is not None:
+            for dx in (-1, 0, 1):
+                above = last_row[max(0, -dx):ncols - max(0, dx)]
+                below = labels[0, max(0, dx):ncols - max(0, -dx)]
+                both = (above > 0) & (below > 0)
+                touching.append(np.stack([above[both], below[both]]))
+        last_row = labels[-1]
+
+    extents = np.array(extents, dtype='int64').reshape(-1, 4)
+    areas = np.concatenate(areas) if areas else np.zeros(0, dtype='int64')
+    if num_labels:
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        touching = np.concatenate(touching, axis=1) if touching else np.zeros((2, 0), dtype='int64')
+        graph = coo_matrix((np.ones(touching.shape[1]), (touching[0] - 1, touching[1] - 1)),
+            shape=(num_labels, num_labels))
+        num_components, components = connected_components(graph, directed=False)
+
+        joined = np.empty((num_components, 4), dtype='int64')
+        joined[:, :2] = np.iinfo('int64').max
+        joined[:, 2:] = -1
+        for i, reduce_at in enumerate((np.minimum, np.minimum, np.maximum, np.maximum)):
+            reduce_at.at(joined[:, i], components, extents[:, i])
+        extents = joined
+        areas = np.bincount(components, weights=areas, minlength=num_components)
+
+    rects = [(int(ulx), int(uly), int(lrx - ulx + 1), int(lry - uly + 1))
+        for ulx, uly, lrx, lry in line_extents(extents, areas, peak_locations, ncols, angle)]
+    return bits, angle, peak_locations, rects
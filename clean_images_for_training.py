@@ -9,6 +9,7 @@ import itertools as iter
 import os
 import re
 import textAlignPreprocessing as preproc
+import arrayPreprocessing as apre
 reload(preproc)
 
 
@@ -51,6 +52,7 @@ if __name__ == '__main__':
 
         raw_image = gc.load_image('./png/' + filename)
         image, eroded, angle = preproc.preprocess_images(raw_image, despeckle_amt=20, filter_runs=0)
-        line_strips, lines_peak_locs, proj = preproc.identify_text_lines(image, eroded)
+        skew = 0 if apre.rotation_applied(angle) else angle
+        line_strips, lines_peak_locs, proj = preproc.identify_text_lines(image, eroded, skew)
         unioned_lines = union_images(line_strips)
         unioned_lines.save_image('cleaned_' + filename)
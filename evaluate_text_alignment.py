@@ -1,13 +1,15 @@
 import PIL
-import pickle
 from PIL import Image, ImageDraw, ImageFont
 import xml.etree.ElementTree as ET
 import json
 import numpy as np
-import textAlignPreprocessing as preproc
+import preprocCache as pcache
+import pageStore as pstore
 import gamera.core as gc
 import parse_cantus_csv as pcc
 import alignToOCR as atocr
+import alignmentCache as acache
+import textSeqCompare as tsc
 from itertools import product
 reload(atocr)
 gc.init_gamera()
@@ -53,9 +55,10 @@ def IOU(bb1, bb2):
     return float(area_int) / (area_1 + area_2 - area_int)
 
 
-def black_area_IOU(bb1, bb2, image):
+def black_area_IOU(bb1, bb2, ink):
     '''
-    intersection over union between two bounding boxes
+    intersection over union between two bounding boxes, by the ink they hold on the boolean ink
+    mask @ink of the page
     '''
     lr1 = bb1['lr']
     ul1 = bb1['ul']
@@ -65,13 +68,12 @@ def black_area_IOU(bb1, bb2, image):
     new_ul = (max(ul1[0], ul2[0]), max(ul1[1], ul2[1]))
     new_lr = (min(lr1[0], lr2[0]), min(lr1[1], lr2[1]))
 
-    bb1_subimage = image.subimage(ul1, lr1)
-    bb2_subimage = image.subimage(ul2, lr2)
-    intersect_subimage = image.subimage(new_ul, new_lr)
+    def black_area(ul, lr):
+        return int(ink[ul[1]:lr[1] + 1, ul[0]:lr[0] + 1].sum())
 
-    bb1_black = bb1_subimage.black_area()[0]
-    bb2_black = bb2_subimage.black_area()[0]
-    intersect_black = intersect_subimage.black_area()[0]
+    bb1_black = black_area(ul1, lr1)
+    bb2_black = black_area(ul2, lr2)
+    intersect_black = black_area(new_ul, new_lr)
 
     return float(intersect_black) / (bb1_black + bb2_black - intersect_black)
 
@@ -103,8 +105,8 @@ def evaluate_alignment(manuscript, ind, eval_difficult=False, json_dict=None):
         with open('./out_json/{}.json'.format(fname), 'r') as j:
             align_boxes = json.load(j)['syl_boxes']
 
-    raw_image = gc.load_image('./png/' + fname + '_text.png')
-    image, _, _ = preproc.preprocess_images(raw_image, correct_rotation=False)
+    raw_image = pstore.load_page('./png/' + fname + '_text.png')
+    ink, _, _, _ = pcache.preprocess_page(raw_image, correct_rotation=False)
 
     score = {}
     area_score = {}
@@ -126,14 +128,13 @@ def evaluate_alignment(manuscript, ind, eval_difficult=False, json_dict=None):
             continue
         best_box = same_syl_boxes[ints.index(max(ints))]
         score[box['syl']] = IOU(box, best_box)
-        area_score[box['syl']] = black_area_IOU(box, best_box, image)
+        area_score[box['syl']] = black_area_IOU(box, best_box, ink)
 
     return (np.mean(score.values()), np.mean(area_score.values()))
 
 
-def try_params(params):
-
-    gts = [{
+def ground_truth_pages():
+    return [{
         'manuscript': 'salzinnes',
         'folio': '020v',
         'text_func': pcc.filename_to_text_func('./csv/123723_Salzinnes.csv', './csv/mapping.csv'),
@@ -150,31 +151,70 @@ def try_params(params):
         'ocr_model': './models/stgall2-00017000.pyrnn.gz'
     }]
 
+
+def try_params(params):
+
+    gts = ground_truth_pages()
+
     results = []
     for x in gts:
         f_ind, transcript = x['text_func'](x['folio'])
         manuscript = x['manuscript']
         fname = '{}_{}'.format(manuscript, f_ind)
         ocr_model = x['ocr_model']
-        ocr_pickle = './pik/{}_boxes.pickle'.format(fname)
         text_layer_fname = './png/{}_text.png'.format(fname)
-        raw_image = gc.load_image('./png/' + fname + '_text.png')
+        raw_image = pstore.load_page('./png/' + fname + '_text.png')
+
+        result = atocr.process(raw_image, transcript, ocr_model, seq_align_params=params)
 
-        result = atocr.process(raw_image, transcript,
-            ocr_model, seq_align_params=params, existing_ocr_pickle=ocr_pickle)
+        # a page on which no text could be read scores zero
+        if result is None:
+            results.append(0)
+            continue
 
-        syl_boxes, image, lines_peak_locs, all_chars = result
+        syl_boxes, ink, lines_peak_locs, all_chars = result
         json_dict = atocr.to_JSON_dict(syl_boxes, lines_peak_locs)
         res = evaluate_alignment(manuscript, f_ind, eval_difficult=False, json_dict=json_dict)
 
-        with open('./pik/{}_boxes.pickle'.format(fname), 'wb') as f:
-            pickle.dump(all_chars, f, -1)
-
         results.append(res[1])
 
     return np.mean(results)
 
 
+def try_param_grid(param_grid):
+    '''
+    evaluates every scoring system in @param_grid on the ground-truth pages, returning the mean
+    score of each. each page is preprocessed and OCRed once and aligned under all the scoring
+    systems in one batch. a page on which no text could be read scores zero under all of them.
+    '''
+    gts = ground_truth_pages()
+
+    results = np.zeros((len(gts), len(param_grid)))
+    for n, x in enumerate(gts):
+        f_ind, transcript = x['text_func'](x['folio'])
+        manuscript = x['manuscript']
+        fname = '{}_{}'.format(manuscript, f_ind)
+        raw_image = pstore.load_page('./png/' + fname + '_text.png')
+
+        page = atocr.ocr_page(raw_image, x['ocr_model'])
+        if page is None:
+            continue
+        all_chars, ink, lines_peak_locs, angle = page
+        ocr = [c.char for c in all_chars]
+        with acache.AlignmentCache() as cache:
+            alignments = cache.batch_alignment_moves(list(transcript), ocr, param_grid)
+
+        for p, moves in enumerate(alignments):
+            tra_inds, ocr_inds = tsc.index_maps(moves)
+            syl_boxes = atocr.place_syllables(transcript, all_chars, tra_inds, ocr_inds, angle,
+                pstore.page_dim(ink), raw_image.dim)
+            json_dict = atocr.to_JSON_dict(syl_boxes, lines_peak_locs)
+            res = evaluate_alignment(manuscript, f_ind, eval_difficult=False, json_dict=json_dict)
+            results[n, p] = res[1]
+
+    return results.mean(axis=0)
+
+
 if __name__ == '__main__':
     logs = {}
 
@@ -188,8 +228,7 @@ if __name__ == '__main__':
     )))
     np.random.shuffle(params)
 
-    for p in params:
-        res = try_params(p)
+    for p, res in zip(params, try_param_grid(params)):
         logs[tuple(p)] = res
         print(p, res)
 
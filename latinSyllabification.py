@@ -19,6 +19,52 @@ abbreviations = {
 }
 
 
+def build_trie(keys):
+    '''
+    returns a trie of the strings @keys as nested dicts, one level per character. the key that ends
+    at a node is kept under None.
+    '''
+    trie = {}
+    for key in keys:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[None] = key
+    return trie
+
+
+# trie of the abbreviations, built once (see find_abbreviations)
+abbreviation_trie = build_trie(abbreviations)
+
+
+def find_abbreviations(chars, trie=abbreviation_trie):
+    '''
+    finds the abbreviations (the keys of @trie, see build_trie) in the list of characters @chars,
+    in a single pass from left to right. returns a list of (start, abbreviation) pairs. at each
+    position the longest abbreviation starting there is taken, and the search goes on after its
+    end, so matches never overlap. since no abbreviation is longer than a few characters, walking
+    the trie from each position keeps this linear in the length of @chars.
+    '''
+    found = []
+    i = 0
+    while i < len(chars):
+        node = trie
+        match = None
+        j = i
+        while j < len(chars) and chars[j] in node:
+            node = node[chars[j]]
+            if None in node:
+                match = node[None]
+            j += 1
+
+        if match is None:
+            i += 1
+        else:
+            found.append((i, match))
+            i += len(match)
+    return found
+
+
 def syllabify_word(inp):
     '''
     separate each word into UNITS - first isolate consonant groups, then diphthongs, then letters.
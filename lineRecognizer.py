@@ -0,0 +1,109 @@
+import numpy as np
+
+# padding, in columns, added to each side of a line before recognition (as in ocropus-rpred)
+line_pad = 16
+
+# recognizers already loaded by get_recognizer, by model path
+loaded_recognizers = {}
+
+
+def ink_mask(image):
+    '''
+    returns a boolean array that is True wherever the one-bit gamera image @image is black.
+    '''
+    return np.asarray(image.to_numpy()) > 0
+
+
+def strip_rect(strip):
+    '''
+    returns the (offset_x, offset_y, ncols, nrows) of the gamera subimage @strip on its page.
+    '''
+    return (strip.offset_x, strip.offset_y, strip.ncols, strip.nrows)
+
+
+def line_views(page, rects):
+    '''
+    returns the strips of the page @page at each of the line rectangles @rects (see strip_rect), as
+    a LineViews, so that no line is copied or written out before recognition.
+    '''
+    return LineViews(page, rects)
+
+
+class LineViews(object):
+    '''
+    sequence of the strips of the page @page at each of the line rectangles @rects (see
+    strip_rect), each made only when it is asked for. @page is a boolean ink mask (see ink_mask),
+    whose strips are views into it, or a pageStore.PackedPage, whose strips are unpacked one at a
+    time so that the whole page never is.
+    '''
+
+    def __init__(self, page, rects):
+        self.page = page
+        self.rects = rects
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __getitem__(self, i):
+        x, y, ncols, nrows = self.rects[i]
+        return self.page[y:y + nrows, x:x + ncols]
+
+
+class LineRecognizer(object):
+    '''
+    in-process equivalent of running ocropus-rpred --nocheck --llocs on a set of line images. the
+    model at @model_path is loaded (and ocrolib imported) only once, when the recognizer is made,
+    instead of once per page.
+    '''
+
+    def __init__(self, model_path, pad=line_pad):
+        # ocrolib is only needed for in-process recognition, so it is imported here rather than at
+        # the top of the module
+        import ocrolib
+        from ocrolib import lstm
+
+        self.lstm = lstm
+        self.pad = pad
+        self.network = ocrolib.load_object(model_path, verbose=0)
+        for x in self.network.walk():
+            x.postLoad()
+        for x in self.network.walk():
+            if isinstance(x, lstm.LSTM):
+                x.allocate(5000)
+        self.lnorm = getattr(self.network, 'lnorm', None)
+
+    def recognize(self, line):
+        '''
+        recognizes the greyscale line image @line (floats in [0, 1], with ink at 0 and background
+        at 1, as ocrolib.read_image_gray gives) and returns a list of (char, x_position) pairs, one
+        per recognized character, where x_position is the right edge of the character in pixels
+        from the left of the line. these are exactly the lines of the .llocs file ocropus-rpred
+        would write, including the rounding to one decimal place.
+        '''
+        line = np.asarray(line, dtype='float64')
+        if np.prod(line.shape) == 0 or np.amax(line) == np.amin(line):
+            return []
+        raw_width = line.shape[1]
+
+        temp = np.amax(line) - line
+        temp = temp * 1.0 / np.amax(temp)
+        self.lnorm.measure(temp)
+        line = self.lnorm.normalize(line, cval=np.amax(line))
+
+        line = self.lstm.prepare_line(line, self.pad)
+        self.network.predictString(line)
+
+        result = self.lstm.translate_back(self.network.outputs, pos=1)
+        scale = raw_width * 1.0 / (len(self.network.outputs) - 2 * self.pad)
+        return [(self.network.l2s([c]), float('%.1f' % ((r - self.pad) * scale)))
+            for r, c in result]
+
+
+def get_recognizer(model_path):
+    '''
+    returns a LineRecognizer for the model at @model_path, loading the model only the first time
+    it is asked for.
+    '''
+    if model_path not in loaded_recognizers:
+        loaded_recognizers[model_path] = LineRecognizer(model_path)
+    return loaded_recognizers[model_path]
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import numpy as np
+import alignmentCache as acache
+
+# where recognized lines are cached by default, and how large the cache may grow before the least
+# recently used lines are evicted
+default_cache_path = './ocr_cache.sqlite'
+max_cache_bytes = 2 ** 26
+
+# hashes of model files already read, by (path, size, modification time)
+model_hashes = {}
+
+
+def model_hash(model_path):
+    '''
+    returns a hash of the contents of the OCR model file at @model_path. the file is only read again
+    if its size or modification time changes.
+    '''
+    stat = os.stat(model_path)
+    ident = (os.path.abspath(model_path), stat.st_size, stat.st_mtime)
+    if ident not in model_hashes:
+        h = hashlib.sha1()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                h.update(chunk)
+        model_hashes[ident] = h.hexdigest()
+    return model_hashes[ident]
+
+
+def line_key(ink, model_digest, engine):
+    '''
+    returns a hash identifying the recognition of the line whose boolean ink mask is @ink (see
+    lineRecognizer.ink_mask) by the model whose hash is @model_digest, run by the recognizer
+    @engine with its options (see alignToOCR.ocr_engine). two strips share a key only if every one
+    of their pixels is the same.
+    '''
+    ink = np.ascontiguousarray(ink, dtype=bool)
+    h = hashlib.sha1(model_digest.encode('utf-8'))
+    h.update(b'\0' + engine.encode('utf-8') + b'\0')
+    h.update(np.array(ink.shape, dtype='<i8').tobytes())
+    h.update(np.packbits(ink).tobytes())
+    return h.hexdigest()
+
+
+def encode_locs(locs):
+    '''
+    packs the (char, x_position) pairs @locs of a recognized line into bytes: the number of
+    characters, the characters as a json list and the positions as float32.
+    '''
+    chars = json.dumps([char for char, _ in locs]).encode('utf-8')
+    xpos = np.array([x for _, x in locs], dtype='<f4')
+    return np.array([len(locs)], dtype='<u4').tobytes() + xpos.tobytes() + chars
+
+
+def decode_locs(data):
+    '''
+    inverse of encode_locs. positions only carry one decimal place, so float32 keeps them exactly
+    enough to round to the same pixel.
+    '''
+    num_chars = int(np.frombuffer(data[:4], dtype='<u4')[0])
+    xpos = np.frombuffer(data[4:4 + 4 * num_chars], dtype='<f4')
+    chars = json.loads(data[4 + 4 * num_chars:].decode('utf-8'))
+    return [(char, float('%.1f' % x)) for char, x in zip(chars, xpos)]
+
+
+class OCRCache(acache.BlobCache):
+    '''
+    persistent cache of recognized line strips in an sqlite database at @path, keyed by line_key.
+    since lines are keyed by their pixels rather than by page, re-running a manuscript after a
+    change to preprocessing only re-OCRs the lines that actually changed.
+    '''
+
+    def __init__(self, path=default_cache_path, max_bytes=max_cache_bytes):
+        acache.BlobCache.__init__(self, path, max_bytes, 'lines')
+
+    def get(self, key):
+        '''
+        returns the cached (char, x_position) pairs of the line with @key, or None.
+        '''
+        data = self.get_blob(key)
+        return None if data is None else decode_locs(data)
+
+    def put(self, key, locs):
+        '''
+        stores the (char, x_position) pairs @locs of the line with @key.
+        '''
+        self.put_blob(key, encode_locs(locs))
@@ -0,0 +1,212 @@
+import multiprocessing
+import time
+import preprocCache as pcache
+import alignToOCR as atocr
+import alignmentCache as acache
+import lineRecognizer as lrec
+import ocrCache as ocache
+import pageStore as pstore
+
+# the tests also import this module under python 3, where Queue was renamed
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+# number of worker processes that OCR line strips
+num_workers = multiprocessing.cpu_count()
+
+# seconds to wait for a recognized line before checking for lines whose task failed
+poll_interval = 1.0
+
+# a task whose worker process dies is never finished, so once no line has been recognized for this
+# many seconds the lines still out are given up on, and their pages skipped
+line_timeout = 600
+
+
+def recognize_line(task):
+    '''
+    OCRs one line strip in a worker process. @task is (page_ind, line_ind, ink, ocropus_model, key),
+    where @ink is the boolean ink mask of the strip (see lineRecognizer.ink_mask) and @key the key
+    to cache the result under, if any; each worker loads every model it is given only once. returns
+    (page_ind, line_ind, locs, key), where locs is the list of (char, x_position) pairs of the line
+    or the exception raised while recognizing it.
+    '''
+    page_ind, line_ind, ink, ocropus_model, key = task
+    try:
+        locs = lrec.get_recognizer(ocropus_model).recognize(1.0 - ink)
+    except Exception as e:
+        locs = e
+    return page_ind, line_ind, locs, key
+
+
+def process_pages(pages, ocropus_model, seq_align_params=None, workers=num_workers,
+        alignment_cache=acache.default_cache_path, ocr_cache=ocache.default_cache_path,
+        preproc_cache=pcache.default_cache_dir, preproc_backend=pcache.default_backend,
+        timeout=line_timeout):
+    '''
+    batch version of alignToOCR.process for whole manuscripts. @pages is an iterable of
+    (raw_image, transcript) pairs. pages are preprocessed one after another in this process, and
+    the line strips of every page go into a single work queue shared by @workers OCR processes, so
+    that no worker sits idle at the end of a page with few lines. the lines of a page are aligned
+    one after another as they are recognized (see alignToOCR.LineAligner), while the workers go on
+    with the lines after them, so that little of the alignment is left once the last line of the
+    page is in. lines found in the cache at @ocr_cache (see ocrCache) never go to the workers, and
+    pages found in the cache at @preproc_cache (see preprocCache) are not preprocessed again;
+    others are preprocessed with @preproc_backend. only the OCR is spread over the workers: raw
+    images (gamera images, pageStore pages) cannot be sent to other processes, so preprocessing
+    runs serially in this process, and with the gamera backend it can keep the workers waiting.
+
+    yields (page_ind, result) for each page as it is finished, which need not be in the order the
+    pages were given; result is what process would return for the page at index page_ind of
+    @pages, or None if its OCR failed. a line fails if its task raises, or if no line at all has
+    been recognized for @timeout seconds while it was out (e.g. because its worker died).
+    '''
+    pool = multiprocessing.Pool(workers)
+    finished_lines = Queue.Queue()
+    cache = ocache.OCRCache(ocr_cache) if ocr_cache else None
+    if ocr_cache:
+        model_digest = ocache.model_hash(ocropus_model)
+        engine = atocr.ocr_engine(in_process_ocr=True)
+
+    # one connection to the alignment cache serves every page
+    if alignment_cache:
+        alignment_cache = acache.AlignmentCache(alignment_cache)
+
+    pages_info = {}
+    pages_locs = {}
+    # (AsyncResult, key) of each line given to the workers, by (page_ind, line_ind)
+    pending = {}
+    try:
+        for page_ind, (raw_image, transcript) in enumerate(pages):
+            ink, angle, lines_peak_locs, rects = pcache.preprocess_page(raw_image, preproc_cache,
+                backend=preproc_backend)
+
+            pages_locs[page_ind] = [None] * len(rects)
+            recognizing = False
+            for line_ind, line in enumerate(lrec.line_views(ink, rects)):
+                key = ocache.line_key(line, model_digest, engine) if ocr_cache else None
+                locs = cache.get(key) if ocr_cache else None
+                if locs is None:
+                    pending[page_ind, line_ind] = (pool.apply_async(recognize_line,
+                        ((page_ind, line_ind, line, ocropus_model, key),),
+                        callback=finished_lines.put), key)
+                    recognizing = True
+                else:
+                    finished_lines.put((page_ind, line_ind, locs, None))
+
+            # a page with lines to recognize is aligned a line at a time as its lines come back;
+            # a page whose lines were all cached is aligned (or found in the alignment cache) at once
+            aligner = atocr.line_aligner(transcript, seq_align_params) if recognizing else None
+            pages_info[page_ind] = (raw_image, transcript, ink, lines_peak_locs, angle, rects,
+                aligner)
+            if not rects:
+                yield finish_page(page_ind, pages_info, pages_locs, seq_align_params,
+                    alignment_cache)
+
+            # align whichever pages have finished while this one was being preprocessed
+            for line in failed_lines(pending):
+                finished_lines.put(line)
+            while True:
+                try:
+                    line = finished_lines.get_nowait()
+                except Queue.Empty:
+                    break
+                for finished_page in add_line(line, pages_info, pages_locs, pending, cache,
+                        seq_align_params, alignment_cache):
+                    yield finished_page
+
+        last_line = time.time()
+        while pages_locs:
+            try:
+                line = finished_lines.get(timeout=poll_interval)
+            except Queue.Empty:
+                for line in failed_lines(pending, time.time() - last_line > timeout):
+                    finished_lines.put(line)
+                continue
+            last_line = time.time()
+            for finished_page in add_line(line, pages_info, pages_locs, pending, cache,
+                    seq_align_params, alignment_cache):
+                yield finished_page
+
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        if cache is not None:
+            cache.close()
+        if alignment_cache:
+            alignment_cache.close()
+
+
+def failed_lines(pending, timed_out=False):
+    '''
+    returns the lines in @pending (see process_pages) whose task raised, which never reach the
+    callback, as results of recognize_line holding the exception; if @timed_out is set, every
+    line still out fails too.
+    '''
+    failed = []
+    for (page_ind, line_ind), (result, key) in pending.items():
+        if result.ready() and not result.successful():
+            try:
+                result.get()
+            except Exception as e:
+                failed.append((page_ind, line_ind, e, key))
+        elif timed_out and not result.ready():
+            failed.append((page_ind, line_ind,
+                multiprocessing.TimeoutError('no line recognized in time'), key))
+    return failed
+
+
+def add_line(line, pages_info, pages_locs, pending, cache, seq_align_params, alignment_cache):
+    '''
+    records the recognized @line, a result of recognize_line, among the lines of its page in
+    @pages_locs, removes it from @pending, saves it to the OCR @cache and aligns the lines of its
+    page that are in, in order, if the page has a LineAligner in @pages_info. returns
+    [(page_ind, result)] (see process_pages) if this was the last line of its page to be
+    recognized, else [].
+    '''
+    page_ind, line_ind, locs, key = line
+    # a line that was given up on may still be recognized later, after its page was finished
+    if page_ind not in pages_locs or pages_locs[page_ind][line_ind] is not None:
+        return []
+    pending.pop((page_ind, line_ind), None)
+    pages_locs[page_ind][line_ind] = locs
+    if cache is not None and key is not None and not isinstance(locs, Exception):
+        cache.put(key, locs)
+
+    # align the lines of the page that are now in, in order
+    aligner = pages_info[page_ind][-1]
+    if aligner is not None:
+        aligner.add_lines(pages_locs[page_ind], pages_info[page_ind][5])
+    if any(x is None for x in pages_locs[page_ind]):
+        return []
+    return [finish_page(page_ind, pages_info, pages_locs, seq_align_params, alignment_cache)]
+
+
+def finish_page(page_ind, pages_info, pages_locs, seq_align_params, alignment_cache):
+    '''
+    puts together the OCR of the fully recognized page @page_ind from its lines in @pages_locs and
+    aligns it, removing the page from @pages_info and @pages_locs. returns (page_ind, result).
+    '''
+    page_locs = pages_locs.pop(page_ind)
+    raw_image, transcript, ink, lines_peak_locs, angle, rects, aligner = pages_info.pop(page_ind)
+
+    failed = [x for x in page_locs if isinstance(x, Exception)]
+    if failed:
+        print('OCR failed on page {}: {}. Skipping current file.'.format(page_ind, failed[0]))
+        return page_ind, None
+
+    moves = None
+    if aligner is not None:
+        aligner.add_lines(page_locs, rects)
+        all_chars, moves = aligner.finish()
+    else:
+        all_chars = []
+        for locs, rect in zip(page_locs, rects):
+            all_chars += atocr.line_char_boxes(locs, rect)
+        all_chars = atocr.expand_abbreviations(all_chars)
+
+    syl_boxes = atocr.align_page(transcript, all_chars, angle, pstore.page_dim(ink),
+        raw_image.dim, seq_align_params, alignment_cache, moves=moves)
+    return page_ind, (syl_boxes, ink, lines_peak_locs, all_chars)
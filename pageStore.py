@@ -0,0 +1,193 @@
+import hashlib
+import os
+import struct
+from collections import namedtuple
+import numpy as np
+import arrayPreprocessing as apre
+
+# where converted pages are kept by default, and how large the store may grow before the least
+# recently used pages are removed
+default_store_dir = './page_store'
+max_store_bytes = 2 ** 30
+
+# each page file starts with a header holding a magic string and the number of rows and columns of
+# the page, as little-endian uint32s. the rest of the file is the one-bit page, bit-packed by row
+page_magic = b'TAPG'
+header_format = '<4sII'
+header_size = struct.calcsize(header_format)
+
+# dimensions of a mapped page, with the same attributes as a gamera Dim
+PageDim = namedtuple('PageDim', ['nrows', 'ncols'])
+
+
+def page_path(image_path, store_dir=default_store_dir):
+    '''
+    returns the path of the page file that the image at @image_path is converted into in
+    @store_dir. besides the name of the image, it holds a hash of the absolute path, size and
+    modification time of the image, so that scans with the same name in different folders never
+    share a page file, and a scan that changes is converted again.
+    '''
+    stat = os.stat(image_path)
+    ident = (os.path.abspath(image_path), stat.st_size, stat.st_mtime)
+    digest = hashlib.sha1(repr(ident).encode('utf-8')).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(store_dir, '{}.{}.page'.format(name, digest))
+
+
+def page_dim(image):
+    '''
+    returns the PageDim of @image, which may be a boolean ink mask or anything with nrows and
+    ncols: a gamera image or Dim, or a PackedPage.
+    '''
+    if isinstance(image, np.ndarray):
+        return PageDim(*image.shape[:2])
+    return PageDim(image.nrows, image.ncols)
+
+
+def temp_path(path):
+    '''
+    returns the temporary name a file at @path is written under by this process (see replace_file).
+    '''
+    return '{}.{}.tmp'.format(path, os.getpid())
+
+
+def replace_file(temp_file, path):
+    '''
+    moves the fully written file @temp_file to @path, replacing whatever is there, so that other
+    processes never read a file at @path that is only partly written.
+    '''
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temp_file, path)
+
+
+def write_page(path, ink):
+    '''
+    writes the boolean ink mask @ink of a one-bit page to a page file at @path. the file is written
+    under a temporary name and then moved into place, so that other processes never map a page
+    that is only partly written.
+    '''
+    nrows, ncols = ink.shape
+    temp_file = temp_path(path)
+    with open(temp_file, 'wb') as f:
+        f.write(struct.pack(header_format, page_magic, nrows, ncols))
+        f.write(np.packbits(ink, axis=1).tobytes())
+    replace_file(temp_file, path)
+
+
+def evict_pages(store_dir, max_bytes, keep_path=None):
+    '''
+    removes the least recently used page files in @store_dir, other than the one at @keep_path,
+    until those left take up no more than @max_bytes.
+    '''
+    entries = []
+    for fname in os.listdir(store_dir):
+        if fname.endswith('.page'):
+            path = os.path.join(store_dir, fname)
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+    total = sum(x[1] for x in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path != keep_path:
+            os.remove(path)
+            total -= size
+
+
+def convert_page(image_path, store_dir=default_store_dir, max_bytes=max_store_bytes):
+    '''
+    converts the text layer image at @image_path into a page file in @store_dir (see page_path),
+    and returns the path of the page file. the image is decoded with gamera and made one-bit by its
+    to_onebit, as the first step of preprocessing would do, so this only needs to happen once per
+    scan. once the page files in @store_dir grow past @max_bytes, the least recently used ones are
+    removed.
+    '''
+    path = page_path(image_path, store_dir)
+    if os.path.isfile(path):
+        # mark this page as recently used
+        os.utime(path, None)
+        return path
+
+    # gamera is only needed to decode scans that have not been converted yet
+    import gamera.core as gc
+    gc.init_gamera()
+    image = gc.load_image(image_path).to_onebit()
+
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    write_page(path, np.asarray(image.to_numpy()) > 0)
+    evict_pages(store_dir, max_bytes, path)
+    return path
+
+
+class PackedPage(object):
+    '''
+    a one-bit page @ncols wide, held bit-packed by row in the uint8 array @bits (see np.packbits),
+    which may be memory-mapped. rows are only unpacked when they are used, so a PackedPage can
+    stand in for the boolean ink mask of a page (see lineRecognizer.ink_mask) wherever the page is
+    only read a part at a time: slicing it as page[y0:y1, x0:x1] unpacks only rows y0 to y1.
+    '''
+
+    def __init__(self, bits, ncols):
+        self.bits = bits
+        self.nrows = bits.shape[0]
+        self.ncols = ncols
+        self.shape = (self.nrows, ncols)
+        self.dim = PageDim(self.nrows, ncols)
+
+    def __getitem__(self, index):
+        rows, cols = index if isinstance(index, tuple) else (index, slice(None))
+        if not isinstance(rows, slice):
+            raise TypeError('Rows of a packed page can only be taken as a slice.')
+        start, stop, step = rows.indices(self.nrows)
+        return self.ink_rows(start, max(start, stop))[::step, cols]
+
+    def ink_rows(self, start, end):
+        '''
+        returns rows @start to @end of the page as a boolean array that is True wherever there is
+        ink.
+        '''
+        return apre.unpack_rows(self.bits, self.ncols, start, end)
+
+    def grey_rows(self, start, end):
+        '''
+        returns rows @start to @end of the page as a greyscale image array, with ink at 0 and
+        background at 255, as arrayPreprocessing.preprocess_images and preprocess_bands take them.
+        '''
+        return (~self.ink_rows(start, end)).astype('uint8') * 255
+
+    def to_image(self):
+        '''
+        returns the page as a one-bit gamera image.
+        '''
+        import gamera.core as gc
+        gc.init_gamera()
+        from gamera.plugins.numpy_io import from_numpy
+        return from_numpy(self.ink_rows(0, self.nrows).astype('uint16'))
+
+
+class MappedPage(PackedPage):
+    '''
+    a page file at @path (see convert_page), memory-mapped rather than read, so that only the rows
+    actually used are ever loaded, and processes working on the same page share its data through
+    the page cache. can be passed to preprocCache.preprocess_page in place of the gamera image of
+    the text layer.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, nrows, ncols = struct.unpack(header_format, f.read(header_size))
+        if magic != page_magic:
+            raise ValueError('{} is not a page file.'.format(path))
+
+        self.path = path
+        PackedPage.__init__(self, np.memmap(path, dtype='uint8', mode='r', offset=header_size,
+            shape=(nrows, (ncols + 7) // 8)), ncols)
+
+
+def load_page(image_path, store_dir=default_store_dir, max_bytes=max_store_bytes):
+    '''
+    returns the MappedPage of the text layer image at @image_path, converting it first if needed
+    (see convert_page).
+    '''
+    return MappedPage(convert_page(image_path, store_dir, max_bytes))
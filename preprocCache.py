@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import numpy as np
+import arrayPreprocessing as apre
+import lineRecognizer as lrec
+import pageStore as pstore
+
+# where preprocessed pages are cached by default, and how large the cache may grow before the
+# least recently used pages are evicted
+default_cache_dir = './preproc_cache'
+max_cache_bytes = 2 ** 30
+
+# the preprocessing backends preprocess_page can use: gamera (textAlignPreprocessing), numpy and
+# scipy (arrayPreprocessing), or the same streaming the page through in bands of rows, for scans
+# too large to hold several copies of in memory (arrayPreprocessing.preprocess_bands)
+preproc_backends = ['gamera', 'numpy', 'bands']
+default_backend = 'gamera'
+
+# the parameters of arrayPreprocessing that preprocessing with each backend reads, and that so make
+# up the key of a page (see page_key). textAlignPreprocessing reads them from arrayPreprocessing too
+line_params = ['sat_area_thresh', 'despeckle_amt', 'noise_area_thresh', 'max_skew_angle',
+    'deskew_coarse_scale', 'deskew_refine_window', 'shear_angle_thresh', 'filter_size',
+    'prominence_tolerance', 'collision_strip_scale', 'remove_capitals_scale']
+preproc_params = {
+    'gamera': line_params,
+    'numpy': line_params,
+    'bands': line_params + ['band_rows'],
+}
+
+
+def page_key(raw_image, backend, **params):
+    '''
+    returns a hash identifying the preprocessing of @raw_image with @backend and the other keyword
+    arguments @params of preprocess_page, under the current values of the parameters of
+    arrayPreprocessing that @backend reads (see preproc_params). a pageStore.PackedPage is
+    identified by its packed bits.
+    '''
+    if isinstance(raw_image, pstore.PackedPage):
+        pixels = np.ascontiguousarray(raw_image.bits)
+    else:
+        pixels = np.ascontiguousarray(raw_image.to_numpy())
+    h = hashlib.sha1()
+    h.update(str(pixels.shape).encode('utf-8'))
+    h.update(pixels.tobytes())
+    settings = dict((x, getattr(apre, x)) for x in preproc_params[backend])
+    settings.update(params, backend=backend)
+    h.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+def array_to_image(ink):
+    '''
+    inverse of lineRecognizer.ink_mask: makes a one-bit gamera image that is black wherever @ink is.
+    '''
+    import gamera.core as gc
+    gc.init_gamera()
+    from gamera.plugins.numpy_io import from_numpy
+    return from_numpy(np.ascontiguousarray(ink, dtype='uint16'))
+
+
+class PreprocCache(object):
+    '''
+    persistent cache of preprocessed pages in the directory @path. each page is kept as a
+    bit-packed .npy file of its deskewed one-bit image, which is memory-mapped when read, and a
+    .json file holding the rotation angle, the peak locations of its text lines and the rectangles
+    of its line strips. once the stored pages grow past @max_bytes, the least recently used ones
+    are evicted.
+    '''
+
+    def __init__(self, path=default_cache_dir, max_bytes=max_cache_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def files(self, key):
+        '''
+        returns the paths of the bit-packed image and of the info file of the page with @key.
+        '''
+        return (os.path.join(self.path, key + '.npy'), os.path.join(self.path, key + '.json'))
+
+    def get(self, key):
+        '''
+        returns the (ink, angle, lines_peak_locs, rects) cached under @key, where ink is the
+        preprocessed page as a pageStore.PackedPage memory-mapped from the cache, or None if there
+        are none.
+        '''
+        bits_file, info_file = self.files(key)
+        if not (os.path.isfile(bits_file) and os.path.isfile(info_file)):
+            return None
+        with open(info_file) as f:
+            info = json.load(f)
+        ink = pstore.PackedPage(np.load(bits_file, mmap_mode='r'), info['ncols'])
+
+        # mark this page as recently used
+        os.utime(bits_file, None)
+        os.utime(info_file, None)
+        return ink, info['angle'], info['lines_peak_locs'], [tuple(x) for x in info['rects']]
+
+    def put(self, key, ink, angle, lines_peak_locs, rects):
+        '''
+        stores a preprocessed page (see get), given as a boolean ink mask or a pageStore.PackedPage,
+        under @key, evicting the least recently used pages if the cache has grown too large.
+        '''
+        if isinstance(ink, pstore.PackedPage):
+            self.put_bits(key, ink.bits, ink.ncols, angle, lines_peak_locs, rects)
+        else:
+            self.put_bits(key, np.packbits(ink, axis=1), ink.shape[1], angle, lines_peak_locs,
+                rects)
+
+    def put_bits(self, key, bits, ncols, angle, lines_peak_locs, rects):
+        '''
+        same as put, for a page @ncols wide whose ink mask is already bit-packed into @bits.
+        '''
+        bits_file, info_file = self.files(key)
+        info = {
+            'ncols': int(ncols),
+            'angle': float(angle),
+            'lines_peak_locs': [int(x) for x in lines_peak_locs],
+            'rects': [[int(x) for x in rect] for rect in rects]
+        }
+
+        # both files are written under temporary names and then moved into place, the info file
+        # last, so that get never finds a page whose files are only partly written
+        temp_file = pstore.temp_path(bits_file)
+        with open(temp_file, 'wb') as f:
+            np.save(f, bits)
+        pstore.replace_file(temp_file, bits_file)
+        temp_file = pstore.temp_path(info_file)
+        with open(temp_file, 'w') as f:
+            json.dump(info, f)
+        pstore.replace_file(temp_file, info_file)
+
+        # the image and info files of a page are always evicted together
+        entries = []
+        for fname in os.listdir(self.path):
+            if fname.endswith('.json'):
+                page_files = self.files(fname[:-len('.json')])
+                size = sum(os.path.getsize(x) for x in page_files if os.path.isfile(x))
+                entries.append((os.path.getmtime(page_files[1]), size, page_files))
+        total = sum(x[1] for x in entries)
+        for _, size, page_files in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if page_files != (bits_file, info_file):
+                for x in page_files:
+                    if os.path.isfile(x):
+                        os.remove(x)
+                total -= size
+
+
+def preprocess_page(raw_image, cache_dir=default_cache_dir, correct_rotation=True,
+        backend=default_backend):
+    '''
+    preprocesses the text layer @raw_image and finds its text lines (see preprocess_images and
+    identify_text_lines), returning (ink, angle, lines_peak_locs, rects), where @ink is the
+    preprocessed page, @angle is the rotation applied to it (0 if it was not rotated) and @rects
+    are the (offset_x, offset_y, ncols, nrows) of each line strip on it. @ink is the boolean ink
+    mask of the page, or a pageStore.PackedPage standing in for it when the page comes from the
+    cache or the bands backend, so that it is never unpacked as a whole; read its strips with
+    lineRecognizer.line_views. gamera is only used by the gamera backend. results are looked up in and
+    saved to the cache in @cache_dir, unless it is None, so that a page seen before with the same
+    parameters skips despeckling, rotation estimation and connected component analysis entirely.
+    @backend is one of preproc_backends; pages are cached separately for each.
+
+    @raw_image may also be a pageStore.MappedPage, in which case the numpy backends read its rows
+    straight from the mapped file. the bands backend finds the lines of a page along its skew; if
+    the page would have been rotated (see arrayPreprocessing.rotation_applied), its strips would
+    take in the lines next to them, so it is preprocessed again by the numpy backend instead. the
+    bands backend therefore only keeps memory bounded for pages skewed by less than
+    shear_angle_thresh: a page skewed by more is unpacked, rotated and cleaned as a whole, taking
+    as much memory as the numpy backend would.
+    '''
+    if backend not in preproc_backends:
+        raise ValueError('Unknown preprocessing backend {}: must be one of {}.'.format(
+            backend, preproc_backends))
+
+    cache = PreprocCache(cache_dir) if cache_dir else None
+    if cache_dir:
+        key = page_key(raw_image, correct_rotation=correct_rotation, backend=backend)
+    cached = cache.get(key) if cache_dir else None
+    if cached is not None:
+        return cached
+
+    if backend == 'bands':
+        # pages are not rotated when streamed, so their lines are found along the skew
+        bits, skew, lines_peak_locs, rects = apre.preprocess_bands(
+            lambda start, end: image_rows(raw_image, start, end), raw_image.nrows, raw_image.ncols,
+            band_rows=apre.band_rows, despeckle_amt=apre.despeckle_amt)
+        if apre.rotation_applied(skew, correct_rotation):
+            print('page is skewed by {} degrees: rotating it as a whole...'.format(skew))
+            del bits
+            backend = 'numpy'
+        else:
+            ink = pstore.PackedPage(bits, raw_image.ncols)
+            if cache_dir:
+                cache.put(key, ink, 0, lines_peak_locs, rects)
+            return ink, 0, lines_peak_locs, rects
+
+    if backend == 'numpy':
+        pixels = image_rows(raw_image, 0, raw_image.nrows)
+        ink, angle, lines_peak_locs, rects = preprocess_array(pixels, correct_rotation)
+    else:
+        if isinstance(raw_image, pstore.PackedPage):
+            raw_image = raw_image.to_image()
+        ink, angle, lines_peak_locs, rects = preprocess_gamera(raw_image, correct_rotation)
+
+    if cache_dir:
+        cache.put(key, ink, angle, lines_peak_locs, rects)
+    return ink, angle, lines_peak_locs, rects
+
+
+def image_rows(image, start, end):
+    '''
+    returns rows @start to @end of the gamera image or pageStore.PackedPage @image as an array,
+    without converting the rest of it.
+    '''
+    if isinstance(image, pstore.PackedPage):
+        return image.grey_rows(start, end)
+    rows = image.subimage((image.offset_x, image.offset_y + start),
+        (image.offset_x + image.ncols - 1, image.offset_y + end - 1))
+    return np.asarray(rows.to_numpy())
+
+
+def preprocess_gamera(raw_image, correct_rotation=True):
+    '''
+    preprocesses the gamera image @raw_image with textAlignPreprocessing. returns the same as
+    preprocess_page: the gamera image of the preprocessed page is only made into its ink mask.
+    '''
+    # textAlignPreprocessing initializes gamera when it is imported, which processes that only use
+    # the numpy backend never need to do
+    import textAlignPreprocessing as preproc
+    image, eroded, angle = preproc.preprocess_images(raw_image, despeckle_amt=apre.despeckle_amt,
+        correct_rotation=correct_rotation)
+
+    # pages that were left skewed have their lines found along the skew instead, and since their
+    # strips are already in the coordinates of the raw image, no rotation is returned for them
+    if not apre.rotation_applied(angle, correct_rotation):
+        cc_strips, lines_peak_locs, _ = preproc.identify_text_lines(image, eroded, skew=angle)
+        angle = 0
+    else:
+        cc_strips, lines_peak_locs, _ = preproc.identify_text_lines(image, eroded)
+    rects = [lrec.strip_rect(strip) for strip in cc_strips]
+    return lrec.ink_mask(image), angle, lines_peak_locs, rects
+
+
+def preprocess_array(pixels, correct_rotation=True):
+    '''
+    preprocesses the image array @pixels with arrayPreprocessing, without using gamera. returns the
+    same as preprocess_page.
+    '''
+    ink, eroded, angle = apre.preprocess_images(pixels, despeckle_amt=apre.despeckle_amt,
+        correct_rotation=correct_rotation)
+    if not apre.rotation_applied(angle, correct_rotation):
+        rects, lines_peak_locs, _ = apre.identify_text_lines(ink, eroded, skew=angle)
+        angle = 0
+    else:
+        rects, lines_peak_locs, _ = apre.identify_text_lines(ink, eroded)
+    return ink, angle, lines_peak_locs, rects
+
+
+def rect_strips(ink, rects):
+    '''
+    returns one-bit gamera images of the parts of the page @ink (see preprocess_page) at each of
+    @rects (see lineRecognizer.strip_rect), for OCR with ocropus-rpred. only the strips are
+    converted, not the rest of the page.
+    '''
+    return [array_to_image(line) for line in lrec.line_views(ink, rects)]
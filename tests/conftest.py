@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules of this repository are imported by name, as the scripts in it do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
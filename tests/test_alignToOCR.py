@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import random
+import alignToOCR as atocr
+import latinSyllabification as latsyl
+import textSeqCompare as tsc
+
+
+def char_tuples(all_chars):
+    return [(x.char, x.ul, x.lr) for x in all_chars]
+
+
+def reference_expansion(all_chars):
+    '''
+    the abbreviation handling of alignToOCR.process before expand_abbreviations replaced it, kept
+    as its reference: expands the first place each abbreviation is found in turn, rebuilding the
+    OCR string each time, until none is left. the abbreviations are taken longest first, since the
+    old result depended on the order of the dict where one abbreviation is part of another.
+    '''
+    abbreviations = latsyl.abbreviations
+    for abb in sorted(abbreviations, key=len, reverse=True):
+        while True:
+            ocr_str = u''.join(x.char for x in all_chars)
+            idx = ocr_str.find(abb)
+
+            if idx == -1:
+                break
+            ins = []
+
+            for i, segment in enumerate(abbreviations[abb]):
+                split_box = all_chars[i + idx]
+                ins += [atocr.CharBox(x, split_box.ul, split_box.lr) for x in segment]
+            all_chars = all_chars[:idx] + ins + all_chars[idx + len(abb):]
+    return all_chars
+
+
+def boxes(text):
+    return [atocr.CharBox(char, [10 * n, 0], [10 * n + 9, 20]) for n, char in enumerate(text)]
+
+
+def test_expansion_matches_reference():
+    # abbreviations sharing a prefix (dns, dne, dūs), contained in one another (ū in dūs) and
+    # overlapping themselves (alla) or each other
+    cases = [u'', u'dns', u'dne dns dūs', u'dnsdnedūs', u'ddns dūū', u'dū ūs', u'd^s ^^',
+        u'alla allla', u'alalla', u'dnalla', u'ā ē ō ū', u'dnē']
+    rng = random.Random(1)
+    alphabet = u'dnsūealā^ō '
+    cases += [u''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        for _ in range(2000)]
+
+    for text in cases:
+        expanded = atocr.expand_abbreviations(boxes(text))
+        # the old loop also expanded text made by an expansion, such as the last letter of
+        # alleluia with the lla after it; the single pass never does
+        if latsyl.find_abbreviations([x.char for x in expanded]):
+            continue
+        assert char_tuples(expanded) == char_tuples(reference_expansion(boxes(text)))
+
+
+def test_expansion_never_expands_its_own_output():
+    expanded = atocr.expand_abbreviations(boxes(u'allalla'))
+    assert u''.join(x.char for x in expanded) == u'alleluialla'
+    assert u''.join(x.char for x in reference_expansion(boxes(u'allalla'))) == \
+        u'alleluialleluia'
+
+
+def test_line_aligner_matches_alignment_of_whole_page():
+    transcript = u'dominus deus alleluia dominus tecum dominum'
+    # abbreviations run across the ends of lines as well as within them
+    lines = [u'dorninus d', u'ns dcus alla', u' dūs tecū d', u'ne', u'', u'dnm']
+    rng = random.Random(0)
+    lines_locs = [[(char, rng.randint(5, 15) * (k + 1)) for k, char in enumerate(line)]
+        for line in lines]
+    rects = [(20, 60 * n, 400, 40) for n in range(len(lines))]
+
+    all_chars = []
+    for locs, rect in zip(lines_locs, rects):
+        all_chars += atocr.line_char_boxes(locs, rect)
+    all_chars = atocr.expand_abbreviations(all_chars)
+    ocr = [x.char for x in all_chars]
+
+    for seq_align_params in [None, [10, -5, -7, -3], {'semiglobal': True}]:
+        aligner = atocr.line_aligner(transcript, seq_align_params)
+        for locs, rect in zip(lines_locs, rects):
+            aligner.add_line(locs, rect)
+        line_chars, moves = aligner.finish()
+
+        assert char_tuples(line_chars) == char_tuples(all_chars)
+        assert moves == tsc.alignment_moves(list(transcript), ocr,
+            **atocr.alignment_options(seq_align_params))
+
+
+def test_line_aligner_waits_for_lines_in_order():
+    lines_locs = [[(u'a', 10)], None, [(u'c', 10)]]
+    rects = [(0, 0, 50, 20), (0, 30, 50, 20), (0, 60, 50, 20)]
+    aligner = atocr.line_aligner(u'abc')
+    aligner.add_lines(lines_locs, rects)
+    assert aligner.num_lines == 1
+
+    lines_locs[1] = [(u'b', 10)]
+    aligner.add_lines(lines_locs, rects)
+    all_chars, moves = aligner.finish()
+    assert [x.char for x in all_chars] == [u'a', u'b', u'c']
+    assert moves == [0, 0, 0]
+
+
+def test_line_aligner_only_for_alignments_found_by_line():
+    assert atocr.line_aligner(u'abc', {'scoring_system': None, 'banded': False}) is not None
+    assert atocr.line_aligner(u'abc', {'banded': True}) is None
+    assert atocr.line_aligner(u'abc', {'anchored': True}) is None
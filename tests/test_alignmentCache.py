@@ -0,0 +1,30 @@
+import alignmentCache as acache
+
+
+def test_moves_round_trip():
+    moves = [0, 0, 1, 1, 1, 2, 0, 2, 2, 0]
+    assert acache.decode_moves(acache.encode_moves(moves)) == moves
+
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+    with acache.BlobCache(path, 1000, 'blobs', commit_every=7) as cache:
+        for i in range(20):
+            cache.put_blob('k{}'.format(i), b'x' * 100)
+            # keep the first value in use, so that it outlives the others
+            assert cache.get_blob('k0') is not None
+        assert cache.total == cache.stored_bytes() <= 1000
+
+    with acache.BlobCache(path, 1000, 'blobs') as cache:
+        assert cache.get_blob('k0') is not None
+        assert cache.get_blob('k19') is not None
+        assert cache.get_blob('k1') is None
+        assert cache.total == cache.stored_bytes()
+
+
+def test_alignment_cache_matches_alignment(tmpdir):
+    transcript, ocr = list('dominus deus'), list('dorninus dcus')
+    with acache.AlignmentCache(str(tmpdir.join('cache.sqlite'))) as cache:
+        first = cache.perform_alignment(transcript, ocr)
+        assert cache.perform_alignment(transcript, ocr) == first
+    assert acache.tsc.perform_alignment(transcript, ocr) == first
@@ -0,0 +1,131 @@
+import numpy as np
+import arrayPreprocessing as apre
+
+
+def reference_prominence(data, index):
+    '''
+    the peak prominence of textAlignPreprocessing before calculate_prominences replaced it, kept as
+    its reference: returns the log of the prominence of the peak at a given index in a given
+    dataset, scanning the whole dataset for the nearest higher peak.
+    '''
+    current_peak = data[index]
+
+    # ignore values at either end of the dataset or values that are not local maxima
+    if (index == 0 or
+            index == len(data) - 1 or
+            data[index - 1] > current_peak or
+            data[index + 1] > current_peak or
+            (data[index - 1] == current_peak and data[index + 1] == current_peak)):
+        return 0
+
+    # by definition, the prominence of the highest value in a dataset is equal to the value itself
+    if current_peak == max(data):
+        return np.log(current_peak)
+
+    # find index of nearest maxima which is higher than the current peak
+    higher_peaks_inds = [i for i, x in enumerate(data) if x > current_peak]
+
+    right_peaks = [x for x in higher_peaks_inds if x > index]
+    if right_peaks:
+        closest_right_ind = min(right_peaks)
+    else:
+        closest_right_ind = np.inf
+
+    left_peaks = [x for x in higher_peaks_inds if x < index]
+    if left_peaks:
+        closest_left_ind = max(left_peaks)
+    else:
+        closest_left_ind = -np.inf
+
+    right_distance = closest_right_ind - index
+    left_distance = index - closest_left_ind
+
+    if (right_distance) > (left_distance):
+        closest = closest_left_ind
+    else:
+        closest = closest_right_ind
+
+    # find the value at the lowest point between the nearest higher peak (the key col)
+    lo = min(closest, index)
+    hi = max(closest, index)
+    between_slice = data[lo:hi]
+    key_col = min(between_slice)
+
+    prominence = np.log(data[index] - key_col + 1)
+
+    return prominence
+
+
+def reference_coincide(hline_position, comp_offset, comp_nrows, collision):
+    '''
+    the check of textAlignPreprocessing before coinciding_components replaced it, kept as its
+    reference: returns whether any part of the component with the given vertical measurements lies
+    within the strip around @hline_position.
+    '''
+    collision *= apre.collision_strip_scale
+
+    component_top = comp_offset
+    component_bottom = comp_offset + comp_nrows
+
+    strip_top = hline_position - int(collision / 2)
+    strip_bottom = hline_position + int(collision / 2)
+
+    both_above = component_top < strip_top and component_bottom < strip_top
+    both_below = component_top > strip_bottom and component_bottom > strip_bottom
+
+    return (not both_above and not both_below)
+
+
+def reference_moving_avg(data, filter_size):
+    '''
+    moving_avg_filter of textAlignPreprocessing before it used cumulative sums, kept as its
+    reference: the mean of each window, with values within @filter_size of either end left zero.
+    '''
+    smoothed = np.zeros(len(data))
+    for n in range(filter_size, len(data) - filter_size):
+        vals = data[n - filter_size: n + filter_size + 1]
+        smoothed[n] = np.mean(vals)
+    return smoothed
+
+
+def test_prominences_match_reference():
+    rs = np.random.RandomState(0)
+    datasets = [[], [3], [1, 2], [1, 3, 3, 3, 1], [5, 1, 5, 1, 5]]
+    datasets += [list(rs.randint(0, 6, size=rs.randint(3, 60))) for _ in range(300)]
+    datasets += [list(apre.moving_avg_filter(rs.randint(0, 40, size=400), 5)) for _ in range(20)]
+    for data in datasets:
+        assert apre.calculate_prominences(data) == [reference_prominence(data, i)
+            for i in range(len(data))]
+
+
+def test_coinciding_components_match_reference():
+    rs = np.random.RandomState(1)
+    for _ in range(50):
+        num_comps = rs.randint(0, 40)
+        offsets = rs.randint(0, 500, size=num_comps)
+        nrows = rs.randint(1, 80, size=num_comps)
+        hlines = sorted(rs.randint(0, 550, size=rs.randint(1, 8)))
+        collision = rs.randint(1, 60)
+        coinciding = apre.coinciding_components(hlines, offsets, nrows, collision)
+        for hline, comps in zip(hlines, coinciding):
+            assert list(comps) == [i for i in range(num_comps)
+                if reference_coincide(hline, offsets[i], nrows[i], collision)]
+
+
+def test_moving_avg_matches_reference():
+    rs = np.random.RandomState(2)
+    for _ in range(100):
+        filter_size = rs.randint(0, 12)
+        size = rs.randint(0, 300)
+        # integer projections, which is what the preprocessing smooths, give exactly the same means
+        ints = rs.randint(0, 3000, size=size)
+        assert np.array_equal(apre.moving_avg_filter(ints, filter_size),
+            reference_moving_avg(ints, filter_size))
+        # floats are summed in a different order, so they agree only up to rounding
+        floats = rs.rand(size) * 1000
+        assert np.allclose(apre.moving_avg_filter(floats, filter_size),
+            reference_moving_avg(floats, filter_size), rtol=1e-12, atol=1e-9)
+
+    rows = rs.randint(0, 50, size=(7, 80))
+    assert np.array_equal(apre.moving_avg_filter_rows(rows, 5),
+        [reference_moving_avg(row, 5) for row in rows])
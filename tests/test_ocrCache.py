@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import ocrCache as ocache
+
+
+def test_locs_round_trip():
+    locs = [(u'd', 12.3), (u'o', 20.0), (u'ā', 31.7)]
+    assert ocache.decode_locs(ocache.encode_locs(locs)) == locs
+
+
+def test_line_key_depends_on_pixels_model_and_engine():
+    ink = np.zeros((5, 8), dtype=bool)
+    ink[2, 3] = True
+    key = ocache.line_key(ink, 'model', 'engine')
+    assert ocache.line_key(ink.copy(), 'model', 'engine') == key
+
+    moved = np.zeros_like(ink)
+    moved[2, 4] = True
+    assert ocache.line_key(moved, 'model', 'engine') != key
+    assert ocache.line_key(ink.reshape(8, 5), 'model', 'engine') != key
+    assert ocache.line_key(ink, 'other model', 'engine') != key
+    assert ocache.line_key(ink, 'model', 'other engine') != key
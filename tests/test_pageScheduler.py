@@ -0,0 +1,114 @@
+import os
+import numpy as np
+import alignmentCache as acache
+import alignToOCR as atocr
+import lineRecognizer as lrec
+import pageScheduler as ps
+import pageStore as pstore
+import preprocCache as pcache
+import textSeqCompare as tsc
+
+# every line strip is read as this
+line_text = u'dominus '
+
+# strips narrower than this are the ones the stub recognizer fails on
+narrow_line = 400
+
+
+class StubRecognizer(object):
+    '''
+    reads every line strip as line_text, spread evenly along the strip, except that it fails on
+    narrow strips: by raising, or, if @die is set, by killing the worker it runs in.
+    '''
+
+    def __init__(self, die=False):
+        self.die = die
+
+    def recognize(self, grey):
+        if grey.shape[1] < narrow_line:
+            if self.die:
+                os._exit(1)
+            raise ValueError('unreadable line')
+        step = grey.shape[1] // len(line_text)
+        return [(char, step * k + step // 2) for k, char in enumerate(line_text)]
+
+
+def lines_page(tmpdir, name, widths):
+    '''
+    a page with a line of random letter-sized blocks of ink for each of @widths, as a MappedPage.
+    '''
+    rs = np.random.RandomState(len(widths))
+    ink = np.zeros((100 * len(widths) + 60, 800), dtype=bool)
+    for line_ind, width in enumerate(widths):
+        y = 80 + 100 * line_ind
+        x = 40
+        while x < 40 + width:
+            letter = rs.randint(12, 30)
+            height = rs.randint(30, 40)
+            ink[y - height // 2:y + height // 2, x:x + letter] = True
+            x += letter + rs.randint(5, 25)
+    path = str(tmpdir.join(name))
+    pstore.write_page(path, ink)
+    return pstore.MappedPage(path)
+
+
+def run_pages(pages, monkeypatch, die=False, **kwargs):
+    monkeypatch.setattr(lrec, 'get_recognizer', lambda model: StubRecognizer(die))
+    results = ps.process_pages(pages, 'stub.pyrnn', workers=2, ocr_cache=None,
+        preproc_cache=None, preproc_backend='numpy', **kwargs)
+    return dict(results)
+
+
+def whole_page_alignment(page, transcript):
+    '''
+    what process_pages should find for @page, aligning all of its lines at once.
+    '''
+    ink, angle, lines_peak_locs, rects = pcache.preprocess_page(page, None, backend='numpy')
+    all_chars = []
+    for line, rect in zip(lrec.line_views(ink, rects), rects):
+        all_chars += atocr.line_char_boxes(StubRecognizer().recognize(1.0 - line), rect)
+    all_chars = atocr.expand_abbreviations(all_chars)
+    syl_boxes = atocr.align_page(transcript, all_chars, angle, pstore.page_dim(ink), page.dim,
+        alignment_cache=None)
+    return syl_boxes, all_chars
+
+
+def syl_tuples(syl_boxes):
+    return [(x.char, x.ul, x.lr) for x in syl_boxes]
+
+
+def test_process_pages_skips_only_page_with_failed_line(tmpdir, monkeypatch):
+    transcript = u'dominus dominus dominus'
+    pages = [lines_page(tmpdir, 'good.page', [700, 700, 700]),
+        lines_page(tmpdir, 'bad.page', [700, 200, 700, 700])]
+    cache_path = str(tmpdir.join('alignment.sqlite'))
+    results = run_pages([(page, transcript) for page in pages], monkeypatch,
+        alignment_cache=cache_path)
+
+    assert sorted(results) == [0, 1]
+    assert results[1] is None
+
+    syl_boxes, ink, lines_peak_locs, all_chars = results[0]
+    expected_syl_boxes, expected_chars = whole_page_alignment(pages[0], transcript)
+    assert [(x.char, x.ul, x.lr) for x in all_chars] == \
+        [(x.char, x.ul, x.lr) for x in expected_chars]
+    assert syl_tuples(syl_boxes) == syl_tuples(expected_syl_boxes)
+    assert [x.char for x in syl_boxes] == [u'do', u'mi', u'nus'] * 3
+
+    # the alignment found a line at a time is the one saved for the page
+    ocr = [x.char for x in all_chars]
+    with acache.AlignmentCache(cache_path) as cache:
+        moves = cache.get(acache.alignment_key(list(transcript), ocr))
+    assert moves == tsc.alignment_moves(list(transcript), ocr)
+
+
+def test_process_pages_gives_up_on_line_whose_worker_died(tmpdir, monkeypatch):
+    monkeypatch.setattr(ps, 'poll_interval', 0.1)
+    transcript = u'dominus dominus'
+    pages = [lines_page(tmpdir, 'bad.page', [200, 700]),
+        lines_page(tmpdir, 'good.page', [700, 700])]
+    results = run_pages([(page, transcript) for page in pages], monkeypatch, die=True,
+        alignment_cache=None, timeout=2)
+
+    assert results[0] is None
+    assert [x.char for x in results[1][0]] == [u'do', u'mi', u'nus'] * 2
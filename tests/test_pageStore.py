@@ -0,0 +1,32 @@
+import os
+import time
+import numpy as np
+import pageStore as pstore
+
+
+def test_page_path_tells_scans_apart(tmpdir):
+    first = tmpdir.mkdir('a').join('folio_001.png')
+    second = tmpdir.mkdir('b').join('folio_001.png')
+    first.write(b'one scan')
+    second.write(b'one scan')
+    path = pstore.page_path(str(first))
+    assert os.path.basename(path).startswith('folio_001.')
+    assert pstore.page_path(str(first)) == path
+    assert pstore.page_path(str(second)) != path
+
+    first.write(b'the same scan, edited')
+    assert pstore.page_path(str(first)) != path
+
+
+def test_evict_pages_removes_least_recently_used(tmpdir):
+    ink = np.ones((8, 64), dtype=bool)
+    paths = [str(tmpdir.join('{}.page'.format(i))) for i in range(5)]
+    for i, path in enumerate(paths):
+        pstore.write_page(path, ink)
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+    page_bytes = os.path.getsize(paths[0])
+
+    # page 0 is the oldest, but is kept as the page just written
+    pstore.evict_pages(str(tmpdir), 3 * page_bytes, keep_path=paths[0])
+    assert [os.path.exists(x) for x in paths] == [True, False, False, True, True]
+    assert np.array_equal(pstore.MappedPage(paths[0]).ink_rows(0, 8), ink)
@@ -0,0 +1,145 @@
+import os
+import numpy as np
+import pytest
+import arrayPreprocessing as apre
+import lineRecognizer as lrec
+import pageStore as pstore
+import preprocCache as pcache
+
+
+def text_page(nrows=600, ncols=800, skew=0, seed=0):
+    '''
+    a page of lines of random letter-sized blocks of ink, skewed by @skew degrees.
+    '''
+    rs = np.random.RandomState(seed)
+    shifts = apre.line_shifts(ncols, skew)
+    ink = np.zeros((nrows, ncols), dtype=bool)
+    for y in range(60, nrows - 60, 100):
+        x = 40
+        while x < ncols - 60:
+            width = rs.randint(12, 30)
+            height = rs.randint(30, 40)
+            for col in range(x, x + width):
+                top = y - height // 2 - shifts[col]
+                ink[top:top + height, col] = True
+            x += width + rs.randint(5, 25)
+    return ink
+
+
+def mapped_page(tmpdir, ink):
+    path = str(tmpdir.join('page.page'))
+    pstore.write_page(path, ink)
+    return pstore.MappedPage(path)
+
+
+def test_page_key_follows_every_parameter(tmpdir, monkeypatch):
+    ink = np.random.RandomState(0).rand(20, 30) > 0.8
+    page = mapped_page(tmpdir, ink)
+
+    for backend, params in pcache.preproc_params.items():
+        key = pcache.page_key(page, backend, correct_rotation=True)
+        assert pcache.page_key(page, backend, correct_rotation=False) != key
+        for name in params:
+            with monkeypatch.context() as m:
+                m.setattr(apre, name, getattr(apre, name) + 1)
+                assert pcache.page_key(page, backend, correct_rotation=True) != key
+    assert pcache.page_key(page, 'numpy') != pcache.page_key(page, 'gamera')
+
+
+def test_cache_round_trip(tmpdir):
+    ink = np.random.RandomState(1).rand(9, 21) > 0.5
+    cache = pcache.PreprocCache(str(tmpdir.join('cache')))
+    cache.put('key', ink, 0.5, [3, 7], [(0, 1, 21, 4)])
+
+    cached_ink, angle, lines_peak_locs, rects = cache.get('key')
+    assert np.array_equal(cached_ink[:], ink)
+    assert (angle, lines_peak_locs, rects) == (0.5, [3, 7], [(0, 1, 21, 4)])
+    assert sorted(os.listdir(cache.path)) == ['key.json', 'key.npy']
+
+
+def test_packed_page_strips():
+    ink = text_page()
+    page = pstore.PackedPage(np.packbits(ink, axis=1), ink.shape[1])
+    assert page.shape == ink.shape
+    assert np.array_equal(page[:], ink)
+    assert np.array_equal(page[10:200:3, 5:-7], ink[10:200:3, 5:-7])
+    assert page[50:20].shape == (0, ink.shape[1])
+
+    rects = [(40, 35, 300, 50), (0, 0, 1, 1), (700, 500, 100, 100)]
+    lines = lrec.line_views(page, rects)
+    assert len(lines) == len(rects)
+    for line, expected in zip(lines, lrec.line_views(ink, rects)):
+        assert np.array_equal(line, expected)
+
+
+def test_numpy_backends_never_unpack_cached_pages(tmpdir):
+    page = mapped_page(tmpdir, text_page())
+    cache_dir = str(tmpdir.join('cache'))
+    for backend in ['numpy', 'bands']:
+        ink, angle, lines_peak_locs, rects = pcache.preprocess_page(page, cache_dir, backend=backend)
+        assert isinstance(ink, pstore.PackedPage if backend == 'bands' else np.ndarray)
+        assert ink.shape == (page.nrows, page.ncols)
+        assert len(rects) == len(lines_peak_locs) > 0
+
+        cached = pcache.preprocess_page(page, cache_dir, backend=backend)
+        assert isinstance(cached[0], pstore.PackedPage)
+        assert np.array_equal(cached[0][:], ink[:])
+        assert cached[1:] == (angle, lines_peak_locs, rects)
+
+
+def test_bands_find_the_lines_numpy_does(tmpdir):
+    # pages several bands tall, straight and skewed too little to be rotated
+    for skew in [0, 0.15]:
+        page = mapped_page(tmpdir, text_page(nrows=1400, skew=skew))
+        banded = pcache.preprocess_page(page, None, backend='bands')
+        whole = pcache.preprocess_page(page, None, backend='numpy')
+        assert isinstance(banded[0], pstore.PackedPage)
+        assert np.array_equal(banded[0][:], whole[0])
+        assert banded[1:] == whole[1:]
+        assert len(banded[3]) > 10
+
+def test_bands_rotate_pages_too_skewed_for_strips(tmpdir):
+    page = mapped_page(tmpdir, text_page(skew=2))
+    banded = pcache.preprocess_page(page, None, backend='bands')
+    whole = pcache.preprocess_page(page, None, backend='numpy')
+    assert abs(banded[1]) > apre.shear_angle_thresh
+    assert np.array_equal(banded[0], whole[0])
+    assert banded[1:] == whole[1:]
+
+
+def gamera_page(ink):
+    '''
+    the boolean ink mask @ink as a greyscale gamera image, with a few specks of noise for
+    despeckling to remove.
+    '''
+    gc = pytest.importorskip('gamera.core')
+    gc.init_gamera()
+    from gamera.plugins import numpy_io
+    pixels = np.where(ink, 0, 255).astype('uint8')
+    specks = np.random.RandomState(3).rand(*ink.shape) > 0.999
+    pixels[specks] = 255 - pixels[specks]
+    return numpy_io.from_numpy(pixels)
+
+
+def test_numpy_backend_finds_the_lines_gamera_does():
+    page = gamera_page(text_page())
+    ink, angle, lines_peak_locs, rects = pcache.preprocess_page(page, None, backend='gamera')
+    numpy_ink, numpy_angle, numpy_peak_locs, numpy_rects = pcache.preprocess_page(page, None,
+        backend='numpy')
+    assert angle == numpy_angle == 0
+    assert np.array_equal(numpy_ink, ink)
+    assert numpy_peak_locs == lines_peak_locs
+    assert numpy_rects == rects
+
+
+def test_numpy_backend_rotates_the_pages_gamera_does():
+    # the backends estimate skew and rotate differently (see arrayPreprocessing), so on a rotated
+    # page only the angle, to within a step of either search, and the lines found are compared
+    page = gamera_page(text_page(skew=2))
+    _, angle, lines_peak_locs, rects = pcache.preprocess_page(page, None, backend='gamera')
+    _, numpy_angle, numpy_peak_locs, numpy_rects = pcache.preprocess_page(page, None,
+        backend='numpy')
+    assert apre.rotation_applied(angle) and apre.rotation_applied(numpy_angle)
+    assert abs(angle - numpy_angle) < 0.1
+    assert len(numpy_rects) == len(rects)
+    assert np.allclose(numpy_peak_locs, lines_peak_locs, atol=3)
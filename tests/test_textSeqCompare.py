@@ -0,0 +1,340 @@
+import random
+import pytest
+import textSeqCompare as tsc
+
+alphabet = 'abcdefgh '
+
+# characters that ocr_confusions pairs up, for the confusion scoring tests
+confused_alphabet = 'aceilmnortu '
+
+
+def reference_alignment(transcript, ocr, scoring_system, semiglobal=False):
+    '''
+    the original cell-by-cell alignment, which the vectorized fill must reproduce exactly,
+    including how ties are broken under scores that are not integers. @scoring_system is either
+    [match, mismatch, gap_open_x, gap_open_y, gap_extend_x, gap_extend_y] or the same with a
+    match_func(a, b) in place of the first two, evaluated for every cell as the original was.
+    if @semiglobal is set, the top row costs nothing and the traceback starts from the best cell of
+    the bottom row, leftmost first, as alignment_moves does.
+    '''
+    if callable(scoring_system[0]):
+        score_method = scoring_system[0]
+    else:
+        match, mismatch = scoring_system[:2]
+        score_method = lambda a, b: match if a == b else mismatch
+    gap_open_x, gap_open_y, gap_extend_x, gap_extend_y = scoring_system[-4:]
+    transcript = transcript + [' ']
+    ocr = ocr + [' ']
+    rows, cols = len(transcript), len(ocr)
+
+    mat = [[0.0] * cols for _ in range(rows)]
+    x_mat = [[0.0] * cols for _ in range(rows)]
+    y_mat = [[0.0] * cols for _ in range(rows)]
+    ptrs = [[None] * cols for _ in range(rows)]
+    for i in range(rows):
+        mat[i][0] = y_mat[i][0] = tsc.gap_extend * i
+        x_mat[i][0] = -1e100
+    for j in range(cols):
+        mat[0][j] = x_mat[0][j] = 0 if semiglobal else tsc.gap_extend * j
+        y_mat[0][j] = -1e100
+
+    for i in range(1, rows):
+        for j in range(1, cols):
+            score = score_method(transcript[i - 1], ocr[j - 1])
+            mat_vals = [mat[i - 1][j - 1], x_mat[i - 1][j - 1], y_mat[i - 1][j - 1]]
+            y_vals = [mat[i][j - 1] + gap_open_y + gap_extend_y,
+                      x_mat[i][j - 1] + gap_open_y + gap_extend_y,
+                      y_mat[i][j - 1] + gap_extend_y]
+            x_vals = [mat[i - 1][j] + gap_open_x + gap_extend_x,
+                      x_mat[i - 1][j] + gap_extend_x,
+                      y_mat[i - 1][j] + gap_open_x + gap_extend_x]
+            mat[i][j] = max(mat_vals) + score
+            y_mat[i][j] = max(y_vals)
+            x_mat[i][j] = max(x_vals)
+            ptrs[i][j] = [vals.index(max(vals)) for vals in (mat_vals, x_vals, y_vals)]
+
+    tra_align, ocr_align = [], []
+    xpt, ypt = rows - 1, cols - 1
+    if semiglobal:
+        ends = [(vals[xpt][j], -j, -m) for j in range(cols) for m, vals in
+            enumerate((mat, x_mat, y_mat))]
+        _, ypt, mpt = max(ends)
+        ypt, mpt = -ypt, -mpt
+        tra_align += ['_'] * (cols - 1 - ypt)
+        ocr_align += ocr[ypt:cols - 1][::-1]
+    else:
+        mpt = ptrs[xpt][ypt][0]
+    while xpt > 0 and ypt > 0:
+        next_mpt = ptrs[xpt][ypt][mpt]
+        if mpt == 0:
+            tra_align.append(transcript[xpt - 1])
+            ocr_align.append(ocr[ypt - 1])
+            xpt, ypt = xpt - 1, ypt - 1
+        elif mpt == 1:
+            tra_align.append(transcript[xpt - 1])
+            ocr_align.append('_')
+            xpt -= 1
+        else:
+            tra_align.append('_')
+            ocr_align.append(ocr[ypt - 1])
+            ypt -= 1
+        mpt = next_mpt
+    tra_align += ['_'] * ypt + transcript[:xpt][::-1]
+    ocr_align += ocr[:ypt][::-1] + ['_'] * xpt
+    return tra_align[::-1], ocr_align[::-1]
+
+
+def garble(seq, rng):
+    '''
+    returns @seq with characters dropped, replaced and inserted, as OCR would.
+    '''
+    out = []
+    for char in seq:
+        r = rng.random()
+        if r < 0.1:
+            continue
+        out.append(rng.choice(alphabet) if r < 0.2 else char)
+        if rng.random() < 0.1:
+            out.append(rng.choice(alphabet))
+    return out or ['a']
+
+
+def random_pairs(num, max_len, seed=0, chars=alphabet):
+    rng = random.Random(seed)
+    for _ in range(num):
+        transcript = [rng.choice(chars) for _ in range(rng.randint(1, max_len))]
+        yield transcript, garble(transcript, rng)
+
+
+@pytest.mark.parametrize('scoring_system', [
+    [8, -4, -7, -7, -3, 0],
+    [1.5, -0.7, -2.3, -2.3, -0.1, -0.1],
+    [0.9, -0.3, -1.1, -0.2, -0.7, -0.05],
+])
+def test_matches_cell_by_cell_alignment(scoring_system):
+    for transcript, ocr in random_pairs(150, 40):
+        expected = reference_alignment(transcript, ocr, scoring_system)
+        assert tsc.perform_alignment(transcript, ocr, scoring_system) == expected
+        assert tsc.perform_alignment(transcript, ocr, scoring_system,
+            linear_memory=True) == expected
+
+
+@pytest.mark.parametrize('scoring_system', [
+    [8, -4, -7, -7, -3, 0],
+    [1.5, -0.7, -2.3, -2.3, -0.1, -0.1],
+    [0.9, -0.3, -1.1, -0.2, -0.7, -0.05],
+])
+def test_semiglobal_matches_cell_by_cell_alignment(scoring_system):
+    rng = random.Random(6)
+    for transcript, ocr in random_pairs(100, 40, seed=6):
+        ocr = [rng.choice(alphabet) for _ in range(rng.randint(0, 8))] + ocr + \
+            [rng.choice(alphabet) for _ in range(rng.randint(0, 8))]
+        expected = reference_alignment(transcript, ocr, scoring_system, semiglobal=True)
+        assert tsc.perform_alignment(transcript, ocr, scoring_system, semiglobal=True) == expected
+        assert tsc.perform_alignment(transcript, ocr, scoring_system, semiglobal=True,
+            linear_memory=True) == expected
+
+
+def test_semiglobal_skips_ocr_junk_for_free():
+    scoring_system = [8, -4, -7, -7, -3, 0]
+    rng = random.Random(8)
+    transcript = [rng.choice(alphabet) for _ in range(200)]
+    for before, after in [(0, 0), (1, 0), (0, 1), (30, 12), (75, 90)]:
+        # folio numbers and rubrics share no characters with the transcript
+        ocr = [rng.choice('0123456789') for _ in range(before)] + transcript + \
+            [rng.choice('0123456789') for _ in range(after)]
+        moves = tsc.alignment_moves(transcript, ocr, scoring_system, semiglobal=True)
+        assert tsc.render_alignment(transcript, ocr, moves) == \
+            (['_'] * before + transcript + ['_'] * after, ocr)
+        assert path_score(transcript, ocr, moves, scoring_system, semiglobal=True) == \
+            scoring_system[0] * len(transcript)
+
+
+@pytest.mark.parametrize('scoring_method', [
+    (8, -4),
+    (1.5, -0.7),
+    tsc.confusion_scoring_method(),
+    tsc.confusion_scoring_method(2.5, -1.5, confusion=0.5, confusions=[('a', 'b'), ('c', ' ')]),
+])
+def test_compiled_matrix_matches_scoring_method(scoring_method):
+    if callable(scoring_method):
+        score_method = scoring_method
+    else:
+        score_method = lambda a, b: scoring_method[0] if a == b else scoring_method[1]
+    for transcript, ocr in random_pairs(30, 40, seed=2, chars=confused_alphabet):
+        _, sub_matrix, transcript_codes, ocr_codes = tsc.compile_scoring_system(transcript, ocr,
+            scoring_method)
+        compiled = sub_matrix[transcript_codes[:, None], ocr_codes]
+        assert compiled.tolist() == [[score_method(a, b) for b in ocr] for a in transcript]
+
+
+def test_confusion_scoring_method():
+    score_method = tsc.confusion_scoring_method(8, -4, confusion=-1)
+    for a, b in tsc.ocr_confusions:
+        assert score_method(a, b) == score_method(b, a) == -1
+        assert score_method(a, a) == score_method(b, b) == 8
+    assert score_method('c', 'u') == score_method('o', 'i') == -4
+
+
+def test_confusion_alignment_matches_cell_by_cell():
+    scoring_system = [tsc.confusion_scoring_method(8, -4, confusion=2), -7, -7, -3, 0]
+    for transcript, ocr in random_pairs(100, 40, seed=3, chars=confused_alphabet):
+        expected = reference_alignment(transcript, ocr, scoring_system)
+        assert tsc.perform_alignment(transcript, ocr, scoring_system) == expected
+
+
+def test_batch_matches_single_alignments():
+    grid = [[8, -4, -7, -7, -3, 0], [1.5, -0.7, -2.3, -0.1], [2.2, -1.3, -0.4, -3.1, -0.3, -0.6]]
+    for transcript, ocr in random_pairs(50, 60, seed=1):
+        batch = tsc.batch_alignment_moves(transcript, ocr, grid)
+        assert [list(x) for x in batch] == [tsc.alignment_moves(transcript, ocr, x) for x in grid]
+
+
+def path_score(transcript, ocr, moves, scoring_system, semiglobal=False):
+    '''
+    the score of the alignment given by the traceback @moves (see render_alignment), following
+    the path from the top-left corner of the matrices as the fill does. if @semiglobal is set,
+    ocr skipped before the transcript starts and after it ends costs nothing.
+    '''
+    match, mismatch, gap_open_x, gap_open_y, gap_extend_x, gap_extend_y = scoring_system
+    never = -float('inf')
+    if semiglobal:
+        skipped = next((n for n, move in enumerate(moves) if move != 2), len(moves))
+        ocr, moves = ocr[:len(ocr) - skipped], moves[skipped:]
+    i = j = 0
+    vals = [0, 0, never]
+    for move in reversed(moves):
+        if i == 0 and move == 2:
+            j += 1
+            top = 0 if semiglobal else tsc.gap_extend * j
+            vals = [top, top, never]
+        elif j == 0 and move == 1:
+            i += 1
+            vals = [tsc.gap_extend * i, never, tsc.gap_extend * i]
+        elif move == 0:
+            score = match if transcript[i] == ocr[j] else mismatch
+            vals = [max(vals) + score, never, never]
+            i, j = i + 1, j + 1
+        elif move == 1:
+            vals = [never, max(vals[0] + gap_open_x + gap_extend_x, vals[1] + gap_extend_x,
+                vals[2] + gap_open_x + gap_extend_x), never]
+            i += 1
+        else:
+            vals = [never, never, max(vals[0] + gap_open_y + gap_extend_y,
+                vals[1] + gap_open_y + gap_extend_y, vals[2] + gap_extend_y)]
+            j += 1
+    assert (i, j) == (len(transcript), len(ocr))
+    return max(vals)
+
+
+@pytest.mark.parametrize('band_margin', [0, 1, 3, 50])
+def test_banded_scores_as_well_as_full(monkeypatch, band_margin):
+    monkeypatch.setattr(tsc, 'band_margin', band_margin)
+    scoring_system = [8, -4, -7, -7, -3, 0]
+    rng = random.Random(band_margin)
+    for transcript, ocr in random_pairs(60, 150, seed=band_margin):
+        # a missed stretch of text and some marginalia put the path far from the diagonal
+        cut = rng.randint(0, len(ocr))
+        noise = [rng.choice(alphabet) for _ in range(rng.randint(0, 50))]
+        ocr = ocr[:cut] + noise + ocr[cut + rng.randint(0, 40):] or ['a']
+
+        full = tsc.alignment_moves(transcript, ocr, scoring_system)
+        banded = tsc.alignment_moves(transcript, ocr, scoring_system, banded=True)
+        assert path_score(transcript, ocr, banded, scoring_system) == \
+            path_score(transcript, ocr, full, scoring_system)
+
+
+def test_banded_page_with_missed_line():
+    rng = random.Random(7)
+    scoring_system = [8, -4, -7, -7, -3, 0]
+    transcript = [rng.choice(alphabet) for _ in range(1500)]
+    ocr = garble(transcript[:600] + transcript[780:], rng) + \
+        [rng.choice(alphabet) for _ in range(180)]
+
+    full = tsc.alignment_moves(transcript, ocr, scoring_system)
+    banded = tsc.alignment_moves(transcript, ocr, scoring_system, banded=True)
+    assert path_score(transcript, ocr, banded, scoring_system) == \
+        path_score(transcript, ocr, full, scoring_system)
+
+
+def test_banded_accepts_typical_page_on_first_band(monkeypatch):
+    bands = []
+    trace_banded = tsc.trace_banded
+
+    def counted_trace_banded(profile, ocr_codes, gaps, bounds, *args):
+        bands.append(bounds)
+        return trace_banded(profile, ocr_codes, gaps, bounds, *args)
+
+    monkeypatch.setattr(tsc, 'trace_banded', counted_trace_banded)
+    rng = random.Random(11)
+    scoring_system = [8, -4, -7, -7, -3, 0]
+    transcript = [rng.choice(alphabet) for _ in range(3000)]
+    ocr = garble(transcript, rng)
+
+    full = tsc.alignment_moves(transcript, ocr, scoring_system)
+    banded = tsc.alignment_moves(transcript, ocr, scoring_system, banded=True)
+    assert len(bands) == 1
+    assert max(hi - lo for lo, hi in bands[0]) < len(transcript) // 10
+    assert path_score(transcript, ocr, banded, scoring_system) == \
+        path_score(transcript, ocr, full, scoring_system)
+
+
+def test_find_anchors_are_unique_increasing_matches():
+    k = tsc.anchor_kmer
+
+    def starts(seq, kmer):
+        return [i for i in range(len(seq) - k + 1) if seq[i:i + k] == kmer]
+
+    num_anchors = 0
+    for transcript, ocr in random_pairs(50, 400, seed=4):
+        anchors = tsc.find_anchors(transcript, ocr)
+        num_anchors += len(anchors)
+        for (t, o, length), (next_t, next_o, _) in zip(anchors, anchors[1:]):
+            assert next_t >= t + length and next_o >= o + length
+        for t, o, length in anchors:
+            assert length > 0 and transcript[t:t + length] == ocr[o:o + length]
+            # the k-mer ending each anchor occurs exactly once in each sequence
+            kmer = transcript[t + length - k:t + length]
+            assert starts(transcript, kmer) == [t + length - k]
+            assert starts(ocr, kmer) == [o + length - k]
+    assert num_anchors > 0
+
+
+def test_anchored_alignment_is_valid_and_scores_as_well_as_full():
+    scoring_system = [8, -4, -7, -7, -3, 0]
+    rng = random.Random(5)
+    for transcript, ocr in random_pairs(60, 400, seed=5):
+        # some pages miss a line
+        if rng.random() < 0.5:
+            cut = rng.randint(0, len(ocr))
+            ocr = ocr[:cut] + ocr[cut + rng.randint(10, 60):] or ['a']
+
+        moves = tsc.alignment_moves(transcript, ocr, scoring_system, anchored=True)
+        tra_align, ocr_align = tsc.render_alignment(transcript, ocr, moves)
+        assert [x for x in tra_align if x != '_'] == transcript
+        assert [x for x in ocr_align if x != '_'] == ocr
+        assert tsc.perform_anchored_alignment(transcript, ocr, scoring_system) == \
+            (tra_align, ocr_align)
+
+        # the anchors are where the best alignment of a page read in order runs anyway
+        full = tsc.alignment_moves(transcript, ocr, scoring_system)
+        assert path_score(transcript, ocr, moves, scoring_system) == \
+            path_score(transcript, ocr, full, scoring_system)
+
+
+@pytest.mark.parametrize('semiglobal', [False, True])
+def test_incremental_matches_alignment_of_whole_ocr(semiglobal):
+    rng = random.Random(9)
+    scoring_systems = [[8, -4, -7, -7, -3, 0], [1.5, -0.7, -2.3, -0.1],
+        [tsc.confusion_scoring_method(), -7, -7, -3, 0]]
+    for scoring_system in scoring_systems:
+        for transcript, ocr in random_pairs(30, 120, seed=9):
+            aligner = tsc.IncrementalAligner(transcript, scoring_system, semiglobal)
+            # the ocr arrives a line at a time, and some lines are empty
+            pos = 0
+            while pos < len(ocr):
+                length = rng.randint(0, 30)
+                aligner.extend(ocr[pos:pos + length])
+                pos += length
+            assert aligner.alignment() == tsc.perform_alignment(transcript, ocr, scoring_system,
+                semiglobal=semiglobal)
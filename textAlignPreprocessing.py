@@ -8,18 +8,12 @@ import pickle
 import itertools as iter
 import os
 import re
+import arrayPreprocessing as apre
 
-# PARAMETERS FOR PREPROCESSING
-saturation_thresh = 0.9
-sat_area_thresh = 150
-despeckle_amt = 100            # an int in [1,100]: ignore ccs with area smaller than this
-noise_area_thresh = 100        # an int in : ignore ccs with area smaller than this
-
-# PARAMETERS FOR TEXT LINE SEGMENTATION
-filter_size = 30                # size of moving-average filter used to smooth projection
-prominence_tolerance = 0.70     # log-projection peaks must be at least this prominent
-collision_strip_scale = 1       # in [0,inf]; amt of each cc to consider when clipping
-remove_capitals_scale = 10000   # removes large ccs. turned off for now
+# the parameters for preprocessing, deskewing and text line segmentation are in arrayPreprocessing,
+# along with the parts of line finding that do not need gamera. they are always read from there as
+# apre.<name> when used, so that changing one there changes it for both backends (and for the key
+# preprocCache keeps pages under)
 
 # CC GROUPING (BLOBS)
 cc_group_gap_min = 20  # any gap at least this wide will be assumed to be a space between words!
@@ -35,129 +29,7 @@ colors = [gc.RGBPixel(150, 0, 0),
           gc.RGBPixel(230, 100, 20)]
 
 
-def vertically_coincide(hline_position, comp_offset, comp_nrows, collision, collision_scale=collision_strip_scale):
-    """
-    A helper function that takes in the vertical width of a horizontal strip
-    and the vertical measurements of a connected component, and returns a value
-    of True if any part of it lies within the strip.
-    """
-
-    collision *= collision_strip_scale
-
-    component_top = comp_offset
-    component_bottom = comp_offset + comp_nrows
-
-    strip_top = hline_position - int(collision / 2)
-    strip_bottom = hline_position + int(collision / 2)
-
-    both_above = component_top < strip_top and component_bottom < strip_top
-    both_below = component_top > strip_bottom and component_bottom > strip_bottom
-
-    return (not both_above and not both_below)
-
-
-def calculate_peak_prominence(data, index):
-    '''
-    returns the log of the prominence of the peak at a given index in a given dataset. peak
-    prominence gives high values to relatively isolated peaks and low values to peaks that are
-    in the "foothills" of large peaks.
-    '''
-    current_peak = data[index]
-
-    # ignore values at either end of the dataset or values that are not local maxima
-    if (index == 0 or
-            index == len(data) - 1 or
-            data[index - 1] > current_peak or
-            data[index + 1] > current_peak or
-            (data[index - 1] == current_peak and data[index + 1] == current_peak)):
-        return 0
-
-    # by definition, the prominence of the highest value in a dataset is equal to the value itself
-    if current_peak == max(data):
-        return np.log(current_peak)
-
-    # find index of nearest maxima which is higher than the current peak
-    higher_peaks_inds = [i for i, x in enumerate(data) if x > current_peak]
-
-    right_peaks = [x for x in higher_peaks_inds if x > index]
-    if right_peaks:
-        closest_right_ind = min(right_peaks)
-    else:
-        closest_right_ind = np.inf
-
-    left_peaks = [x for x in higher_peaks_inds if x < index]
-    if left_peaks:
-        closest_left_ind = max(left_peaks)
-    else:
-        closest_left_ind = -np.inf
-
-    right_distance = closest_right_ind - index
-    left_distance = index - closest_left_ind
-
-    if (right_distance) > (left_distance):
-        closest = closest_left_ind
-    else:
-        closest = closest_right_ind
-
-    # find the value at the lowest point between the nearest higher peak (the key col)
-    lo = min(closest, index)
-    hi = max(closest, index)
-    between_slice = data[lo:hi]
-    key_col = min(between_slice)
-
-    prominence = np.log(data[index] - key_col + 1)
-
-    return prominence
-
-
-def find_peak_locations(data, tol=prominence_tolerance, ranked=False):
-    '''
-    given a vertical projection in @data, finds prominent peaks and returns their indices
-    '''
-
-    prominences = [(i, calculate_peak_prominence(data, i)) for i in range(len(data))]
-
-    # normalize to interval [0,1]
-    prom_max = max([x[1] for x in prominences])
-    if prom_max == 0 or len(prominences) == 0:
-        # failure to find any peaks; probably monotonically increasing / decreasing
-        return []
-
-    prominences[:] = [(x[0], x[1] / prom_max) for x in prominences]
-
-    # take only the tallest peaks above given tolerance
-    peak_locs = [x for x in prominences if x[1] > tol]
-
-    # if a peak has a flat top, then both 'corners' of that peak will have high prominence; this
-    # is rather unavoidable. just check for adjacent peaks with exactly the same prominence and
-    # remove the lower one
-    to_remove = [peak_locs[i] for i in range(len(peak_locs) - 2)
-                if peak_locs[i][1] == peak_locs[i+1][1]]
-    for r in to_remove:
-        peak_locs.remove(r)
-
-    if ranked:
-        peak_locs.sort(key=lambda x: x[1] * -1)
-    else:
-        peak_locs[:] = [x[0] for x in peak_locs]
-
-    return peak_locs
-
-
-def moving_avg_filter(data, filter_size=filter_size):
-    '''
-    returns a list containing the data in @data filtered through a moving-average filter of size
-    @filter_size to either side; that is, filter_size = 1 gives a size of 3, filter size = 2 gives
-    a size of 5, and so on.
-    '''
-    smoothed = np.zeros(len(data))
-    for n in range(filter_size, len(data) - filter_size):
-        vals = data[n - filter_size: n + filter_size + 1]
-        smoothed[n] = np.mean(vals)
-    return smoothed
-
-
-def preprocess_images(input_image, despeckle_amt=despeckle_amt, filter_runs=1, filter_runs_amt=2, correct_rotation=True):
+def preprocess_images(input_image, despeckle_amt=apre.despeckle_amt, filter_runs=1, filter_runs_amt=2, correct_rotation=True):
     '''
     use gamera to do some denoising, etc on the text layer before attempting text line
     segmentation
@@ -174,14 +46,15 @@ def preprocess_images(input_image, despeckle_amt=despeckle_amt, filter_runs=1, f
     ccs = image_bin.cc_analysis()
     for c in ccs:
         area = c.nrows
-        if sat_area_thresh < area:
+        if apre.sat_area_thresh < area:
             c.fill_white()
 
     # image_bin = input_image.to_onebit().subtract_images(image_bin)
 
-    # find likely rotation angle and correct
-    angle, tmp = image_bin.rotation_angle_projections(-6, 6)
-    if correct_rotation:
+    # find likely rotation angle and correct. small angles are left in the image; text lines are
+    # then found along sheared lines instead (see identify_text_lines)
+    angle = estimate_skew(image_bin, -apre.max_skew_angle, apre.max_skew_angle)
+    if apre.rotation_applied(angle, correct_rotation):
         image_bin = image_bin.rotate(angle=angle)
 
     image_bin.reset_onebit_image()
@@ -195,7 +68,45 @@ def preprocess_images(input_image, despeckle_amt=despeckle_amt, filter_runs=1, f
     return image_bin, image_eroded, angle
 
 
-def identify_text_lines(image_bin, image_eroded):
+def estimate_skew(image_bin, min_angle=-6, max_angle=6):
+    '''
+    estimates the rotation angle of the text lines of @image_bin, in degrees. the angle is first
+    found over [@min_angle, @max_angle] on a copy of the page scaled down by deskew_coarse_scale,
+    and then refined on the full page only within deskew_refine_window degrees of that estimate.
+    '''
+    small = image_bin.scale(apre.deskew_coarse_scale, 1)
+    coarse_angle, _ = small.rotation_angle_projections(min_angle, max_angle)
+    del small
+
+    angle, _ = image_bin.rotation_angle_projections(
+        max(min_angle, coarse_angle - apre.deskew_refine_window),
+        min(max_angle, coarse_angle + apre.deskew_refine_window))
+    return angle
+
+
+def sheared_projection(image, skew):
+    '''
+    returns the y-axis projection of @image along lines skewed by @skew degrees (see line_shifts),
+    i.e. the projection the page would have if it were deskewed, without rotating it. columns that
+    are shifted by the same amount are projected together as one subimage.
+    '''
+    shifts = apre.line_shifts(image.ncols, skew)
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(shifts)) + 1])
+    ends = np.concatenate([starts[1:], [image.ncols]])
+
+    projection = np.zeros(image.nrows, dtype='int64')
+    for x0, x1 in zip(starts, ends):
+        cols = image.subimage((int(x0), 0), (int(x1) - 1, image.nrows - 1))
+        cols = np.array(cols.projection_rows())
+        shift = shifts[x0]
+        if shift >= 0:
+            projection[shift:] += cols[:image.nrows - shift]
+        else:
+            projection[:shift] += cols[-shift:]
+    return projection
+
+
+def identify_text_lines(image_bin, image_eroded, skew=0):
     '''
     finds text lines on preprocessed image. step-by-step:
     1. find peak locations of vertical projection
@@ -204,57 +115,47 @@ def identify_text_lines(image_bin, image_eroded):
     3. connected component analysis
     4. break into neat rows of connected components that each intersect the same horizontal line
     5. deal with some pathological cases (empty lines, doubled lines, etc)
+
+    if the page is still skewed by @skew degrees (see rotation_applied), the projection and the
+    lines are taken along lines of that slope instead of horizontally. peak locations are then
+    positions on the deskewed page (see line_shifts), while the strips are still subimages of
+    @image_bin.
     '''
 
     # compute y-axis projection of input image and filter with sliding window average
     print('finding projection peaks...')
-    project = image_eroded.projection_rows()
-    smoothed_projection = moving_avg_filter(project, filter_size)
+    if skew:
+        project = sheared_projection(image_eroded, skew)
+    else:
+        project = image_eroded.projection_rows()
+    smoothed_projection = apre.moving_avg_filter(project, apre.filter_size)
 
     # calculate normalized log prominence of all peaks in projection
-    peak_locations = find_peak_locations(smoothed_projection)
+    peak_locations = apre.find_peak_locations(smoothed_projection, apre.prominence_tolerance)
 
     # draw a horizontal white line at the local minima of the vertical projection. this ensures
     # that every connected component can intersect at most one text line.
-    for i in range(len(peak_locations) - 1):
-        start = peak_locations[i]
-        end = peak_locations[i + 1]
-        idx = np.argmin(smoothed_projection[start:end])
-        idx += start
-        image_eroded.draw_line((0, idx), (image_eroded.ncols, idx), 0, 2)
+    shifts = apre.line_shifts(image_eroded.ncols, skew)
+    for idx in apre.line_separators(smoothed_projection, peak_locations):
+        image_eroded.draw_line((0, int(idx - shifts[0])), (image_eroded.ncols, int(idx - shifts[-1])),
+            0, 2)
 
     # perform connected component analysis and remove sufficiently small ccs and ccs that are too
     # tall; assume these to be ornamental letters
     print('connected component analysis...')
     components = image_eroded.cc_analysis()
 
-    for c in components:
-        if c.black_area()[0] < noise_area_thresh:
+    areas = np.array([c.black_area()[0] for c in components])
+    for c, area in zip(components, areas):
+        if area < apre.noise_area_thresh:
             c.fill_white()
 
-    components[:] = [c for c in components if c.black_area()[0] > noise_area_thresh]
-
-    med_comp_height = np.median([c.nrows for c in components])
-
-    components[:] = [c for c in components if c.nrows < (med_comp_height * remove_capitals_scale)]
-
     # using the peak locations found earlier, find all connected components that are intersected by
     # a horizontal strip at either edge of each line. these are the lines of text in the manuscript
-
-    line_strips = []
-
-    cc_median_height = np.median([x.nrows for x in components])
-    cc_lines = []
-    for line_loc in peak_locations:
-        res = [x for x in components if vertically_coincide(line_loc, x.offset_y, x.nrows, cc_median_height)]
-
-        ulx = min(s.ul.x for s in res)
-        uly = min(s.ul.y for s in res)
-        lrx = max(s.lr.x for s in res)
-        lry = max(s.lr.y for s in res)
-
-        strip = image_bin.subimage((ulx, uly), (lrx, lry))
-        line_strips.append(strip)
+    extents = [(c.ul.x, c.ul.y, c.lr.x, c.lr.y) for c in components]
+    lines = apre.line_extents(extents, areas, peak_locations, image_eroded.ncols, skew)
+    line_strips = [image_bin.subimage((int(ulx), int(uly)), (int(lrx), int(lry)))
+        for ulx, uly, lrx, lry in lines]
 
     # if a single connected component appears in more than one cc_line, give priority to the line
     # that is closer to the center of the component's bounding box
@@ -291,12 +192,12 @@ def smear_lines(image, points_factor=0.005):
     components = filt.cc_analysis()
 
     for c in components:
-        if c.black_area()[0] < noise_area_thresh:
+        if c.black_area()[0] < apre.noise_area_thresh:
             c.fill_white()
     med_comp_width = int(np.median([c.ncols for c in components
-        if c.black_area()[0] > noise_area_thresh]))
+        if c.black_area()[0] > apre.noise_area_thresh]))
     med_comp_height = int(np.median([c.nrows for c in components
-        if c.black_area()[0] > noise_area_thresh]))
+        if c.black_area()[0] > apre.noise_area_thresh]))
 
     filt.reset_onebit_image()
 
@@ -404,7 +305,7 @@ def strip_projections(image, num_strips=30):
 
     strip_centers = [int((x + 0.5) * strip_dim.ncols + left_side) for x in range(num_strips)]
     strip_projections = [x.projection_rows() for x in vert_strips]
-    strip_proj_smooth = [moving_avg_filter(x) for x in strip_projections]
+    strip_proj_smooth = apre.moving_avg_filter_rows(strip_projections)
     strip_log = [np.log(x / (max(x) + 1) + 1) for x in strip_proj_smooth]
     anchor_points = []
     # find runs of consecutive zeroes and take points in middle of these runs: anchors
@@ -457,7 +358,8 @@ if __name__ == '__main__':
         print('processing {}...'.format(fname))
         raw_image = gc.load_image('./png/' + fname + '_text.png')
         image, eroded, angle = preprocess_images(raw_image)
-        line_strips, lines_peak_locs, proj = identify_text_lines(image, eroded)
+        skew = 0 if apre.rotation_applied(angle) else angle
+        line_strips, lines_peak_locs, proj = identify_text_lines(image, eroded, skew)
 
         # save_preproc_image(image, line_strips, lines_peak_locs, fname)
 
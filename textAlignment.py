@@ -1,7 +1,36 @@
 from rodan.jobs.base import RodanTask
 import gamera.core as gc
 import json
+import os
+import shutil
+import tempfile
 import alignToOCR as align
+import alignmentCache as acache
+import ocrCache as ocache
+import pageStore as pstore
+import preprocCache as pcache
+
+# the OCRopus model that text lines are recognized with
+ocropus_model = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'stgall2-00017000.pyrnn.gz')
+
+# directory that the page store and the preprocessing, OCR and alignment caches are kept in, so that
+# every job shares them. if None, each job keeps them in a temporary directory of its own, which is
+# removed once it finishes, rather than in the working directory of the worker running it
+cache_root = None
+
+
+def cache_paths(root):
+    '''
+    returns the keyword arguments of pageStore.load_page and alignToOCR.process that put the page
+    store and every cache under the directory @root, named as they are by default.
+    '''
+    return {
+        'store_dir': os.path.join(root, os.path.basename(pstore.default_store_dir)),
+        'preproc_cache': os.path.join(root, os.path.basename(pcache.default_cache_dir)),
+        'ocr_cache': os.path.join(root, os.path.basename(ocache.default_cache_path)),
+        'alignment_cache': os.path.join(root, os.path.basename(acache.default_cache_path)),
+    }
 
 
 class textAlignment(RodanTask):
@@ -51,10 +80,19 @@ class textAlignment(RodanTask):
     def run_my_task(self, inputs, settings, outputs):
 
         transcript = align.read_file(inputs['Transcript'][0]['resource_path'])
-        raw_image = gc.load_image(inputs['Text Layer'][0]['resource_path'])
 
-        syl_boxes, _, lines_peak_locs = align.process(raw_image, transcript, wkdir_name='test')
-        # test_string = str(syl_boxes)
+        job_dir = tempfile.mkdtemp(prefix='text_alignment_')
+        try:
+            paths = cache_paths(cache_root or job_dir)
+            raw_image = pstore.load_page(inputs['Text Layer'][0]['resource_path'],
+                store_dir=paths.pop('store_dir'))
+            result = align.process(raw_image, transcript, ocropus_model, **paths)
+        finally:
+            shutil.rmtree(job_dir)
+
+        if result is None:
+            raise RuntimeError('OCR failed on the text layer.')
+        syl_boxes, _, lines_peak_locs, _ = result
 
         outfile_path = outputs['JSON'][0]['resource_path']
         with open(outfile_path, 'w') as file:
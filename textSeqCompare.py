@@ -1,3 +1,4 @@
+import bisect
 import numpy as np
 from unidecode import unidecode
 import matplotlib.pyplot as plt
@@ -9,18 +10,39 @@ gap_open = -10
 gap_extend = -1
 default_sys = [8, -4, -7, -7, -3, 0]
 
+# largest number of cells whose pointers are held at once in linear-memory mode
+linear_memory_block = 2 ** 20
 
-def perform_alignment(transcript, ocr, scoring_system=None, verbose=False):
-    '''
-    @scoring_system must be array-like, of one of the following forms:
-    [match_func(a,b), gap_open_x, gap_open_y, gap_extend_x, gap_extend_y]
-    [match, mismatch, gap_open_x, gap_open_y, gap_extend_x, gap_extend_y]
-    [match, mismatch, gap_open, gap_extend]
-    '''
+# gaps are extended this many cells at a time over a whole column when the scores are not integers
+# (see extend_gap_runs); only longer runs of gaps are then extended one by one
+gap_run_passes = 8
 
-    transcript = transcript + [' ']
-    ocr = ocr + [' ']
+# extra half-width, in characters, given to the band in banded alignment mode
+band_margin = 50
 
+# number of rows by which the path found in banded alignment mode must keep clear of the edges of
+# the band for the band to be accepted, and number of columns filled over the same rows at once
+band_clearance = 8
+band_block = 64
+
+# largest number of pointer cells filled at once by a batched alignment, and largest number of
+# cells in each of its columns (more scoring systems at once than this no longer fit in cache)
+batch_align_cells = 2 ** 27
+batch_align_width = 2 ** 15
+
+# length of the exact matches used as anchors in anchored alignment
+anchor_kmer = 8
+
+# pairs of characters that OCRopus often mistakes for one another on manuscript hands
+ocr_confusions = [('c', 'e'), ('n', 'u'), ('i', 'l'), ('r', 't'), ('a', 'o'), ('m', 'n')]
+
+
+def parse_scoring_system(scoring_system):
+    '''
+    splits @scoring_system (see perform_alignment) into a scoring method and a tuple of gap
+    penalties (gap_open_x, gap_open_y, gap_extend_x, gap_extend_y). the scoring method is either
+    a callable match_func(a, b) or a (match, mismatch) pair of scalars.
+    '''
     if scoring_system is None:
         scoring_system = default_sys
 
@@ -28,146 +50,818 @@ def perform_alignment(transcript, ocr, scoring_system=None, verbose=False):
         scoring_method = scoring_system[0]
         gap_open_x, gap_open_y, gap_extend_x, gap_extend_y = scoring_system[-4:]
     elif len(scoring_system) == 6:
-        def default_score_method(a, b):
-            return scoring_system[0] if a == b else scoring_system[1]
-        scoring_method = default_score_method
+        scoring_method = (scoring_system[0], scoring_system[1])
         gap_open_x, gap_open_y, gap_extend_x, gap_extend_y = scoring_system[-4:]
     elif len(scoring_system) == 4:
-        def default_score_method(a, b):
-            return scoring_system[0] if a == b else scoring_system[1]
-        scoring_method = default_score_method
+        scoring_method = (scoring_system[0], scoring_system[1])
         gap_open_x, gap_open_y = (scoring_system[2], scoring_system[2])
         gap_extend_x, gap_extend_y = (scoring_system[3], scoring_system[3])
     else:
         raise ValueError('scoring_system {} invalid'.format(scoring_system))
 
-    # y_mat and x_mat keep track of gaps in horizontal and vertical directions
-    mat = np.zeros((len(transcript), len(ocr)))
-    y_mat = np.zeros((len(transcript), len(ocr)))
-    x_mat = np.zeros((len(transcript), len(ocr)))
-    mat_ptr = np.zeros((len(transcript), len(ocr)))
-    y_mat_ptr = np.zeros((len(transcript), len(ocr)))
-    x_mat_ptr = np.zeros((len(transcript), len(ocr)))
-
-    # establish boundary conditions
-    for i in range(len(transcript)):
-        mat[i][0] = gap_extend * i
-        x_mat[i][0] = -1e100
-        y_mat[i][0] = gap_extend * i
-    for j in range(len(ocr)):
-        mat[0][j] = gap_extend * j
-        x_mat[0][j] = gap_extend * j
-        y_mat[0][j] = -1e100
-
-    for i in range(1, len(transcript)):
-        for j in range(1, len(ocr)):
-
-            # update main matrix (for matches)
-            # match_score = match if transcript[i-1] == ocr[j-1] else mismatch
-            eq_res = scoring_method(transcript[i-1], ocr[j-1])
-            match_score = eq_res
-
-            mat_vals = [mat[i-1][j-1], x_mat[i-1][j-1], y_mat[i-1][j-1]]
-            mat[i][j] = max(mat_vals) + match_score
-            mat_ptr[i][j] = int(mat_vals.index(max(mat_vals)))
-
-            # update matrix for y gaps
-            y_mat_vals = [mat[i][j-1] + gap_open_y + gap_extend_y,
-                        x_mat[i][j-1] + gap_open_y + gap_extend_y,
-                        y_mat[i][j-1] + gap_extend_y]
-
-            y_mat[i][j] = max(y_mat_vals)
-            y_mat_ptr[i][j] = int(y_mat_vals.index(max(y_mat_vals)))
-
-            # update matrix for x gaps
-            x_mat_vals = [mat[i-1][j] + gap_open_x + gap_extend_x,
-                        x_mat[i-1][j] + gap_extend_x,
-                        y_mat[i-1][j] + gap_open_x + gap_extend_x]
-
-            x_mat[i][j] = max(x_mat_vals)
-            x_mat_ptr[i][j] = int(x_mat_vals.index(max(x_mat_vals)))
+    return scoring_method, (gap_open_x, gap_open_y, gap_extend_x, gap_extend_y)
+
+
+def compile_scoring_system(transcript, ocr, scoring_method):
+    '''
+    compiles @scoring_method (see parse_scoring_system) into an integer-coded alphabet and a dense
+    substitution matrix, so that the alignment never calls back into python per cell. returns
+    (alphabet, sub_matrix, transcript_codes, ocr_codes), where sub_matrix[a, b] is the score of
+    aligning alphabet[a] against alphabet[b]; a callable is evaluated once per pair of symbols.
+    the full match-score matrix of a page is then just sub_matrix[transcript_codes[:, None], ocr_codes].
+    '''
+    alphabet = sorted(set(transcript) | set(ocr))
+    codes = {x: i for i, x in enumerate(alphabet)}
+    transcript_codes = np.array([codes[x] for x in transcript], dtype='intp')
+    ocr_codes = np.array([codes[x] for x in ocr], dtype='intp')
+
+    if callable(scoring_method):
+        sub_matrix = np.array([[scoring_method(a, b) for b in alphabet] for a in alphabet],
+            dtype='float64').reshape(len(alphabet), len(alphabet))
+    else:
+        match, mismatch = scoring_method
+        sub_matrix = np.full((len(alphabet), len(alphabet)), mismatch, dtype='float64')
+        np.fill_diagonal(sub_matrix, match)
+
+    return alphabet, sub_matrix, transcript_codes, ocr_codes
+
+
+def confusion_scoring_method(match=default_sys[0], mismatch=default_sys[1], confusion=0,
+        confusions=ocr_confusions):
+    '''
+    returns a match_func(a, b) for use in a scoring system that scores pairs of characters the ocr
+    commonly mistakes for one another (@confusions) as @confusion rather than as a full mismatch.
+    '''
+    confused = set(confusions) | set((b, a) for a, b in confusions)
+
+    def score_method(a, b):
+        if a == b:
+            return match
+        return confusion if (a, b) in confused else mismatch
+
+    return score_method
+
+
+def compact_dtype(values, path_length):
+    '''
+    returns int32 if every score in @values is an integer (as it is for all the usual scoring
+    systems) and no alignment of @path_length steps can overflow, else float64. int32 halves the
+    size of the score columns and keeps all sums exact.
+    '''
+    values = np.append(np.ravel(values), gap_extend)
+    if np.all(np.mod(values, 1) == 0) and np.max(np.abs(values)) * 2 * (path_length + 1) < 2 ** 28:
+        return np.dtype('int32')
+    return np.dtype('float64')
+
+
+def unreachable(dtype):
+    '''
+    returns the score given to cells of dtype @dtype that no alignment can pass through. for
+    integer scores this is far enough from the int32 limits that adding gap penalties to it along
+    a whole page can never wrap around.
+    '''
+    return -2 ** 30 if np.issubdtype(dtype, np.integer) else -1e100
+
+
+def initial_column(num_rows, dtype='float64'):
+    '''
+    returns the (mat, x_mat, y_mat) score columns for ocr position 0, i.e. the boundary conditions
+    of the alignment matrices along the transcript axis.
+    '''
+    mat = gap_extend * np.arange(num_rows, dtype=dtype)
+    x_mat = np.full(num_rows, unreachable(dtype), dtype=dtype)
+    x_mat[0] = 0
+    y_mat = gap_extend * np.arange(num_rows, dtype=dtype)
+    y_mat[0] = unreachable(dtype)
+    return mat, x_mat, y_mat
+
+
+def fill_column(prev_cols, score_col, gaps, j, banded_top=False, semiglobal=False):
+    '''
+    computes column @j of the three alignment matrices (and their pointers) from column j - 1 in
+    @prev_cols, using whole-array operations instead of a loop over the transcript. @score_col
+    holds the match scores of transcript[i - 1] against ocr[j - 1] for every row i > 0.
+
+    the pointers of all three matrices are packed into a single uint8 per cell (see pack_ptrs).
+
+    mat and y_mat only depend on the previous column. x_mat depends on the cell directly above it
+    in the same column, which is unrolled into a running (prefix) maximum:
+    x_mat[i] = max(x_mat[0] + ext * i, max_{k < i} a[k] + ext * (i - 1 - k)),
+    where a[k] is the best gap opening from row k. scores that are not integers are then corrected
+    to round as the cell-by-cell version does (see extend_gap_runs), and the three candidates are
+    evaluated once more against that result so that pointers are chosen exactly as in it.
+
+    the columns may carry leading axes (e.g. one alignment per scoring system, see
+    perform_batch_alignment), in which case the gap penalties must broadcast against them.
+
+    the columns need not start at the top row of the matrices: if @banded_top is set, their first
+    row lies just outside the band of column j (see trace_banded) and is treated as unreachable
+    rather than as the top boundary. if @semiglobal is set, the top boundary costs nothing, so that
+    ocr characters before the start of the transcript are skipped for free.
+    '''
+    gap_open_x, gap_open_y, gap_extend_x, gap_extend_y = gaps
+    mat_prev, x_prev, y_prev = prev_cols
+    num_rows = mat_prev.shape[-1]
+
+    mat = np.empty(mat_prev.shape, dtype=mat_prev.dtype)
+    y_mat = np.empty(mat_prev.shape, dtype=mat_prev.dtype)
+    x_mat = np.empty(mat_prev.shape, dtype=mat_prev.dtype)
+    mat_ptr = np.zeros(mat_prev.shape, dtype='uint8')
+    y_ptr = np.zeros(mat_prev.shape, dtype='uint8')
+    x_ptr = np.zeros(mat_prev.shape, dtype='uint8')
+
+    # boundary conditions along the top row
+    if banded_top:
+        mat[..., 0] = x_mat[..., 0] = y_mat[..., 0] = unreachable(mat.dtype)
+    elif semiglobal:
+        mat[..., 0] = x_mat[..., 0] = 0
+        y_mat[..., 0] = unreachable(mat.dtype)
+    else:
+        mat[..., 0] = gap_extend * j
+        x_mat[..., 0] = gap_extend * j
+        y_mat[..., 0] = unreachable(mat.dtype)
+
+    # update main matrix (for matches)
+    best, mat_ptr[..., 1:] = max_of_three(mat_prev[..., :-1], x_prev[..., :-1], y_prev[..., :-1])
+    mat[..., 1:] = best + score_col
+
+    # update matrix for y gaps
+    y_mat[..., 1:], y_ptr[..., 1:] = max_of_three(mat_prev[..., 1:] + gap_open_y + gap_extend_y,
+                                                  x_prev[..., 1:] + gap_open_y + gap_extend_y,
+                                                  y_prev[..., 1:] + gap_extend_y)
+
+    # update matrix for x gaps
+    mat_open = mat[..., :-1] + gap_open_x + gap_extend_x
+    y_open = y_mat[..., :-1] + gap_open_x + gap_extend_x
+    steps = np.arange(num_rows - 1, dtype=mat.dtype)
+    x_mat[..., 1:] = np.maximum(x_mat[..., :1] + gap_extend_x * (steps + 1),
+        np.maximum.accumulate(np.maximum(mat_open, y_open) - gap_extend_x * steps, axis=-1) +
+        gap_extend_x * steps)
+
+    # the running maximum adds and subtracts whole runs of extensions at once. that is exact for
+    # integer scores, but other scores round differently than when a gap is extended one cell at a
+    # time, which changes how ties are broken
+    if not np.issubdtype(mat.dtype, np.integer):
+        x_mat[..., 1:] = extend_gap_runs(x_mat, np.maximum(mat_open, y_open), gap_extend_x)
+
+    x_mat[..., 1:], x_ptr[..., 1:] = max_of_three(mat_open, x_mat[..., :-1] + gap_extend_x, y_open)
+
+    return (mat, x_mat, y_mat), pack_ptrs(mat_ptr, x_ptr, y_ptr)
+
+
+def extend_gap_runs(x_mat, open_vals, gap_extend_x, short_run=gap_run_passes):
+    '''
+    returns x_mat[..., 1:] as the cell-by-cell recurrence x_mat[i] = max(open_vals[i - 1],
+    x_mat[i - 1] + @gap_extend_x) gives it, with every extension rounded exactly as in that
+    recurrence, given the top row @x_mat[..., 0] and an estimate of the rest in @x_mat[..., 1:].
+
+    the estimate tells which cells open a new gap and which extend the gap above them. gaps are
+    extended down each run of extending cells: @short_run cells at a time over the whole column,
+    then the rest of each longer run with a running sum, which adds one extension at a time. this
+    is repeated until the column satisfies the recurrence, which only has one solution.
+    '''
+    top = x_mat[..., :1]
+    x = x_mat[..., 1:].copy()
+    rows = np.arange(x.shape[-1])
+
+    while True:
+        extends = np.concatenate([top, x[..., :-1]], axis=-1) + gap_extend_x > open_vals
+        for _ in range(short_run):
+            x = np.where(extends, np.concatenate([top, x[..., :-1]], axis=-1) + gap_extend_x,
+                open_vals)
+
+        # cells further than short_run down their run are not right yet. runs continuing from the
+        # top row start at row -1.
+        run_start = np.maximum.accumulate(np.where(extends, -1, rows), axis=-1)
+        late = (rows - run_start >= short_run).reshape(-1, x.shape[-1])
+        if late.any():
+            x_flat = np.concatenate([top, x], axis=-1).reshape(-1, x.shape[-1] + 1)
+            ext_flat = np.broadcast_to(gap_extend_x, x.shape[:-1] + (1,)).reshape(-1)
+            edge = np.zeros((len(late), 1), dtype=bool)
+            firsts = late & ~np.concatenate([edge, late[:, :-1]], axis=-1)
+            lasts = late & ~np.concatenate([late[:, 1:], edge], axis=-1)
+            for (col, first), last in zip(zip(*np.nonzero(firsts)), np.nonzero(lasts)[1]):
+                steps = np.full(last - first + 2, ext_flat[col], dtype=x.dtype)
+                steps[0] = x_flat[col, first]
+                x_flat[col, first + 1:last + 2] = np.add.accumulate(steps)[1:]
+            x = x_flat[:, 1:].reshape(x.shape)
+
+        relaxed = np.maximum(open_vals, np.concatenate([top, x[..., :-1]], axis=-1) + gap_extend_x)
+        if np.array_equal(relaxed, x):
+            return x
+        x = relaxed
+
+
+def max_of_three(a, b, c):
+    '''
+    elementwise maximum of @a, @b and @c, along with the index (0, 1 or 2) of the first argument
+    attaining it, as list.index(max(...)) would give.
+    '''
+    best = np.maximum(np.maximum(a, b), c)
+    not_a = a != best
+    not_a_or_b = not_a & (b != best)
+    return best, not_a.view('uint8') + not_a_or_b.view('uint8')
+
+
+def pack_ptrs(mat_ptr, x_mat_ptr, y_mat_ptr):
+    '''
+    packs the pointers (each one of 0, 1 or 2) of mat, x_mat and y_mat into bits 0-1, 2-3 and 4-5
+    of a single uint8, so that the pointer of matrix k is (packed >> 2k) & 3.
+    '''
+    return mat_ptr | (x_mat_ptr << 2) | (y_mat_ptr << 4)
+
+
+def fill_ptr_block(start_cols, profile, ocr_codes, gaps, c0, c1, semiglobal=False):
+    '''
+    sweeps the alignment matrices from column @c0 (whose score columns are @start_cols) up to
+    column @c1, returning the packed pointer matrix (see pack_ptrs) for columns c0 + 1 ... c1 as a
+    (rows x (c1 - c0)) uint8 array, the score columns at @c1, and the (mat, x_mat, y_mat) scores of
+    the bottom cell of each column c0 ... c1 as a ((c1 - c0 + 1) x 3) array.
+    '''
+    num_rows = len(start_cols[0])
+    ptr_mat = np.zeros((num_rows, c1 - c0), dtype='uint8')
+    last_row = np.zeros((c1 - c0 + 1, 3), dtype=start_cols[0].dtype)
+    last_row[0] = [col[-1] for col in start_cols]
+
+    cols = start_cols
+    for j in range(c0 + 1, c1 + 1):
+        cols, ptr_mat[:, j - c0 - 1] = fill_column(cols, profile[ocr_codes[j - 1]][:num_rows - 1],
+            gaps, j, semiglobal=semiglobal)
+        last_row[j - c0] = [col[-1] for col in cols]
+
+    return ptr_mat, cols, last_row
+
+
+def best_end(last_row):
+    '''
+    returns the (column, matrix) of the best-scoring cell in @last_row, the scores of the bottom row
+    of the alignment matrices as returned by fill_ptr_block. ties go to the leftmost column.
+    '''
+    ypt, mpt = np.unravel_index(np.argmax(last_row), last_row.shape)
+    return int(ypt), int(mpt)
+
+
+def trace_ptrs(ptr_mat, xpt, ypt, mpt, stop_col=0, col_offset=0, row_offsets=None):
+    '''
+    follows the packed pointer matrix @ptr_mat back from cell (@xpt, @ypt) in matrix @mpt until the
+    top row or column @stop_col is reached. column j of the alignment matrices is column
+    j - @col_offset of @ptr_mat; if @row_offsets is given, row i of column j is row
+    i - row_offsets[j - col_offset]. returns the moves taken, from last to first, and the
+    (xpt, ypt, mpt) at which the traceback stopped.
+
+    which matrix we're in tells us which direction to head back (diagonally, y, or x)
+    value of that matrix tells us which matrix to go to (mat, y_mat, or x_mat)
+    mat of 0 = match, 1 = x gap, 2 = y gap
+    '''
+    moves = []
+
+    while xpt > 0 and ypt > stop_col:
+        moves.append(mpt)
+        col = ypt - col_offset
+        row = xpt if row_offsets is None else xpt - row_offsets[col]
+        next_mpt = (int(ptr_mat[row, col]) >> (2 * mpt)) & 3
+
+        # case if the current cell is reachable from the diagonal
+        if mpt == 0:
+            xpt -= 1
+            ypt -= 1
+
+        # case if current cell is reachable horizontally
+        elif mpt == 1:
+            xpt -= 1
+
+        # case if current cell is reachable vertically
+        elif mpt == 2:
+            ypt -= 1
+
+        mpt = next_mpt
+
+    return moves, (xpt, ypt, mpt)
+
+
+def trace_linear_memory(start_cols, profile, ocr_codes, gaps, c0, c1, xpt, mpt,
+        block_cells=linear_memory_block, semiglobal=False):
+    '''
+    divide-and-conquer traceback from cell (@xpt, @c1) in matrix @mpt back to column @c0, whose score
+    columns are @start_cols. pointers are only ever materialized for blocks of at most
+    @block_cells cells: larger spans are split at their middle column, the right half is traced
+    first (which gives the cell at which the path crosses the middle column) and then the left
+    half. rows below xpt are never needed, since no cell depends on the rows beneath it. this
+    follows exactly the same path as a traceback over the full pointer matrices.
+    '''
+    start_cols = tuple(col[:xpt + 1] for col in start_cols)
+
+    if (c1 - c0) * (xpt + 1) <= block_cells or c1 - c0 <= 1:
+        ptr_mat, _, _ = fill_ptr_block(start_cols, profile, ocr_codes, gaps, c0, c1, semiglobal)
+        return trace_ptrs(ptr_mat, xpt, c1, mpt, stop_col=c0, col_offset=c0 + 1)
+
+    mid = (c0 + c1) // 2
+    mid_cols = start_cols
+    for j in range(c0 + 1, mid + 1):
+        mid_cols, _ = fill_column(mid_cols, profile[ocr_codes[j - 1]][:xpt], gaps, j,
+            semiglobal=semiglobal)
+
+    right_moves, (xpt, ypt, mpt) = trace_linear_memory(mid_cols, profile, ocr_codes, gaps,
+        mid, c1, xpt, mpt, block_cells, semiglobal)
+    del mid_cols
+    if xpt == 0:
+        return right_moves, (xpt, ypt, mpt)
+
+    left_moves, end = trace_linear_memory(start_cols, profile, ocr_codes, gaps,
+        c0, mid, xpt, mpt, block_cells, semiglobal)
+    return right_moves + left_moves, end
+
+
+def band_window(cols, start, r0, r1):
+    '''
+    returns rows @r0 ... @r1 of the banded score columns @cols, whose first row is row @start of
+    the alignment matrices. rows outside of @cols are outside the band, so they are unreachable.
+    '''
+    window = []
+    for col in cols:
+        out = np.full(r1 - r0 + 1, unreachable(col.dtype), dtype=col.dtype)
+        lo = max(r0, start)
+        hi = min(r1, start + len(col) - 1)
+        if hi >= lo:
+            out[lo - r0:hi - r0 + 1] = col[lo - start:hi - start + 1]
+        window.append(out)
+    return tuple(window)
+
+
+def band_exit_bound(bounds, a, b, sub_max, gaps):
+    '''
+    returns an upper bound on the score of any path from the top-left corner of the alignment
+    matrices to cell (@a, @b) that passes through a cell outside the band whose rows in each column
+    are @bounds (see band_rows), or None if no such path exists.
+
+    no diagonal step scores more than @sub_max and no gap step more than the cheapest gap step in
+    its direction (including those along the top and left boundaries), so a path with d diagonal
+    steps scores at most a * step_x + b * step_y + d * (sub_max - step_x - step_y). a path through
+    cell (i, j) has at most min(i, j) + min(a - i, b - j) diagonal steps, which is concave in i,
+    so its largest value outside the band of a column lies at an end of the rows above or below
+    the band, or where it bends.
+    '''
+    gap_open_x, gap_open_y, gap_extend_x, gap_extend_y = gaps
+    step_x = max(gap_extend_x, gap_open_x + gap_extend_x, gap_extend)
+    step_y = max(gap_extend_y, gap_open_y + gap_extend_y, gap_extend)
+
+    lo, hi = np.array(bounds[:b + 1]).T
+    j = np.arange(b + 1)
+    most_diagonals = -1
+    for first, last in [(np.zeros_like(lo), np.minimum(lo - 1, a)), (hi + 1, np.full_like(hi, a))]:
+        outside = first <= last
+        if not outside.any():
+            continue
+        for i in (first, last, np.clip(j, first, last), np.clip(a - b + j, first, last)):
+            diagonals = np.minimum(i, j) + np.minimum(a - i, b - j)
+            most_diagonals = max(most_diagonals, int(diagonals[outside].max()))
+
+    if most_diagonals < 0:
+        return None
+    return a * step_x + b * step_y + max(sub_max - step_x - step_y, 0) * most_diagonals
+
+
+def band_rows(num_rows, num_cols, half_width):
+    '''
+    returns the (first, last) rows of each column of a band @half_width rows to either side of the
+    diagonal running from the top-left to the bottom-right corner of alignment matrices of
+    @num_rows x @num_cols cells.
+    '''
+    slope = float(num_rows - 1) / (num_cols - 1)
+    return [(max(0, int(np.floor(j * slope)) - half_width),
+             min(num_rows - 1, int(np.ceil(j * slope)) + half_width)) for j in range(num_cols)]
+
+
+def trace_banded(profile, ocr_codes, gaps, bounds, block_cols=band_block):
+    '''
+    fills only the cells within the band whose rows in each column are @bounds (see band_rows),
+    then traces back from the bottom-right corner. cells outside the band are unreachable. the
+    band is filled @block_cols columns at a time over the same rows, from the top of the band in
+    the first column of the block to its bottom in the last, so that the score columns only need
+    to be moved down the matrices once per block; the band filled is then a staircase holding
+    @bounds. returns the moves and final (xpt, ypt, mpt) as trace_ptrs does, the (first, last)
+    rows filled in each column, and the best score of the cell above and left of the corner and
+    the score of the corner in the matrix the traceback starts in (see band_holds_best).
+    '''
+    num_rows = bounds[-1][1] + 1
+    num_cols = len(ocr_codes) + 1
+    blocks = [(c, min(c + block_cols, num_cols) - 1) for c in range(1, num_cols, block_cols)]
+    width = max(bounds[last][1] - max(bounds[first][0] - 1, 0) + 1 for first, last in blocks)
+
+    # each pointer row holds rows starts[j] ... of column j + 1; the row above the band of that
+    # column is kept (as an unreachable cell) so that gaps cannot be opened from outside the band.
+    # pointers are stored column-major so that each column of the sweep is one contiguous write.
+    ptr_cols = np.zeros((num_cols - 1, width), dtype='uint8')
+    starts = np.zeros(num_cols - 1, dtype='int')
+
+    # the first column is the left boundary of the matrices, which is known in full
+    filled = [(0, num_rows - 1)]
+    cols = initial_column(num_rows, profile.dtype)
+    cols_start = 0
+    if num_cols == 2:
+        prev_corner = [col[num_rows - 2] for col in cols]
+    for first, last in blocks:
+        lo = bounds[first][0]
+        hi = bounds[last][1]
+        r0 = max(lo - 1, 0)
+        cols = band_window(cols, cols_start, r0, hi)
+        cols_start = r0
+        for j in range(first, last + 1):
+            cols, ptr_cols[j - 1, :hi - r0 + 1] = fill_column(cols,
+                profile[ocr_codes[j - 1]][r0:hi], gaps, j, banded_top=lo > 0)
+            if j == num_cols - 2:
+                prev_corner = [col[num_rows - 2 - r0] for col in cols]
+        starts[first - 1:last] = r0
+        filled += [(lo, hi)] * (last - first + 1)
+
+    xpt = num_rows - 1
+    ypt = num_cols - 1
+    mpt = int(ptr_cols[-1, xpt - starts[-1]]) & 3
+    corner = cols[mpt][xpt - cols_start]
+
+    moves, end = trace_ptrs(ptr_cols.T, xpt, ypt, mpt, col_offset=1, row_offsets=starts)
+    return moves, end, filled, max(prev_corner), corner
+
+
+def path_clears_band(moves, bounds, clearance=band_clearance):
+    '''
+    returns whether the path of the traceback @moves (see render_alignment), which must run from
+    the bottom-right corner all the way to the top-left, keeps at least @clearance rows away from
+    the edges of the band whose rows in each column are @bounds. edges of the band that lie on
+    the top or bottom of the alignment matrices are not edges a path could cross.
+    '''
+    num_rows = bounds[-1][1] + 1
+    lo, hi = np.array(bounds).T
+    steps = np.asarray(moves, dtype='uint8')[::-1]
+    rows = np.concatenate([[0], np.cumsum(steps != 2)])
+    cols = np.concatenate([[0], np.cumsum(steps != 1)])
+    near_top = (lo[cols] > 0) & (rows - lo[cols] < clearance)
+    near_bottom = (hi[cols] < num_rows - 1) & (hi[cols] - rows < clearance)
+    return not np.any(near_top | near_bottom)
+
+
+def band_holds_best(bounds, sub_max, gaps, prev_corner, corner):
+    '''
+    returns whether the band whose rows in each column are @bounds is known to hold the best
+    alignment, given the scores @prev_corner and @corner found in it by trace_banded. a path that
+    stays inside the band can still be worse than one that leaves it, so these are checked against
+    an upper bound on every path that leaves the band (see band_exit_bound). the traceback starts in
+    the matrix holding the best score of the cell above and left of the corner, so that score must
+    beat the bound there; the corner's score in that matrix must then be at least the bound at the
+    corner. the alignment found then scores as well as the one the full matrices give, though it
+    may break ties between equally good paths differently.
+    '''
+    num_rows = bounds[-1][1] + 1
+    num_cols = len(bounds)
+    prev_bound = band_exit_bound(bounds, num_rows - 2, num_cols - 2, sub_max, gaps)
+    corner_bound = band_exit_bound(bounds, num_rows - 1, num_cols - 1, sub_max, gaps)
+    return ((prev_bound is None or prev_corner > prev_bound) and
+            (corner_bound is None or corner >= corner_bound))
+
+
+def trace_exact_band(profile, ocr_codes, gaps, num_rows, half_width, anchors=()):
+    '''
+    banded alignment (see trace_banded), doubling the band from @half_width rows to either side of
+    the diagonal until the path it finds keeps clear of the edges of the band (see
+    path_clears_band) or the band is known to hold the best alignment (see band_holds_best).
+    the band is first widened to hold each of @anchors (see find_anchors) band_clearance rows
+    clear of its edges, since the best path runs through text the two sequences share. returns
+    the moves and final (xpt, ypt, mpt) as trace_ptrs does, or None once the band would be as
+    tall as the matrices, which are then cheaper to fill in full.
+    '''
+    num_cols = len(ocr_codes) + 1
+    sub_max = profile.max()
+
+    # the first and last cells of an anchor are the ones furthest from the diagonal
+    slope = float(num_rows - 1) / (num_cols - 1)
+    for t, o, length in anchors:
+        for i, j in [(t + 1, o + 1), (t + length, o + length)]:
+            half_width = max(half_width, int(np.ceil(abs(i - j * slope))) + band_clearance)
+
+    while 2 * half_width + 1 < num_rows:
+        bounds = band_rows(num_rows, num_cols, half_width)
+        moves, end, filled, prev_corner, corner = trace_banded(profile, ocr_codes, gaps, bounds)
+        if (path_clears_band(moves + [2] * end[1] + [1] * end[0], filled) or
+                band_holds_best(filled, sub_max, gaps, prev_corner, corner)):
+            return moves, end
+        half_width = max(2 * half_width, 1)
+    return None
+
+
+def perform_alignment(transcript, ocr, scoring_system=None, verbose=False, **kwargs):
+    '''
+    aligns @transcript to @ocr, returning the aligned sequences (tra_align, ocr_align) with '_'
+    marking gaps. keyword arguments are passed on to alignment_moves.
+    '''
+    moves = alignment_moves(transcript, ocr, scoring_system, **kwargs)
+    return render_alignment(transcript, ocr, moves, verbose)
+
+
+def alignment_moves(transcript, ocr, scoring_system=None, linear_memory=False, banded=False,
+        semiglobal=False, anchored=False):
+    '''
+    returns the moves of the traceback of the alignment of @transcript to @ocr, from last to first
+    (see render_alignment).
+
+    @scoring_system must be array-like, of one of the following forms:
+    [match_func(a,b), gap_open_x, gap_open_y, gap_extend_x, gap_extend_y]
+    [match, mismatch, gap_open_x, gap_open_y, gap_extend_x, gap_extend_y]
+    [match, mismatch, gap_open, gap_extend]
+
+    if @linear_memory is set, only O(len(transcript)) score columns are kept at any time (see
+    trace_linear_memory) at the cost of recomputing parts of the matrices; the result is the same.
+
+    if @banded is set, only a band of cells around the diagonal is filled (see trace_banded). the
+    band is as wide as the difference in length between the two sequences plus band_margin, or as
+    wide as it takes to hold the exact matches found by find_anchors (e.g. past a line the ocr
+    missed), and it is doubled in width and the alignment retried until the path found keeps
+    band_clearance rows clear of its edges, or the band is known to hold an alignment as good as
+    the full matrices give (see trace_exact_band). once the band would cover the whole height of
+    the matrices, they are filled in full instead. unlike the second test, a path that clears the
+    edges is not a proof that no better alignment lies outside the band, so this mode can score
+    below the full matrices on pages whose text and ocr share little.
+
+    if @semiglobal is set, gaps at the start and end of the ocr are free: ocr noise before and after
+    the transcript (rubrics, folio numbers, marginalia) is skipped without penalty, and the
+    traceback starts from the best cell in the bottom row rather than from the bottom-right corner.
+
+    if @anchored is set, exact matches between the two sequences are aligned first and only the
+    pieces between them are aligned as above (see anchored_alignment_moves), which is close to
+    linear in the length of a page but not guaranteed to give the best alignment.
+    '''
+    if anchored and semiglobal:
+        raise ValueError('anchored alignment requires a global alignment')
+    if anchored:
+        return anchored_alignment_moves(transcript, ocr, scoring_system,
+            linear_memory=linear_memory, banded=banded)
+    if linear_memory and banded:
+        raise ValueError('linear_memory and banded alignment cannot be combined')
+    if semiglobal and banded:
+        raise ValueError('banded alignment requires a global alignment')
+
+    scoring_method, gaps = parse_scoring_system(scoring_system)
+
+    _, sub_matrix, transcript_codes, ocr_codes = compile_scoring_system(transcript, ocr,
+        scoring_method)
+
+    # row k of the profile holds the score of every transcript element against alphabet[k], so
+    # that the match scores for an ocr column are a single gather
+    dtype = compact_dtype(np.append(sub_matrix, gaps), len(transcript) + len(ocr))
+    sub_matrix = sub_matrix.astype(dtype)
+    gaps = tuple(dtype.type(x).item() for x in gaps)
+    profile = sub_matrix.T[:, transcript_codes]
 
     # TRACEBACK
-    # which matrix we're in tells us which direction to head back (diagonally, y, or x)
-    # value of that matrix tells us which matrix to go to (mat, y_mat, or x_mat)
-    # mat of 0 = match, 1 = x gap, 2 = y gap
+    # start at bottom-right corner and work way up to top-left. the score matrices are swept
+    # column by column along the ocr, since each column only depends on the one before it.
     #
-    # first
-    tra_align = []
-    ocr_align = []
-    align_record = []
-    pt_record = []
-    xpt = len(transcript) - 1
-    ypt = len(ocr) - 1
-    mpt = mat_ptr[xpt][ypt]
+    # for a global alignment the traceback starts in the matrix given by the bottom-right cell's
+    # mat_ptr. this is left over from forcibly aligning an extra ' ' appended to both sequences.
+    xpt = len(transcript)
+    ypt = len(ocr)
+    start_cols = initial_column(len(transcript) + 1, profile.dtype)
+    moves = []
+
+    band = None
+    if xpt > 0 and ypt > 0 and banded:
+        band = trace_exact_band(profile, ocr_codes, gaps, len(transcript) + 1,
+            abs(xpt - ypt) + band_margin, find_anchors(transcript, ocr))
+
+    if band is not None:
+        moves, (xpt, ypt, mpt) = band
+    elif xpt > 0 and ypt > 0 and linear_memory:
+        # the cell to start from is needed first, so sweep the whole page once without keeping
+        # any pointers
+        cols = start_cols
+        last_row = np.zeros((ypt + 1, 3), dtype=profile.dtype)
+        last_row[0] = [col[-1] for col in cols]
+        for j in range(1, ypt + 1):
+            cols, ptrs = fill_column(cols, profile[ocr_codes[j - 1]], gaps, j, semiglobal=semiglobal)
+            last_row[j] = [col[-1] for col in cols]
+        ypt, mpt = best_end(last_row) if semiglobal else (ypt, int(ptrs[xpt]) & 3)
+
+        # trailing ocr characters skipped by a semi-global alignment
+        moves = [2] * (len(ocr) - ypt)
+        if ypt > 0:
+            trace_moves, (xpt, ypt, mpt) = trace_linear_memory(start_cols, profile, ocr_codes,
+                gaps, 0, ypt, xpt, mpt, semiglobal=semiglobal)
+            moves += trace_moves
+    elif xpt > 0 and ypt > 0:
+        ptr_mat, _, last_row = fill_ptr_block(start_cols, profile, ocr_codes, gaps, 0, ypt,
+            semiglobal)
+        ypt, mpt = best_end(last_row) if semiglobal else (ypt, int(ptr_mat[xpt, ypt - 1]) & 3)
+
+        moves = [2] * (len(ocr) - ypt)
+        trace_moves, (xpt, ypt, mpt) = trace_ptrs(ptr_mat, xpt, ypt, mpt, col_offset=1)
+        moves += trace_moves
 
-    # start it off. we are forcibly aligning the final characters. this is not ideal.
-    tra_align += transcript[xpt]
-    ocr_align += ocr[ypt]
-    align_record += ['O'] if(transcript[xpt] == ocr[ypt]) else ['~']
+    # we want to have ended on the very top-left cell (xpt == 0, ypt == 0). if this is not so
+    # we need to add the remaining terms from the incomplete sequence.
+    moves += [2] * ypt + [1] * xpt
 
-    # start at bottom-right corner and work way up to top-left
-    while(xpt > 0 and ypt > 0):
+    return moves
 
-        pt_record += str(int(mpt))
 
-        # case if the current cell is reachable from the diagonal
+def perform_batch_alignment(transcript, ocr, scoring_systems):
+    '''
+    aligns @transcript and @ocr once under each of @scoring_systems (see batch_alignment_moves),
+    returning a list holding the (tra_align, ocr_align) of each.
+    '''
+    return [render_alignment(transcript, ocr, moves)
+        for moves in batch_alignment_moves(transcript, ocr, scoring_systems)]
+
+
+def batch_alignment_moves(transcript, ocr, scoring_systems, batch_cells=batch_align_cells):
+    '''
+    aligns @transcript and @ocr once under each of @scoring_systems, which must all be of the
+    [match, mismatch, ...] forms accepted by perform_alignment, and returns a list holding the
+    traceback moves of each; these are the same as alignment_moves would give. the match
+    indicator of the two sequences is computed only once, and the matrices of as many scoring
+    systems as fit in @batch_cells pointer cells (and in batch_align_width cells per column) are
+    filled together along a leading parameter axis, sharing every per-column step.
+    '''
+    parsed = [parse_scoring_system(x) for x in scoring_systems]
+    if any(callable(method) for method, _ in parsed):
+        raise ValueError('batched alignment requires match / mismatch scoring systems')
+
+    # row k of the indicator holds whether each transcript element is alphabet[k]
+    _, identity, transcript_codes, ocr_codes = compile_scoring_system(transcript, ocr, (1, 0))
+    indicator = identity.T[:, transcript_codes].astype(bool)
+
+    num_rows = len(transcript) + 1
+    num_cols = len(ocr) + 1
+    params = np.array([list(method) + list(gaps) for method, gaps in parsed]).reshape(-1, 6)
+    dtype = compact_dtype(params, num_rows + num_cols)
+    params = params.astype(dtype)
+    chunk_size = max(1, min(batch_cells // (num_rows * num_cols), batch_align_width // num_rows))
+
+    results = []
+    for c in range(0, len(params), chunk_size):
+        chunk = params[c:c + chunk_size]
+        match, mismatch = chunk[:, 0:1], chunk[:, 1:2]
+        gaps = tuple(chunk[:, k:k + 1] for k in range(2, 6))
+
+        # pointers are stored column-major so that each column of the sweep is one contiguous write
+        ptr_cols = np.zeros((num_cols - 1, len(chunk), num_rows), dtype='uint8')
+        cols = tuple(np.tile(col, (len(chunk), 1)) for col in initial_column(num_rows, dtype))
+        for j in range(1, num_cols):
+            score_col = np.where(indicator[ocr_codes[j - 1]], match, mismatch)
+            cols, ptr_cols[j - 1] = fill_column(cols, score_col, gaps, j)
+
+        for p in range(len(chunk)):
+            ptr_mat = ptr_cols[:, p, :].T
+            xpt = num_rows - 1
+            ypt = num_cols - 1
+            moves = []
+            if xpt > 0 and ypt > 0:
+                moves, (xpt, ypt, _) = trace_ptrs(ptr_mat, xpt, ypt, int(ptr_mat[xpt, ypt - 1]) & 3,
+                    col_offset=1)
+            moves += [2] * ypt + [1] * xpt
+            results.append(moves)
+
+    return results
+
+
+class IncrementalAligner(object):
+    '''
+    aligns @transcript against an ocr that arrives a piece at a time (e.g. one text line at a time,
+    as each line strip finishes recognition), so that aligning the lines already read overlaps
+    with the ocr of the ones that follow. only the score columns at the end of the ocr read so far
+    are kept between calls to extend(), along with the pointers of every column. once all of the
+    ocr has been given, alignment() is the same as perform_alignment(transcript, ocr, ...).
+
+    scores are kept as float64, since the length of the ocr (and so whether int32 scores could
+    overflow) is not known in advance.
+    '''
+
+    def __init__(self, transcript, scoring_system=None, semiglobal=False):
+        self.transcript = list(transcript)
+        self.ocr = []
+        self.semiglobal = semiglobal
+
+        self.scoring_method, self.gaps = parse_scoring_system(scoring_system)
+        self.alphabet, _, self.transcript_codes, _ = compile_scoring_system(self.transcript, [],
+            (1, 0))
+        self.score_cols = {}
+
+        num_rows = len(self.transcript) + 1
+        self.cols = initial_column(num_rows)
+        self.ptr_mat = np.zeros((num_rows, 0), dtype='uint8')
+        self.last_row = [[col[-1] for col in self.cols]]
+
+    def score_col(self, char):
+        '''
+        returns the match scores of every transcript element against the ocr character @char.
+        '''
+        if char not in self.score_cols:
+            if callable(self.scoring_method):
+                scores = np.array([self.scoring_method(a, char) for a in self.alphabet],
+                    dtype='float64')
+            else:
+                match, mismatch = self.scoring_method
+                scores = np.array([match if a == char else mismatch for a in self.alphabet],
+                    dtype='float64')
+            self.score_cols[char] = scores[self.transcript_codes]
+        return self.score_cols[char]
+
+    def extend(self, ocr_chars):
+        '''
+        appends @ocr_chars to the ocr and fills the columns of the alignment matrices that they add.
+        '''
+        ocr_chars = list(ocr_chars)
+        start = len(self.ocr)
+        self.ocr += ocr_chars
+
+        # grow the pointer matrix by at least doubling, so that appending a line at a time stays
+        # linear in the length of the ocr
+        if len(self.ocr) > self.ptr_mat.shape[1]:
+            grown = np.zeros((self.ptr_mat.shape[0], max(len(self.ocr), 2 * self.ptr_mat.shape[1])),
+                dtype='uint8')
+            grown[:, :start] = self.ptr_mat[:, :start]
+            self.ptr_mat = grown
+
+        for j, char in enumerate(ocr_chars, start + 1):
+            self.cols, self.ptr_mat[:, j - 1] = fill_column(self.cols, self.score_col(char),
+                self.gaps, j, semiglobal=self.semiglobal)
+            self.last_row.append([col[-1] for col in self.cols])
+
+    def trace(self, xpt, ypt, mpt):
+        '''
+        returns the moves of the traceback from cell (@xpt, @ypt) in matrix @mpt to the top-left.
+        '''
+        moves = []
+        if xpt > 0 and ypt > 0:
+            moves, (xpt, ypt, _) = trace_ptrs(self.ptr_mat, xpt, ypt, mpt, col_offset=1)
+        return moves + [2] * ypt + [1] * xpt
+
+    def moves(self):
+        '''
+        returns the moves of the traceback of the whole transcript against the ocr read so far, as
+        alignment_moves(transcript, ocr, ...) does.
+        '''
+        xpt = len(self.transcript)
+        ypt = len(self.ocr)
+        if self.semiglobal:
+            ypt, mpt = best_end(np.array(self.last_row))
+        else:
+            mpt = int(self.ptr_mat[xpt, ypt - 1]) & 3 if ypt > 0 else 0
+
+        return [2] * (len(self.ocr) - ypt) + self.trace(xpt, ypt, mpt)
+
+    def alignment(self, verbose=False):
+        '''
+        returns the (tra_align, ocr_align) of the whole transcript against the ocr read so far.
+        '''
+        return render_alignment(self.transcript, self.ocr, self.moves(), verbose)
+
+    def provisional_alignment(self):
+        '''
+        returns the (tra_align, ocr_align) of the ocr read so far against the part of the transcript
+        it most likely covers: the traceback starts from the best-scoring cell of the last column,
+        so that the transcript after it is left out rather than forced into gaps. this is meant
+        for showing partial results while the rest of the page is still being read.
+        '''
+        xpt, mpt = np.unravel_index(np.argmax(np.stack(self.cols, axis=1)), (len(self.cols[0]), 3))
+        xpt, mpt = int(xpt), int(mpt)
+        moves = self.trace(xpt, len(self.ocr), mpt)
+        return render_alignment(self.transcript[:xpt], self.ocr, moves)
+
+
+def render_alignment(transcript, ocr, moves, verbose=False):
+    '''
+    turns the @moves of a traceback from the bottom-right corner (0 = diagonal, 1 = x gap,
+    2 = y gap) into the aligned sequences (tra_align, ocr_align), with '_' marking gaps.
+    '''
+    tra_align = []
+    ocr_align = []
+    align_record = []
+    xpt = len(transcript)
+    ypt = len(ocr)
+
+    for mpt in moves:
         if mpt == 0:
             tra_align.append(transcript[xpt - 1])
             ocr_align.append(ocr[ypt - 1])
-            added_text = transcript[xpt - 1] + ' ' + ocr[ypt - 1]
 
             # determine if this diagonal step was a match or a mismatch
             align_record.append('O' if(transcript[xpt - 1] == ocr[ypt - 1]) else '~')
-
-            mpt = mat_ptr[xpt][ypt]
             xpt -= 1
             ypt -= 1
-
-        # case if current cell is reachable horizontally
         elif mpt == 1:
             tra_align.append(transcript[xpt - 1])
             ocr_align.append('_')
-            added_text = transcript[xpt - 1] + ' _'
-
             align_record.append(' ')
-            mpt = x_mat_ptr[xpt][ypt]
             xpt -= 1
-
-        # case if current cell is reachable vertically
         elif mpt == 2:
             tra_align.append('_')
             ocr_align.append(ocr[ypt - 1])
-            added_text = '_ ' + ocr[ypt - 1]
-
             align_record.append(' ')
-            mpt = y_mat_ptr[xpt][ypt]
             ypt -= 1
 
-        # for debugging
-        # print('mpt: {} xpt: {} ypt: {} added_text: [{}]'.format(mpt, xpt, ypt, added_text))
-
-    # we want to have ended on the very top-left cell (xpt == 0, ypt == 0). if this is not so
-    # we need to add the remaining terms from the incomplete sequence.
-
-    # print(xpt, ypt)
-    while ypt > 0:
-        tra_align.append('_')
-        ocr_align.append(ocr[ypt - 1])
-        align_record.append(' ')
-        ypt -= 1
-
-    while xpt > 0:
-        ocr_align.append('_')
-        tra_align.append(transcript[xpt - 1])
-        align_record.append(' ')
-        xpt -= 1
-
     # reverse all records, since we obtained them by traversing the matrices from the bottom-right
-    tra_align = tra_align[-1:0:-1]
-    ocr_align = ocr_align[-1:0:-1]
-    align_record = align_record[-1:0:-1]
-    pt_record = pt_record[-1:0:-1]
+    tra_align = tra_align[::-1]
+    ocr_align = ocr_align[::-1]
+    align_record = align_record[::-1]
 
     if verbose:
         for n in range(len(tra_align)):
@@ -177,6 +871,123 @@ def perform_alignment(transcript, ocr, scoring_system=None, verbose=False):
     return(tra_align, ocr_align)
 
 
+def index_maps(moves):
+    '''
+    turns the @moves of a traceback (see render_alignment) into the index maps of the alignment:
+    (tra_inds, ocr_inds), arrays holding for each column of the alignment, from first to last, the
+    index of the transcript (or ocr) element in that column, or -1 where that sequence has a gap.
+    '''
+    moves = np.asarray(moves, dtype='uint8')[::-1]
+    tra_step = moves != 2
+    ocr_step = moves != 1
+    tra_inds = np.where(tra_step, np.cumsum(tra_step) - 1, -1)
+    ocr_inds = np.where(ocr_step, np.cumsum(ocr_step) - 1, -1)
+    return tra_inds, ocr_inds
+
+
+def find_anchors(transcript, ocr, k=anchor_kmer):
+    '''
+    finds k-mers that occur exactly once in both @transcript and @ocr and chains them into the
+    longest set of anchors that is increasing in both sequences (a longest increasing subsequence
+    of ocr positions, ordered by transcript position). overlapping anchors on the same diagonal
+    are merged. returns a list of (transcript_start, ocr_start, length) exact matches, in order.
+    '''
+    def unique_kmers(seq):
+        counts = {}
+        for i in range(len(seq) - k + 1):
+            kmer = tuple(seq[i:i + k])
+            counts[kmer] = -1 if kmer in counts else i
+        return {kmer: i for kmer, i in counts.items() if i >= 0}
+
+    tra_kmers = unique_kmers(transcript)
+    ocr_kmers = unique_kmers(ocr)
+    pairs = sorted((i, ocr_kmers[kmer]) for kmer, i in tra_kmers.items() if kmer in ocr_kmers)
+
+    # longest strictly increasing subsequence of ocr positions, with back-pointers
+    tails = []
+    tail_inds = []
+    prev = [-1] * len(pairs)
+    for n, (_, o) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, o)
+        if pos == len(tails):
+            tails.append(o)
+            tail_inds.append(n)
+        else:
+            tails[pos] = o
+            tail_inds[pos] = n
+        prev[n] = tail_inds[pos - 1] if pos > 0 else -1
+
+    chain = []
+    n = tail_inds[-1] if tail_inds else -1
+    while n != -1:
+        chain.append(pairs[n])
+        n = prev[n]
+    chain.reverse()
+
+    # merge anchors along the same diagonal and trim the ones that overlap their predecessor
+    anchors = []
+    for t, o in chain:
+        if anchors:
+            prev_t, prev_o, length = anchors[-1]
+            if t - prev_t == o - prev_o and t <= prev_t + length:
+                anchors[-1] = (prev_t, prev_o, t + k - prev_t)
+                continue
+            overlap = max(prev_t + length - t, prev_o + length - o, 0)
+            if overlap >= k:
+                continue
+            t, o = t + overlap, o + overlap
+            anchors.append((t, o, k - overlap))
+        else:
+            anchors.append((t, o, k))
+
+    return anchors
+
+
+def perform_anchored_alignment(transcript, ocr, scoring_system=None, k=anchor_kmer, verbose=False,
+        **kwargs):
+    '''
+    aligns @transcript to @ocr as perform_alignment does, but seeded from exact matches (see
+    anchored_alignment_moves). returns (tra_align, ocr_align) like perform_alignment does, but
+    does not guarantee the same (optimal) alignment.
+    '''
+    moves = anchored_alignment_moves(transcript, ocr, scoring_system, k, **kwargs)
+    return render_alignment(transcript, ocr, moves, verbose)
+
+
+def anchored_alignment_moves(transcript, ocr, scoring_system=None, k=anchor_kmer, **kwargs):
+    '''
+    seed-and-extend alternative to alignment_moves for long sequences. the alignment is forced
+    through the middle of each exact match found by find_anchors, and the affine-gap alignment is
+    only run on the pieces of the two sequences between consecutive cuts. since the OCR is correct
+    most of the time, this is close to linear in the length of the page. remaining keyword
+    arguments are passed on to alignment_moves. returns the moves of the traceback, from last to
+    first, as alignment_moves does.
+
+    gaps along the top and left of the alignment matrices cost less than gaps opened anywhere else,
+    so a piece whose alignment starts with a gap would be scored as if the gap began the page. the
+    cut before such a piece is dropped, and the piece is aligned together with the one before it.
+    '''
+    cuts = [(t + length // 2, o + length // 2) for t, o, length in find_anchors(transcript, ocr, k)]
+
+    def piece_moves(start, end):
+        (t0, o0), (t1, o1) = start, end
+        if t1 > t0 and o1 > o0:
+            return alignment_moves(transcript[t0:t1], ocr[o0:o1], scoring_system, **kwargs)
+        return [2] * (o1 - o0) + [1] * (t1 - t0)
+
+    pieces = []
+    start = (0, 0)
+    for end in cuts + [(len(transcript), len(ocr))]:
+        moves = piece_moves(start, end)
+        while pieces and moves and moves[-1] != 0:
+            start, _ = pieces.pop()
+            moves = piece_moves(start, end)
+        pieces.append((start, moves))
+        start = end
+
+    return [move for _, moves in reversed(pieces) for move in moves]
+
+
 if __name__ == '__main__':
 
     seq1 = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit '